@@ -1,22 +1,44 @@
+import time
+
+# Startup phases are timed from the first import
+import_started_at = time.perf_counter()
+
 import os
+import hmac
 
 import uvicorn
-import base64
+import asyncio
+
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, APIRouter, Depends, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, Response
 
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError, field_validator, model_validator
 
-from io import BytesIO
-from PIL import Image
 from datetime import datetime
-from typing import List
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from typing import List, Literal
 
-from source.core import HumanDetector
-from source.modules.database import HumanDetectorDatabase, Predictions
-from source.utils.image import BBoxDrawer, save_b64image, strip_mime_prefix
+from source.core import MODEL_STRIDE
+from source.modules.database import HumanDetectorDatabase, Predictions, decode_cursor, detection_records, parse_region
+from source.modules.async_database import AsyncHumanDetectorDatabase
+from source.modules.batching import ImageDecodeError
+from source.modules.executor import BoundedExecutor, ExecutorQueueFullError
+from source.modules.inference_cache import InferenceCache
+from source.modules.media_storage import MediaStorage
+from source.modules.media_writer import MediaWriter, MediaWriterQueueFullError
+from source.modules.model_registry import ModelRegistry
+from source.modules.record_buffer import RecordBuffer
+from source.modules.retention import RetentionWorker
+from source.modules.startup import StartupTracker
+from source.modules.stats_cache import StatsCache
+from source.utils.accept import accept_quality, parse_accept
+from source.utils.image import BBoxDrawer, DecodedImage, save_decoded_image, strip_mime_prefix
 
 from configs.general import env_config, paths_config
     
@@ -30,25 +52,185 @@ def setup_folders():
 
 # Setup database
 database = HumanDetectorDatabase(
-    database_url = env_config.database_url
+    database_url = env_config.database_url,
+    pool_size = env_config.database_pool_size,
+    max_overflow = env_config.database_max_overflow,
+    pool_timeout = env_config.database_pool_timeout,
+    pool_recycle = env_config.database_pool_recycle
 )
 
-database.create_tables()
+# Queries awaited from request handlers, without blocking the event loop
+async_database = AsyncHumanDetectorDatabase(
+    database_url = env_config.database_url,
+    pool_size = env_config.database_pool_size,
+    max_overflow = env_config.database_max_overflow,
+    pool_timeout = env_config.database_pool_timeout,
+    pool_recycle = env_config.database_pool_recycle
+)
+
+# Predictions rows from concurrent requests are committed together
+record_buffer = RecordBuffer(
+    database = database,
+    max_records = env_config.record_buffer_max_records,
+    max_wait_ms = env_config.record_buffer_max_wait_ms,
+    max_retries = env_config.record_buffer_max_retries,
+    retry_backoff_ms = env_config.record_buffer_retry_backoff_ms
+) if env_config.record_buffer_max_records > 0 else None
 
-# Init model
-detector = HumanDetector()
+bbox_drawer = BBoxDrawer()
+
+# Inference, drawing and saving run here, off the event loop
+inference_executor = BoundedExecutor(
+    executor_type = env_config.inference_executor,
+    max_workers = env_config.inference_max_workers,
+    max_queue_size = env_config.inference_max_queue_size
+)
+
+# Re-submitted frames are answered without running the model
+inference_cache = InferenceCache(
+    max_bytes = env_config.inference_cache_max_bytes,
+    ttl_seconds = env_config.inference_cache_ttl,
+    min_confidence_threshold = env_config.inference_cache_min_confidence
+) if env_config.inference_cache_max_bytes > 0 else None
+
+# Loaded models, each with its own batcher, so that concurrent requests share one forward pass
+model_registry = ModelRegistry(
+    executor = inference_executor,
+    max_batch_size = env_config.batch_max_size,
+    max_wait_ms = env_config.batch_max_wait_ms,
+    cache = inference_cache,
+    
+    detector_options = {
+        'fast_max_image_size': env_config.inference_fast_max_image_size,
+        'tile_min_size': env_config.inference_tile_min_size,
+        'tile_overlap': env_config.inference_tile_overlap,
+        'tile_iou_threshold': env_config.inference_tile_iou_threshold
+    },
+    
+    warm_up_iterations = env_config.model_warm_up_iterations
+)
 
-detector.load_model(
-    model_file = os.path.join(
-        paths_config.models_folder,
-        'finetuned',
-        env_config.model_filename
+def load_model(model_filename, runtime = None, int8 = None, image_size = None):
+    return model_registry.load(
+        model_file = os.path.join(
+            paths_config.models_folder,
+            'finetuned',
+            model_filename
+        ),
+        
+        runtime = runtime or env_config.model_runtime,
+        int8 = env_config.model_int8 if int8 is None else int8,
+        
+        calibration_data_file = os.path.join(
+            paths_config.datasets_folder,
+            env_config.model_calibration_dataset,
+            'data.yaml'
+        ) if env_config.model_calibration_dataset else None,
+        
+        image_size = image_size or env_config.model_image_size
     )
+
+# MODEL_FILENAME first, so that it is the active one
+startup_model_filenames = [env_config.model_filename] + [
+    model_filename for model_filename in env_config.model_preload_filenames
+    if model_filename != env_config.model_filename
+]
+
+media_storage = MediaStorage(
+    root_folder = paths_config.media_storage_folder
 )
 
-bbox_drawer = BBoxDrawer()
+# Query and result images, and their Predictions rows, are written in the background
+media_writer = MediaWriter(
+    num_threads = env_config.media_writer_threads,
+    max_queue_size = env_config.media_writer_max_queue_size,
+    put_timeout = env_config.media_writer_put_timeout
+)
+
+# Closed buckets of /history/stats series are served from memory
+stats_cache = StatsCache(
+    max_entries = env_config.stats_cache_max_entries,
+    ttl_seconds = env_config.stats_cache_ttl,
+    grace_seconds = env_config.stats_cache_grace,
+    
+    # Results replaced by scripts/reprocess_media.py, which runs in its own process
+    fetch_changes = async_database.get_replaced_results
+)
+
+# Expires old predictions and their media in the background
+retention_worker = RetentionWorker(
+    database = database,
+    media_storage = media_storage,
+    retention_days = env_config.retention_days,
+    batch_size = env_config.retention_batch_size,
+    interval_seconds = env_config.retention_interval
+) if env_config.retention_days > 0 else None
+
+# Tables and models are set up by the lifespan, not on import
+startup = StartupTracker(
+    phases = ['import', 'database'] + [f'model:{model_filename}' for model_filename in startup_model_filenames],
+    started_at = import_started_at
+)
+
+async def initialize_database():
+    with startup.phase('database'):
+        await asyncio.to_thread(database.create_tables)
+
+async def initialize_model(model_filename):
+    # Loading imports ultralytics and torch, on a worker thread
+    with startup.phase(f'model:{model_filename}'):
+        return await asyncio.to_thread(load_model, model_filename)
+
+async def initialize():
+    # Database and models in parallel
+    results = await asyncio.gather(
+        initialize_database(),
+        *[initialize_model(model_filename) for model_filename in startup_model_filenames],
+        return_exceptions = True
+    )
+    
+    # Failures are reported by the health endpoints
+    if startup.failed:
+        return
+    
+    for loaded_model in results[1:]:
+        model_registry.add(loaded_model)
+    
+    if retention_worker is not None:
+        retention_worker.start()
+    
+    startup.mark_ready()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Writers first, as requests may be served as soon as a model is ready
+    media_writer.start()
+    
+    if record_buffer is not None:
+        record_buffer.start()
+    
+    # Live right away, ready once the database is set up and the models are warm
+    initialize_task = asyncio.create_task(initialize())
+    
+    yield
+    
+    await initialize_task
+    
+    if retention_worker is not None:
+        await asyncio.to_thread(retention_worker.stop)
+    
+    inference_executor.shutdown()
+    
+    # Drain pending writes so that every row has its files
+    await asyncio.to_thread(media_writer.close)
+    
+    # Then commit the rows they handed over
+    if record_buffer is not None:
+        await asyncio.to_thread(record_buffer.close)
+    
+    await async_database.dispose()
 
-app = FastAPI()
+app = FastAPI(lifespan = lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,115 +244,689 @@ app.add_middleware(
 async def root():
     return {"message": "Hello World"}
 
-router = APIRouter(prefix = "/api/v1")
+def verify_ready():
+    if not startup.ready:
+        raise HTTPException(
+            503,
+            detail = "Startup failed." if startup.failed else "Server is starting. Try again later.",
+            headers = {
+                'Retry-After': str(env_config.inference_retry_after)
+            }
+        )
+
+# Health and metrics answer during startup; the rest waits for it
+health_router = APIRouter(prefix = "/api/v1")
+router = APIRouter(prefix = "/api/v1", dependencies = [Depends(verify_ready)])
+
+@health_router.get("/health/live")
+async def get_liveness():
+    # Restarting is the only way out of a failed startup
+    if startup.failed:
+        return JSONResponse(status_code = 503, content = {'status': 'failed'})
+    
+    return {'status': 'ok'}
+
+@health_router.get("/health/ready")
+async def get_readiness():
+    return JSONResponse(
+        status_code = 200 if startup.ready else 503,
+        content = {
+            **startup.stats(),
+            'models': [loaded_model.info() for loaded_model in model_registry.models()]
+        }
+    )
+
+def validate_decoded_image(decoded_image, source_name = "base64 image"):
+    try:
+        pilimage_size = decoded_image.size[0] * decoded_image.size[1]
+        format = decoded_image.format
+        
+    except Exception:
+        raise ValueError(f"Invalid {source_name} data.")
+    
+    if pilimage_size < env_config.min_image_size:
+        raise ValueError("Image too small.")
+    
+    if pilimage_size > env_config.max_image_size:
+        raise ValueError("Image too large.")
+    
+    if format not in ['PNG', 'JPEG', 'JPG']:
+        raise ValueError(f"Not supported image format: {format}")
+    
+    # Only the header is read here; pixels are decoded by `load_decoded_image` on the worker pool
+    return decoded_image
+
+def load_decoded_image(decoded_image, source_name = "base64 image"):
+    # Returns nothing, so that process workers send no pixels back
+    try:
+        decoded_image.load()
+        
+    except Exception:
+        raise ValueError(f"Invalid {source_name} data.")
+
+def decode_batch_images(b64images, load_pixels = True):
+    # One worker job for a whole batch request; a decoded image or an error message per item
+    results = []
+    
+    for b64image in b64images:
+        try:
+            decoded_image = validate_decoded_image(DecodedImage.from_b64image(b64image))
+            
+            if load_pixels:
+                load_decoded_image(decoded_image)
+            
+            results.append((decoded_image, None))
+            
+        except ValueError as error:
+            results.append((None, str(error)))
+    
+    return results
 
 class PredictRequest(BaseModel):
     b64image: str
     confidence_threshold: float = Field(ge = 0.0, le = 1.0)
+    
+    _decoded_image: DecodedImage = PrivateAttr()
 
     @field_validator("b64image")
     @classmethod
     def validate_b64image(cls, b64image):
-        b64image = strip_mime_prefix(b64image)
+        return strip_mime_prefix(b64image)
     
-        try:
-            image_data = base64.b64decode(b64image)
-            
-            image_buffer = BytesIO(image_data)
-            
-            pilimage = Image.open(image_buffer)
-            
-            pilimage.verify()
-            
-        except Exception:
-            raise ValueError("Invalid base64 image data.")
-        
-        pilimage_size = pilimage.size[0] * pilimage.size[1]
-        
-        if pilimage_size < env_config.min_image_size:
-            raise ValueError("Image too small.")
+    @model_validator(mode = "after")
+    def decode_b64image(self):
+        self._decoded_image = validate_decoded_image(
+            DecodedImage.from_b64image(self.b64image)
+        )
         
-        if pilimage_size > env_config.max_image_size:
-            raise ValueError("Image too large.")
-        
-        format = pilimage.format
-        if format not in ['PNG', 'JPEG', 'JPG']:
-            raise ValueError(f"Not supported image format: {format}")
-            
-        return b64image
+        return self
+    
+    @property
+    def decoded_image(self):
+        return self._decoded_image
         
 class PredictResponse(BaseModel):
     b64image: str
     num_humans: int
+
+class Detection(BaseModel):
+    xyxy: List[float]
+    xywh: List[float]
+    confidence: float
+    class_id: int
+    label: str
+
+class PredictBoxesResponse(BaseModel):
+    num_humans: int
     
-@router.post("/predict")
-async def predict(request: PredictRequest) -> PredictResponse:
-    current_time = datetime.now()
-    current_time_str = current_time.strftime("%Y-%m-%d_%H-%M-%S")
-            
-    query_image_file = os.path.join(
-        paths_config.media_storage_folder,
-        'queries',
-        f'{current_time_str}.png'
+    image_width: int
+    image_height: int
+    
+    detections: List[Detection]
+    inference_time_ms: float
+
+def to_response_detections(detections):
+    return [
+        Detection(
+            xyxy = xyxy,
+            xywh = xywh,
+            confidence = confidence,
+            class_id = int(class_id),
+            label = 'human'
+        )
+        for xyxy, xywh, confidence, class_id in zip(
+            detections.xyxys, detections.xywhs, detections.confidences, detections.classes
+        )
+    ]
+
+# Media types that select a response format when no response_format is given
+BOXES_MEDIA_TYPE = 'application/vnd.human-detection.boxes+json'
+
+# Result images keep the format of the query
+IMAGE_MEDIA_TYPES = ['image/jpeg', 'image/png']
+
+def negotiate_response_format(response_format, accept):
+    if response_format is not None:
+        return response_format
+    
+    media_ranges = parse_accept(accept)
+    image_ranges = [(media_range, quality) for media_range, quality in media_ranges if media_range.startswith('image/')]
+    
+    # Boxes and images only when asked for by type (image/* included), not through */*
+    qualities = {
+        'boxes': accept_quality(media_ranges, BOXES_MEDIA_TYPE, wildcards = False),
+        'b64image': accept_quality(media_ranges, 'application/json'),
+        'image': max(accept_quality(image_ranges, media_type) for media_type in IMAGE_MEDIA_TYPES)
+    }
+    
+    # JSON unless another format has a higher q; the boxes type wins a tie, being the most specific
+    response_format = max(['boxes', 'b64image', 'image'], key = lambda name: qualities[name])
+    
+    return response_format if qualities[response_format] > 0 else 'b64image'
+
+class PredictThreshold(BaseModel):
+    confidence_threshold: float = Field(ge = 0.0, le = 1.0)
+
+def body_validation_error(error):
+    return RequestValidationError(
+        [
+            {**detail, 'loc': ('body', *detail['loc'])} 
+            for detail in error.errors()
+        ]
     )
+
+async def read_upload_body(stream):
+    image_data = bytearray()
     
-    result_image_file = os.path.join(
-        paths_config.media_storage_folder,
-        'results',
-        f'{current_time_str}.png'
+    async for chunk in stream:
+        image_data.extend(chunk)
+        
+        if len(image_data) > env_config.max_upload_bytes:
+            raise HTTPException(413, detail = "Uploaded image too large.")
+    
+    return bytes(image_data)
+
+def decode_uploaded_image(image_data, confidence_threshold):
+    errors = []
+    
+    try:
+        decoded_image = validate_decoded_image(
+            DecodedImage.from_image_data(image_data),
+            source_name = "image"
+        )
+        
+    except ValueError as error:
+        errors.append({'type': 'value_error', 'loc': ['body', 'image'], 'msg': str(error)})
+        
+    if confidence_threshold is None:
+        errors.append({'type': 'missing', 'loc': ['query', 'confidence_threshold'], 'msg': "Field required"})
+    
+    if errors:
+        raise RequestValidationError(errors)
+    
+    return decoded_image, confidence_threshold
+
+def preload_pixels():
+    # Process workers send no pixels back, so a separate decode there would be repeated by the batch job
+    return inference_executor.executor_type == 'thread'
+
+def invalid_image_error(field, message = None):
+    source_name = "image" if field == 'image' else "base64 image"
+    
+    return RequestValidationError(
+        [{'type': 'value_error', 'loc': ['body', field], 'msg': message or f"Invalid {source_name} data."}]
     )
+
+async def load_request_image(decoded_image, field):
+    # Full pixel decode on the worker pool; truncated or corrupt pixels surface here, before the image joins a batch.
+    # With process workers, the batch job decodes the pixels and reports a corrupt image instead
+    if not preload_pixels():
+        return decoded_image
+    
+    try:
+        await inference_executor.run(
+            load_decoded_image,
+            decoded_image,
+            source_name = "image" if field == 'image' else "base64 image"
+        )
         
-    predictions = detector.predict_b64image(
-        b64image = request.b64image,
-        confidence_threshold = request.confidence_threshold
+    except ValueError as error:
+        raise invalid_image_error(field, str(error))
+    
+    except ExecutorQueueFullError:
+        raise server_busy_error()
+    
+    return decoded_image
+
+async def parse_predict_request(request, confidence_threshold):
+    content_type = request.headers.get('content-type', '')
+    
+    # Binary uploads skip JSON parsing and base64 decoding entirely
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        
+        upload = form.get('image')
+        if upload is None or isinstance(upload, str):
+            raise RequestValidationError(
+                [{'type': 'missing', 'loc': ['body', 'image'], 'msg': "Field required"}]
+            )
+        
+        if 'confidence_threshold' in form:
+            try:
+                confidence_threshold = PredictThreshold(
+                    confidence_threshold = form.get('confidence_threshold')
+                ).confidence_threshold
+                
+            except ValidationError as error:
+                raise body_validation_error(error)
+        
+        if upload.size is not None and upload.size > env_config.max_upload_bytes:
+            raise HTTPException(413, detail = "Uploaded image too large.")
+        
+        decoded_image, confidence_threshold = decode_uploaded_image(
+            image_data = await upload.read(),
+            confidence_threshold = confidence_threshold
+        )
+        
+        return await load_request_image(decoded_image, 'image'), confidence_threshold, 'image'
+    
+    if content_type.startswith('application/octet-stream') or content_type.startswith('image/'):
+        decoded_image, confidence_threshold = decode_uploaded_image(
+            image_data = await read_upload_body(request.stream()),
+            confidence_threshold = confidence_threshold
+        )
+        
+        return await load_request_image(decoded_image, 'image'), confidence_threshold, 'image'
+    
+    try:
+        predict_request = PredictRequest.model_validate_json(await request.body())
+        
+    except ValidationError as error:
+        raise body_validation_error(error)
+    
+    decoded_image = await load_request_image(predict_request.decoded_image, 'b64image')
+    
+    return decoded_image, predict_request.confidence_threshold, 'b64image'
+
+PREDICT_OPENAPI_EXTRA = {
+    'requestBody': {
+        'required': True,
+        'content': {
+            'application/json': {
+                'schema': PredictRequest.model_json_schema()
+            },
+            'multipart/form-data': {
+                'schema': {
+                    'type': 'object',
+                    'required': ['image'],
+                    'properties': {
+                        'image': {'type': 'string', 'format': 'binary'},
+                        'confidence_threshold': {'type': 'number', 'minimum': 0.0, 'maximum': 1.0}
+                    }
+                }
+            },
+            'application/octet-stream': {
+                'schema': {'type': 'string', 'format': 'binary'}
+            }
+        }
+    }
+}
+
+def get_loaded_model(model_version):
+    # The active model when none is asked for
+    try:
+        return model_registry.get(model_version)
+    
+    except KeyError:
+        raise HTTPException(404, detail = f"Model {model_version} is not loaded.")
+
+def server_busy_error():
+    return HTTPException(
+        503,
+        detail = "Server is busy. Try again later.",
+        headers = {
+            'Retry-After': str(env_config.inference_retry_after)
+        }
+    )
+
+def media_writer_busy_error():
+    return HTTPException(
+        503,
+        detail = "Media storage is busy. Try again later.",
+        headers = {
+            'Retry-After': str(env_config.inference_retry_after)
+        }
+    )
+
+def render_prediction(decoded_image, detections):
+    drawn_image = bbox_drawer.draw_bboxes_on_decoded_image(
+        decoded_image = decoded_image,
+        xywhs = detections.xywhs,
+        labels = ['human' for _ in range(len(detections))],
+        confidences = detections.confidences,
+        colors = ['red' for _ in range(len(detections))],
+        line_width = 2,
+        format = env_config.result_image_format,
+        quality = env_config.result_image_quality,
+        compress_level = env_config.result_image_compress_level
     )
     
-    prediction = predictions[0]
+    # Encode on the worker rather than on the event loop
+    _ = drawn_image.image_data
     
-    xywhs = prediction.boxes.xywh.tolist()
-    classes = prediction.boxes.cls.tolist()
-    confidences = prediction.boxes.conf.tolist()
+    return drawn_image
+
+def restore_released_files(prediction_records, decoded_images, drawn_images):
+    # A concurrent cleanup may have removed a shared file before the commit; after it, cleanups see the new rows
+    with media_storage.lock:
+        for prediction_record, decoded_image, drawn_image in zip(
+            prediction_records, decoded_images, drawn_images
+        ):
+            if not os.path.exists(prediction_record.query_image_file):
+                save_decoded_image(decoded_image, prediction_record.query_image_file)
+                
+            if drawn_image is not None and not os.path.exists(prediction_record.result_image_file):
+                save_decoded_image(drawn_image, prediction_record.result_image_file)
+
+def persist_predictions(prediction_records, decoded_images, drawn_images):
+    # Runs on the media writer: rows are only committed once their files exist
+    created_files = []
     
-    num_detected_objects = len(xywhs)
+    try:
+        for prediction_record, decoded_image, drawn_image in zip(
+            prediction_records, decoded_images, drawn_images
+        ):
+            # Content-addressed: identical uploads share one file
+            prediction_record.query_image_file, created = media_storage.store(
+                folder = 'queries',
+                image_data = decoded_image.image_data,
+                extension = decoded_image.extension,
+                file_hash = decoded_image.sha256
+            )
+            
+            if created:
+                created_files.append(prediction_record.query_image_file)
+            
+            if drawn_image is not None:
+                prediction_record.result_image_file, created = media_storage.store(
+                    folder = 'results',
+                    image_data = drawn_image.image_data,
+                    extension = drawn_image.extension,
+                    file_hash = drawn_image.sha256
+                )
+                
+                if created:
+                    created_files.append(prediction_record.result_image_file)
+        
+        if record_buffer is None:
+            database.add_records(prediction_records)
+            
+        else:
+            # Write-behind: the buffer commits these rows together with other requests'
+            def on_flushed(error):
+                if error is not None:
+                    media_storage.remove_released(created_files, database.referenced_media_files)
+                    
+                else:
+                    restore_released_files(prediction_records, decoded_images, drawn_images)
+            
+            record_buffer.add(prediction_records, callback = on_flushed)
+            
+            return
         
-    drawn_b64image = bbox_drawer.draw_bboxes_on_b64image(
-        b64image = request.b64image,
-        xywhs = xywhs,
-        labels = ['human' for _ in range(len(xywhs))],
-        confidences = confidences,
-        colors = ['red' for _ in range(len(xywhs))],
-        line_width = 2
+    except Exception:
+        media_storage.remove_released(created_files, database.referenced_media_files)
+        
+        raise
+    
+    restore_released_files(prediction_records, decoded_images, drawn_images)
+
+def render_and_persist_predictions(prediction_records, decoded_images, batch_detections):
+    drawn_images = [
+        render_prediction(
+            decoded_image = decoded_image,
+            detections = detections
+        )
+        for decoded_image, detections in zip(decoded_images, batch_detections)
+    ]
+    
+    persist_predictions(
+        prediction_records = prediction_records,
+        decoded_images = decoded_images,
+        drawn_images = drawn_images
     )
     
-    save_b64image(
-        b64image = request.b64image,
-        save_file = query_image_file
+@router.post(
+    "/predict", 
+    response_model = PredictResponse | PredictBoxesResponse,
+    openapi_extra = PREDICT_OPENAPI_EXTRA
+)
+async def predict(
+    request: Request,
+    confidence_threshold: float | None = Query(default = None, ge = 0.0, le = 1.0),
+    response_format: Literal['b64image', 'image', 'boxes'] | None = None,
+    image_size: int | None = Query(
+        default = None, 
+        ge = MODEL_STRIDE, 
+        le = env_config.inference_max_image_size, 
+        multiple_of = MODEL_STRIDE
+    ),
+    inference_mode: Literal['standard', 'fast', 'tiled'] | None = None,
+    model_version: str | None = None
+):
+    response_format = negotiate_response_format(
+        response_format = response_format,
+        accept = request.headers.get('accept', '')
     )
     
-    save_b64image(
-        b64image = drawn_b64image, 
-        save_file = result_image_file
+    decoded_image, confidence_threshold, image_field = await parse_predict_request(
+        request = request,
+        confidence_threshold = confidence_threshold
     )
     
+    # Held for the whole request, so that a hot swap does not change it midway
+    loaded_model = get_loaded_model(model_version)
+    
+    current_time = datetime.now()
+    
+    # Boxes are stored down to a lower threshold, so that history can be re-thresholded
+    storage_threshold = min(confidence_threshold, env_config.detections_min_confidence)
+    
+    try:
+        stored_detections = await loaded_model.batcher.submit(
+            decoded_image = decoded_image,
+            confidence_threshold = storage_threshold,
+            image_size = image_size,
+            mode = inference_mode or env_config.inference_mode
+        )
+        
+        detections = stored_detections.filter(confidence_threshold)
+        
+        # Boxes-only responses need no drawing, nor a rendered result image
+        if response_format == 'boxes':
+            drawn_image = None
+            
+        else:
+            drawn_image = await inference_executor.run(
+                render_prediction,
+                decoded_image = decoded_image,
+                detections = detections
+            )
+        
+    except ImageDecodeError:
+        raise invalid_image_error(image_field)
+    
+    except ExecutorQueueFullError:
+        raise server_busy_error()
+    
+    num_detected_objects = len(detections)
+    
     prediction_record = Predictions(
         time = current_time,
-        query_image_file = query_image_file,
-        result_image_file = result_image_file,
-        num_humans = num_detected_objects
+        num_humans = num_detected_objects,
+        image_width = decoded_image.size[0],
+        image_height = decoded_image.size[1],
+        model_version = loaded_model.name,
+        inference_time = detections.inference_time,
+        confidence_threshold = confidence_threshold,
+        detections_min_confidence = storage_threshold,
+        detections = detection_records(stored_detections)
     )
     
-    database.add_record(prediction_record)
+    try:
+        await media_writer.submit(
+            persist_predictions,
+            prediction_records = [prediction_record],
+            decoded_images = [decoded_image],
+            drawn_images = [drawn_image]
+        )
+        
+    except MediaWriterQueueFullError:
+        raise media_writer_busy_error()
+    
+    if response_format == 'image':
+        return Response(
+            content = drawn_image.image_data,
+            media_type = f'image/{drawn_image.format.lower()}',
+            headers = {
+                'X-Num-Humans': str(num_detected_objects)
+            }
+        )
+    
+    if response_format == 'boxes':
+        return PredictBoxesResponse(
+            num_humans = num_detected_objects,
+            image_width = decoded_image.size[0],
+            image_height = decoded_image.size[1],
+            detections = to_response_detections(detections),
+            inference_time_ms = detections.inference_time
+        )
     
     return PredictResponse(
-        b64image = drawn_b64image,
+        b64image = drawn_image.b64image,
         num_humans = num_detected_objects
     )
 
+class PredictBatchRequest(BaseModel):
+    b64images: List[str] = Field(min_length = 1, max_length = env_config.predict_batch_max_images)
+    confidence_threshold: float = Field(ge = 0.0, le = 1.0)
+    
+    image_size: int | None = Field(
+        default = None, 
+        ge = MODEL_STRIDE, 
+        le = env_config.inference_max_image_size, 
+        multiple_of = MODEL_STRIDE
+    )
+    inference_mode: Literal['standard', 'fast', 'tiled'] | None = None
+    
+    model_version: str | None = None
 
-class HistoryRequest(BaseModel):
-    page_index: int = Field(ge = 1, default = 1)
-    page_size: int = Field(ge = 1, default = 10)
+class PredictBatchItem(BaseModel):
+    index: int
+    num_humans: int | None = None
+    
+    detections: List[Detection] = []
+    
+    error: str | None = None
+    
+class PredictBatchResponse(BaseModel):
+    num_succeeded: int
+    num_failed: int
+    
+    items: List[PredictBatchItem]
+
+@router.post("/predict/batch")
+async def predict_batch(request: PredictBatchRequest) -> PredictBatchResponse:
+    current_time = datetime.now()
+    
+    items = [PredictBatchItem(index = index) for index in range(len(request.b64images))]
+    
+    # Invalid images are reported per item instead of failing the whole batch
+    try:
+        batch_results = await inference_executor.run(
+            decode_batch_images, 
+            request.b64images, 
+            load_pixels = preload_pixels()
+        )
+        
+    except ExecutorQueueFullError:
+        raise server_busy_error()
+    
+    valid_indices = []
+    decoded_images = []
+    
+    for index, (decoded_image, error) in enumerate(batch_results):
+        if error is None:
+            valid_indices.append(index)
+            decoded_images.append(decoded_image)
+            
+        else:
+            items[index].error = error
+    
+    storage_threshold = min(request.confidence_threshold, env_config.detections_min_confidence)
+    
+    loaded_model = get_loaded_model(request.model_version)
+    
+    submit_results = await asyncio.gather(
+        *[
+            loaded_model.batcher.submit(
+                decoded_image = decoded_image,
+                confidence_threshold = storage_threshold,
+                image_size = request.image_size,
+                mode = request.inference_mode or env_config.inference_mode
+            )
+            for decoded_image in decoded_images
+        ],
+        return_exceptions = True
+    )
+    
+    for result in submit_results:
+        if isinstance(result, ExecutorQueueFullError):
+            raise server_busy_error()
+        
+        if isinstance(result, BaseException) and not isinstance(result, ImageDecodeError):
+            raise result
+    
+    # With process workers, corrupt pixels are only found by the batch job
+    detected_indices, detected_images, batch_stored_detections = [], [], []
+    
+    for index, decoded_image, result in zip(valid_indices, decoded_images, submit_results):
+        if isinstance(result, ImageDecodeError):
+            items[index].error = "Invalid base64 image data."
+            
+        else:
+            detected_indices.append(index)
+            detected_images.append(decoded_image)
+            batch_stored_detections.append(result)
+    
+    valid_indices, decoded_images = detected_indices, detected_images
+    
+    batch_detections = [
+        stored_detections.filter(request.confidence_threshold) 
+        for stored_detections in batch_stored_detections
+    ]
     
+    prediction_records = []
+    
+    for index, decoded_image, detections, stored_detections in zip(
+        valid_indices, decoded_images, batch_detections, batch_stored_detections
+    ):
+        items[index].num_humans = len(detections)
+        items[index].detections = to_response_detections(detections)
+        
+        prediction_records.append(
+            Predictions(
+                time = current_time,
+                num_humans = len(detections),
+                image_width = decoded_image.size[0],
+                image_height = decoded_image.size[1],
+                model_version = loaded_model.name,
+                inference_time = detections.inference_time,
+                confidence_threshold = request.confidence_threshold,
+                detections_min_confidence = storage_threshold,
+                detections = detection_records(stored_detections)
+            )
+        )
+    
+    # Drawn and stored in the background, with one transaction for the whole batch
+    try:
+        await media_writer.submit(
+            render_and_persist_predictions,
+            prediction_records = prediction_records,
+            decoded_images = decoded_images,
+            batch_detections = batch_detections
+        )
+        
+    except MediaWriterQueueFullError:
+        raise media_writer_busy_error()
+    
+    return PredictBatchResponse(
+        num_succeeded = len(valid_indices),
+        num_failed = len(items) - len(valid_indices),
+        items = items
+    )
+
+class HistoryFilters(BaseModel):
     query_id: str | None = None
     
     time_min: str | None = None
@@ -179,6 +935,29 @@ class HistoryRequest(BaseModel):
     num_humans_min: str | None = None
     num_humans_max: str | None = None
     
+    # Predictions with a stored box at or above this confidence, overlapping this region
+    detection_confidence_min: float | None = Field(default = None, ge = 0.0, le = 1.0)
+    detection_region: str | None = None
+    
+    @field_validator("detection_region")
+    @classmethod
+    def validate_detection_region(cls, detection_region):
+        if detection_region is not None and detection_region != "":
+            try:
+                _ = parse_region(detection_region)
+                
+            except Exception:
+                raise HTTPException(
+                    422, 
+                    detail = [
+                        {
+                            'msg': "Invalid region. Must be x1,y1,x2,y2 in pixels, with x1 < x2 and y1 < y2.",
+                        }
+                    ]
+                )
+                
+        return detection_region
+    
     @field_validator("query_id")
     @classmethod
     def validate_query_id(cls, query_id):
@@ -273,17 +1052,62 @@ class HistoryRequest(BaseModel):
                 )
             
         return num_humans_max
+
+class HistoryRequest(HistoryFilters):
+    page_index: int = Field(ge = 1, default = 1)
+    page_size: int = Field(ge = 1, default = 10)
+    
+    # Keyset pagination: pass the previous page's next_cursor instead of page_index
+    cursor: str | None = None
+    
+    total_mode: Literal['exact', 'estimate', 'none'] = 'exact'
+    
+    @field_validator("cursor")
+    @classmethod
+    def validate_cursor(cls, cursor):
+        if cursor is not None and cursor != "":
+            try:
+                _ = decode_cursor(cursor)
+                
+            except Exception:
+                raise HTTPException(
+                    422, 
+                    detail = [
+                        {
+                            'msg': "Invalid cursor.",
+                        }
+                    ]
+                )
+                
+            return cursor
+        
+        return None
     
+def media_url(file, size = None):
+    relative_path = media_storage.relative_path(file) if file is not None else None
+    
+    if relative_path is None:
+        return None
+    
+    return f'{router.prefix}/media/{quote(relative_path)}' + (f'?size={size}' if size is not None else '')
+
 class HistoryRecord(BaseModel):
     query_id: int
     time: str
     
     query_image_file: str
-    result_image_file: str
+    result_image_file: str | None
     num_humans: int
+    
+    # Served by /api/v1/media; thumbnails in the smallest configured size
+    query_image_url: str | None = None
+    result_image_url: str | None = None
+    query_thumbnail_url: str | None = None
+    result_thumbnail_url: str | None = None
 
 class HistoryResponse(BaseModel):
-    total: int
+    total: int | None
+    next_cursor: str | None = None
     
     records: List[HistoryRecord]
     
@@ -291,18 +1115,23 @@ class HistoryResponse(BaseModel):
 async def get_history(
     request: HistoryRequest = Depends()
 ) -> HistoryResponse:
-    records, total = database.get_records_from_predictions(
+    records, total, next_cursor = await async_database.get_records_from_predictions(
         query_id = request.query_id,
         time_min = request.time_min,
         time_max = request.time_max,
         num_humans_min = request.num_humans_min,
         num_humans_max = request.num_humans_max,
         page_size = request.page_size,
-        page_index = request.page_index
+        page_index = request.page_index,
+        cursor = request.cursor,
+        total_mode = request.total_mode,
+        detection_confidence_min = request.detection_confidence_min,
+        detection_region = request.detection_region
     )
     
     return HistoryResponse(
         total = total,
+        next_cursor = next_cursor,
         
         records = [
             HistoryRecord(
@@ -310,14 +1139,355 @@ async def get_history(
                 time = record.time.strftime("%Y-%m-%d_%H-%M-%S"),
                 query_image_file = record.query_image_file,
                 result_image_file = record.result_image_file,
-                num_humans = record.num_humans
+                num_humans = record.num_humans,
+                
+                query_image_url = media_url(record.query_image_file),
+                result_image_url = media_url(record.result_image_file),
+                query_thumbnail_url = media_url(record.query_image_file, size = min(env_config.thumbnail_sizes)),
+                result_thumbnail_url = media_url(record.result_image_file, size = min(env_config.thumbnail_sizes))
             )
             for record in records
         ]
     )
 
+class RethresholdRequest(HistoryRequest):
+    confidence_threshold: float = Field(ge = 0.0, le = 1.0)
+
+class RethresholdRecord(BaseModel):
+    query_id: int
+    time: str
+    
+    num_humans: int
+    
+    # None when boxes of the prediction were not stored down to the threshold
+    num_humans_at_threshold: int | None
+
+class RethresholdResponse(BaseModel):
+    confidence_threshold: float
+    
+    total: int | None
+    next_cursor: str | None = None
+    
+    records: List[RethresholdRecord]
+
+@router.get("/history/rethreshold")
+async def rethreshold_history(
+    request: RethresholdRequest = Depends()
+) -> RethresholdResponse:
+    # Recounted from stored boxes, without running the model; stored counts are left as they are
+    records, total, next_cursor = await async_database.get_records_from_predictions(
+        query_id = request.query_id,
+        time_min = request.time_min,
+        time_max = request.time_max,
+        num_humans_min = request.num_humans_min,
+        num_humans_max = request.num_humans_max,
+        page_size = request.page_size,
+        page_index = request.page_index,
+        cursor = request.cursor,
+        total_mode = request.total_mode,
+        detection_confidence_min = request.detection_confidence_min,
+        detection_region = request.detection_region
+    )
+    
+    counts = await async_database.count_detections(
+        query_ids = [record.query_id for record in records],
+        confidence_threshold = request.confidence_threshold
+    )
+    
+    return RethresholdResponse(
+        confidence_threshold = request.confidence_threshold,
+        
+        total = total,
+        next_cursor = next_cursor,
+        
+        records = [
+            RethresholdRecord(
+                query_id = record.query_id,
+                time = record.time.strftime("%Y-%m-%d_%H-%M-%S"),
+                num_humans = record.num_humans,
+                num_humans_at_threshold = counts.get(record.query_id)
+            )
+            for record in records
+        ]
+    )
+
+class HistoryStatsRequest(HistoryFilters):
+    bucket: Literal['minute', 'hour', 'day'] = 'hour'
+
+class HistoryStatsBucket(BaseModel):
+    time: str
+    
+    count: int
+    sum_num_humans: int
+    avg_num_humans: float
+    max_num_humans: int
+
+class HistoryStatsResponse(BaseModel):
+    count: int
+    sum_num_humans: int
+    avg_num_humans: float | None
+    max_num_humans: int | None
+    
+    bucket: str
+    series: List[HistoryStatsBucket]
+
+@router.get("/history/stats")
+async def get_history_stats(
+    request: HistoryStatsRequest = Depends()
+) -> HistoryStatsResponse:
+    filters = {
+        'query_id': request.query_id,
+        'time_min': request.time_min,
+        'time_max': request.time_max,
+        'num_humans_min': request.num_humans_min,
+        'num_humans_max': request.num_humans_max,
+        'detection_confidence_min': request.detection_confidence_min,
+        'detection_region': request.detection_region
+    }
+    
+    async def fetch_series(time_from):
+        return await async_database.get_prediction_stats(
+            granularity = request.bucket,
+            time_from = time_from,
+            **filters
+        )
+    
+    series = await stats_cache.get_series(
+        key = (request.bucket, *filters.values()),
+        granularity = request.bucket,
+        now = datetime.now(),
+        time_max = datetime.strptime(request.time_max, "%Y-%m-%d_%H-%M-%S") if request.time_max else None,
+        fetch_series = fetch_series
+    )
+    
+    # Totals are folded from the buckets, so cached buckets count towards them too
+    count = sum(bucket_count for _, bucket_count, _, _ in series)
+    sum_num_humans = sum(bucket_sum for _, _, bucket_sum, _ in series)
+    
+    return HistoryStatsResponse(
+        count = count,
+        sum_num_humans = sum_num_humans,
+        avg_num_humans = sum_num_humans / count if count > 0 else None,
+        max_num_humans = max((bucket_max for _, _, _, bucket_max in series), default = None),
+        
+        bucket = request.bucket,
+        series = [
+            HistoryStatsBucket(
+                time = bucket_start.strftime("%Y-%m-%d_%H-%M-%S"),
+                count = bucket_count,
+                sum_num_humans = bucket_sum,
+                avg_num_humans = bucket_sum / bucket_count,
+                max_num_humans = bucket_max
+            )
+            for bucket_start, bucket_count, bucket_sum, bucket_max in series
+        ]
+    )
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('if-none-match')
+    
+    # If-None-Match takes precedence over If-Modified-Since
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [
+            tag.strip().removeprefix('W/') for tag in if_none_match.split(',')
+        ]
+    
+    if_modified_since = request.headers.get('if-modified-since')
+    
+    if if_modified_since is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            
+        except (TypeError, ValueError):
+            return False
+    
+    return False
+
+@router.get("/media/{media_path:path}")
+async def get_media(
+    request: Request,
+    media_path: str,
+    size: int | None = Query(default = None)
+):
+    if size is not None and size not in env_config.thumbnail_sizes:
+        raise HTTPException(
+            422, 
+            detail = [
+                {
+                    'msg': f"Invalid thumbnail size. Must be one of: {env_config.thumbnail_sizes}",
+                }
+            ]
+        )
+    
+    if size is None:
+        media_file = media_storage.resolve(media_path)
+        
+    else:
+        media_file = await asyncio.to_thread(
+            media_storage.thumbnail, 
+            media_path, 
+            size, 
+            format = env_config.thumbnail_format,
+            quality = env_config.thumbnail_quality
+        )
+    
+    if media_file is None:
+        raise HTTPException(404, detail = "Media not found.")
+    
+    # Files are named by the hash of their content, so they never change under a URL
+    stat_result = await asyncio.to_thread(os.stat, media_file)
+    
+    file_hash = os.path.splitext(os.path.basename(media_path))[0]
+    
+    headers = {
+        'ETag': f'"{file_hash}"' if size is None else f'"{file_hash}-{size}"',
+        'Last-Modified': formatdate(stat_result.st_mtime, usegmt = True),
+        'Cache-Control': 'public, max-age=31536000, immutable'
+    }
+    
+    if is_not_modified(request, headers['ETag'], stat_result.st_mtime):
+        return Response(status_code = 304, headers = headers)
+    
+    # Serves Range requests, with If-Range against these headers
+    return FileResponse(
+        media_file, 
+        headers = headers, 
+        stat_result = stat_result
+    )
+
+class ModelInfo(BaseModel):
+    name: str
+    model_file: str
+    runtime: str
+    image_size: int
+    
+    loaded_at: datetime
+    load_time: float
+    warm_up_time: float
+    
+    active: bool
+
+class ModelsResponse(BaseModel):
+    active: str
+    models: List[ModelInfo]
+
+def models_response():
+    active_name = model_registry.active.name
+    
+    return ModelsResponse(
+        active = active_name,
+        models = [
+            ModelInfo(**loaded_model.info(), active = loaded_model.name == active_name)
+            for loaded_model in model_registry.models()
+        ]
+    )
+
+@router.get("/models")
+async def get_models() -> ModelsResponse:
+    return models_response()
+
+def verify_admin_token(x_admin_token: str | None = Header(default = None)):
+    # Admin endpoints are disabled when no ADMIN_TOKEN is set
+    if not env_config.admin_token:
+        raise HTTPException(403, detail = "Admin endpoints are disabled.")
+    
+    if not hmac.compare_digest(x_admin_token or '', env_config.admin_token):
+        raise HTTPException(403, detail = "Invalid admin token.")
+
+admin_router = APIRouter(prefix = "/admin", dependencies = [Depends(verify_admin_token)])
+
+class LoadModelRequest(BaseModel):
+    model_filename: str
+    
+    # Default to the deployment settings
+    runtime: Literal['pytorch', 'onnx', 'openvino'] | None = None
+    int8: bool | None = None
+    image_size: int | None = Field(
+        default = None, 
+        ge = MODEL_STRIDE, 
+        le = env_config.inference_max_image_size, 
+        multiple_of = MODEL_STRIDE
+    )
+    
+    activate: bool = False
+    
+    @field_validator("model_filename")
+    @classmethod
+    def validate_model_filename(cls, model_filename):
+        # A file of models/finetuned, not a path
+        if not model_filename or os.path.basename(model_filename) != model_filename:
+            raise ValueError("Invalid model filename.")
+        
+        return model_filename
+
+@admin_router.post("/models")
+async def load_admin_model(request: LoadModelRequest) -> ModelsResponse:
+    model_file = os.path.join(paths_config.models_folder, 'finetuned', request.model_filename)
+    
+    if not os.path.exists(model_file):
+        raise HTTPException(404, detail = f"Model file {request.model_filename} not found.")
+    
+    # Loaded and warmed up off the event loop, while the current models keep serving
+    try:
+        loaded_model = await asyncio.to_thread(
+            load_model,
+            model_filename = request.model_filename,
+            runtime = request.runtime,
+            int8 = request.int8,
+            image_size = request.image_size
+        )
+    
+    except Exception as error:
+        raise HTTPException(400, detail = f"Could not load model {request.model_filename}: {error}")
+    
+    model_registry.add(loaded_model, activate = request.activate)
+    
+    return models_response()
+
+@admin_router.post("/models/{model_version}/activate")
+async def activate_admin_model(model_version: str) -> ModelsResponse:
+    # Requests already past model selection finish on the previous model
+    try:
+        model_registry.activate(model_version)
+    
+    except KeyError:
+        raise HTTPException(404, detail = f"Model {model_version} is not loaded.")
+    
+    return models_response()
+
+@admin_router.delete("/models/{model_version}")
+async def unload_admin_model(model_version: str) -> ModelsResponse:
+    try:
+        model_registry.remove(model_version)
+    
+    except KeyError:
+        raise HTTPException(404, detail = f"Model {model_version} is not loaded.")
+    
+    except ValueError as error:
+        raise HTTPException(409, detail = str(error))
+    
+    return models_response()
+
+router.include_router(admin_router)
+
+@health_router.get("/metrics")
+async def get_metrics():
+    return {
+        'inference_executor': inference_executor.stats(),
+        'models': model_registry.stats(),
+        'inference_cache': inference_cache.stats() if inference_cache is not None else None,
+        'media_writer': media_writer.stats(),
+        'record_buffer': record_buffer.stats() if record_buffer is not None else None,
+        'retention': retention_worker.stats() if retention_worker is not None else None,
+        'stats_cache': stats_cache.stats(),
+        'startup': startup.stats()
+    }
+
+app.include_router(health_router)
 app.include_router(router)
 
+startup.record('import', time.perf_counter() - import_started_at)
+
 def main(): 
     setup_folders()
     
@@ -20,6 +20,30 @@ class EnvConfig:
     port = int(os.getenv('PORT'))
     model_filename = os.getenv('MODEL_FILENAME')
     
+    # Inference runtime (pytorch | onnx | openvino), exported next to the .pt file on first load
+    model_runtime = (os.getenv('MODEL_RUNTIME') or 'pytorch').lower()
+    model_int8 = (os.getenv('MODEL_INT8') or 'false').lower() == 'true'
+    model_calibration_dataset = os.getenv('MODEL_CALIBRATION_DATASET')
+    
+    # Models loaded next to MODEL_FILENAME, selectable per request, and warm-up passes for each
+    model_preload_filenames = [
+        model_filename for model_filename in (os.getenv('MODEL_PRELOAD_FILENAMES') or '').split(',') 
+        if model_filename
+    ]
+    model_warm_up_iterations = int(os.getenv('MODEL_WARM_UP_ITERATIONS') or 2)
+    
+    # Required by the /admin endpoints as X-Admin-Token (empty disables them)
+    admin_token = os.getenv('ADMIN_TOKEN')
+    
+    # Inference resolution (empty uses the one the model was trained at) and default mode (standard | fast | tiled)
+    model_image_size = int(os.getenv('MODEL_IMAGE_SIZE') or 0) or None
+    inference_mode = (os.getenv('INFERENCE_MODE') or 'standard').lower()
+    inference_max_image_size = int(os.getenv('INFERENCE_MAX_IMAGE_SIZE') or 1280)
+    inference_fast_max_image_size = int(os.getenv('INFERENCE_FAST_MAX_IMAGE_SIZE') or 416)
+    inference_tile_min_size = int(os.getenv('INFERENCE_TILE_MIN_SIZE') or 1920)
+    inference_tile_overlap = float(os.getenv('INFERENCE_TILE_OVERLAP') or 0.2)
+    inference_tile_iou_threshold = float(os.getenv('INFERENCE_TILE_IOU_THRESHOLD') or 0.5)
+    
     # Database
     database_url = os.getenv('DATABASE_URL')
     database_name = os.getenv('DATABASE_NAME')
@@ -28,9 +52,68 @@ class EnvConfig:
     database_user = os.getenv('DATABASE_USER')
     database_password = os.getenv('DATABASE_PASSWORD')
     
+    # Database connection pools, one for the sync and one for the async engine (ignored for SQLite)
+    database_pool_size = int(os.getenv('DATABASE_POOL_SIZE') or 10)
+    database_max_overflow = int(os.getenv('DATABASE_MAX_OVERFLOW') or 20)
+    database_pool_timeout = float(os.getenv('DATABASE_POOL_TIMEOUT') or 30)
+    database_pool_recycle = int(os.getenv('DATABASE_POOL_RECYCLE') or 1800)
+    
+    # Write-behind buffer for Predictions rows (RECORD_BUFFER_MAX_RECORDS=0 inserts each request directly)
+    record_buffer_max_records = int(os.getenv('RECORD_BUFFER_MAX_RECORDS') or 100)
+    record_buffer_max_wait_ms = float(os.getenv('RECORD_BUFFER_MAX_WAIT_MS') or 50)
+    record_buffer_max_retries = int(os.getenv('RECORD_BUFFER_MAX_RETRIES') or 3)
+    record_buffer_retry_backoff_ms = float(os.getenv('RECORD_BUFFER_RETRY_BACKOFF_MS') or 100)
+    
+    # Inference executor
+    inference_executor = os.getenv('INFERENCE_EXECUTOR') or 'thread'
+    inference_max_workers = int(os.getenv('INFERENCE_MAX_WORKERS') or os.cpu_count())
+    inference_max_queue_size = int(os.getenv('INFERENCE_MAX_QUEUE_SIZE') or 32)
+    inference_retry_after = int(os.getenv('INFERENCE_RETRY_AFTER') or 1)
+    
+    # Micro-batching
+    batch_max_size = int(os.getenv('BATCH_MAX_SIZE') or 8)
+    batch_max_wait_ms = float(os.getenv('BATCH_MAX_WAIT_MS') or 10)
+    
+    # Inference result cache
+    inference_cache_max_bytes = int(os.getenv('INFERENCE_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+    inference_cache_ttl = float(os.getenv('INFERENCE_CACHE_TTL') or 300)
+    inference_cache_min_confidence = float(os.getenv('INFERENCE_CACHE_MIN_CONFIDENCE') or 0.05)
+    
+    # Background media writer
+    media_writer_threads = int(os.getenv('MEDIA_WRITER_THREADS') or 2)
+    media_writer_max_queue_size = int(os.getenv('MEDIA_WRITER_MAX_QUEUE_SIZE') or 256)
+    media_writer_put_timeout = float(os.getenv('MEDIA_WRITER_PUT_TIMEOUT') or 5)
+    
+    # Boxes of each prediction are stored down to this confidence (or the request threshold, if lower)
+    detections_min_confidence = float(os.getenv('DETECTIONS_MIN_CONFIDENCE') or 0.25)
+    
+    # Result image encoding (PNG | WEBP | JPEG)
+    result_image_format = (os.getenv('RESULT_IMAGE_FORMAT') or 'PNG').upper()
+    result_image_quality = int(os.getenv('RESULT_IMAGE_QUALITY') or 90)
+    result_image_compress_level = int(os.getenv('RESULT_IMAGE_COMPRESS_LEVEL') or 6)
+    
+    # Media endpoint thumbnails, by longest side in pixels (WEBP | JPEG | PNG)
+    thumbnail_sizes = [int(size) for size in (os.getenv('THUMBNAIL_SIZES') or '128,320').split(',')]
+    thumbnail_format = (os.getenv('THUMBNAIL_FORMAT') or 'WEBP').upper()
+    thumbnail_quality = int(os.getenv('THUMBNAIL_QUALITY') or 80)
+    
+    # Retention (RETENTION_DAYS=0 keeps everything)
+    retention_days = float(os.getenv('RETENTION_DAYS') or 0)
+    retention_batch_size = int(os.getenv('RETENTION_BATCH_SIZE') or 1000)
+    retention_interval = float(os.getenv('RETENTION_INTERVAL') or 3600)
+    
+    # History stats cache of closed buckets
+    stats_cache_max_entries = int(os.getenv('STATS_CACHE_MAX_ENTRIES') or 1024)
+    stats_cache_ttl = float(os.getenv('STATS_CACHE_TTL') or 3600)
+    stats_cache_grace = float(os.getenv('STATS_CACHE_GRACE') or 60)
+    
+    # Batch prediction endpoint
+    predict_batch_max_images = int(os.getenv('PREDICT_BATCH_MAX_IMAGES') or 64)
+    
     # Data validation
     min_image_size = int(os.getenv('MIN_IMAGE_SIZE'))
     max_image_size = int(os.getenv('MAX_IMAGE_SIZE'))
+    max_upload_bytes = int(os.getenv('MAX_UPLOAD_BYTES') or 32 * 1024 * 1024)
     
 @dataclass
 class PathsConfig:
@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(__file__))
+)
+
+import time
+
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from source.modules.database import HumanDetectorDatabase, Predictions, floor_time
+
+from configs.general import env_config
+
+def main():
+    database = HumanDetectorDatabase(
+        database_url = env_config.database_url
+    )
+    
+    database.create_tables()
+    
+    with database.engine.connect() as connection:
+        time_min, time_max = connection.execute(
+            select(func.min(Predictions.time), func.max(Predictions.time))
+        ).one()
+    
+    if time_min is None:
+        print("No predictions to roll up.")
+        
+        return
+    
+    # One day per transaction: every rollup bucket lies within a day
+    day = floor_time(time_min, 'day')
+    num_days = 0
+    
+    start_time = time.perf_counter()
+    
+    while day <= time_max:
+        database.rebuild_rollups(time_from = day, time_to = day + timedelta(days = 1))
+        
+        day += timedelta(days = 1)
+        num_days += 1
+        
+        if num_days % 30 == 0:
+            print(f"Rolled up until {day:%Y-%m-%d} ...")
+    
+    print(f"Rebuilt rollups of {num_days} days in {time.perf_counter() - start_time:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+)
+
+import json
+import time
+import random
+import asyncio
+
+import numpy as np
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from source.modules.database import HumanDetectorDatabase, Predictions
+from source.modules.async_database import AsyncHumanDetectorDatabase
+
+from configs.general import paths_config
+
+SEED_CHUNK_SIZE = 50000
+
+def seed(database, num_rows):
+    database.drop_tables()
+    database.create_tables()
+    
+    start_time = datetime(2024, 1, 1)
+    
+    with database.engine.begin() as connection:
+        for chunk_start in range(0, num_rows, SEED_CHUNK_SIZE):
+            connection.execute(
+                insert(Predictions),
+                [
+                    {
+                        'time': start_time + timedelta(seconds = index // 3),
+                        'query_image_file': f'media_storage/queries/{index}.png',
+                        'result_image_file': f'media_storage/results/{index}.png',
+                        'num_humans': random.randint(0, 20)
+                    }
+                    for index in range(chunk_start, min(chunk_start + SEED_CHUNK_SIZE, num_rows))
+                ]
+            )
+    
+    # Rows inserted in bulk bypass add_records, which maintains the rollups
+    database.rebuild_rollups()
+
+async def measure_loop_lag(stop_event, lags, interval = 0.001):
+    # How late the event loop wakes a 1 ms timer: what every other request waits
+    while not stop_event.is_set():
+        start_time = time.perf_counter()
+        
+        await asyncio.sleep(interval)
+        
+        lags.append(time.perf_counter() - start_time - interval)
+
+async def run_clients(get_page, concurrency, num_requests):
+    latencies = []
+    lags = []
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def client(page_index):
+        async with semaphore:
+            start_time = time.perf_counter()
+            
+            await get_page(page_index)
+            
+            latencies.append(time.perf_counter() - start_time)
+    
+    stop_event = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop_event, lags))
+    
+    start_time = time.perf_counter()
+    
+    await asyncio.gather(*[client(index % 50 + 1) for index in range(num_requests)])
+    
+    elapsed_time = time.perf_counter() - start_time
+    
+    stop_event.set()
+    await lag_task
+    
+    return {
+        'throughput': num_requests / elapsed_time,
+        'p50': np.percentile(latencies, 50) * 1000,
+        'p95': np.percentile(latencies, 95) * 1000,
+        'loop_lag': max(lags, default = 0) * 1000
+    }
+
+async def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script', 'benchmark', 'database_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    
+    # Tables are dropped and re-seeded: point this at a dedicated database
+    database = HumanDetectorDatabase(
+        database_url = config.get('database_url')
+    )
+    
+    async_database = AsyncHumanDetectorDatabase(
+        database_url = config.get('database_url')
+    )
+    
+    page_size = config.get('page_size', 10)
+    num_requests = config.get('num_requests', 500)
+    
+    num_rows = config.get('num_rows', 100000)
+    
+    print(f"Seeding {num_rows} rows ...")
+    seed(database, num_rows)
+    
+    query_params = {
+        'query_id': None,
+        'time_min': None, 'time_max': None,
+        'num_humans_min': '5', 'num_humans_max': None,
+        'page_size': page_size,
+        'total_mode': 'exact'
+    }
+    
+    # As the handler called it before: the query runs on the event loop
+    async def sync_get_page(page_index):
+        database.get_records_from_predictions(page_index = page_index, **query_params)
+    
+    async def threaded_get_page(page_index):
+        await asyncio.to_thread(database.get_records_from_predictions, page_index = page_index, **query_params)
+    
+    async def async_get_page(page_index):
+        await async_database.get_records_from_predictions(page_index = page_index, **query_params)
+    
+    variants = {
+        'sync': sync_get_page,
+        'sync in thread': threaded_get_page,
+        'async': async_get_page
+    }
+    
+    for concurrency in config.get('concurrency', [1, 8, 32, 64]):
+        print(f"  concurrency {concurrency}:")
+        
+        for name, get_page in variants.items():
+            results = await run_clients(get_page, concurrency, num_requests)
+            
+            print(
+                f"    {name:>14}: {results['throughput']:8.1f} req/s"
+                f" | p50 {results['p50']:8.2f} ms | p95 {results['p95']:8.2f} ms"
+                f" | max loop lag {results['loop_lag']:8.2f} ms"
+            )
+    
+    await async_database.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
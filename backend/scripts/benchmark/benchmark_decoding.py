@@ -0,0 +1,121 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+)
+
+import json
+import time
+import base64
+import tempfile
+
+import numpy as np
+
+from io import BytesIO
+from PIL import Image
+
+from source.utils.image import (
+    BBoxDrawer, DecodedImage,
+    b64image_to_pilimage, pilimage_to_b64image, save_b64image, save_decoded_image, strip_mime_prefix
+)
+
+from configs.general import paths_config
+
+# Stand-ins for the detector output so that only image handling is measured
+XYWHS = [[400, 300, 120, 260], [900, 500, 140, 300], [1500, 700, 100, 240]]
+CONFIDENCES = [0.91, 0.84, 0.77]
+
+def legacy_request(b64image, bbox_drawer, save_folder):
+    # PredictRequest.validate_b64image
+    b64image = strip_mime_prefix(b64image)
+    pilimage = Image.open(BytesIO(base64.b64decode(b64image)))
+    pilimage.verify()
+    
+    # HumanDetector.predict_b64image (ultralytics converts PIL images to BGR arrays)
+    pilimage = b64image_to_pilimage(b64image)
+    _ = np.asarray(pilimage.convert('RGB'))[:, :, ::-1]
+    
+    drawn_b64image = bbox_drawer.draw_bboxes_on_b64image(
+        b64image = b64image,
+        xywhs = XYWHS,
+        labels = ['human' for _ in XYWHS],
+        confidences = CONFIDENCES,
+        colors = ['red' for _ in XYWHS],
+        line_width = 2
+    )
+    
+    save_b64image(b64image, os.path.join(save_folder, 'queries', 'legacy.png'))
+    save_b64image(drawn_b64image, os.path.join(save_folder, 'results', 'legacy.png'))
+    
+    return drawn_b64image
+
+def decoded_image_request(b64image, bbox_drawer, save_folder):
+    decoded_image = DecodedImage.from_b64image(b64image)
+    decoded_image.load()
+    
+    _ = decoded_image.nparray
+    
+    drawn_image = bbox_drawer.draw_bboxes_on_decoded_image(
+        decoded_image = decoded_image,
+        xywhs = XYWHS,
+        labels = ['human' for _ in XYWHS],
+        confidences = CONFIDENCES,
+        colors = ['red' for _ in XYWHS],
+        line_width = 2
+    )
+    
+    save_decoded_image(decoded_image, os.path.join(save_folder, 'queries', 'decoded.png'))
+    save_decoded_image(drawn_image, os.path.join(save_folder, 'results', 'decoded.png'))
+    
+    return drawn_image.b64image
+
+def measure(request_fn, b64image, num_iterations):
+    bbox_drawer = BBoxDrawer()
+    
+    cpu_times = []
+    
+    with tempfile.TemporaryDirectory() as save_folder:
+        for _ in range(num_iterations):
+            start_time = time.process_time()
+            
+            request_fn(b64image, bbox_drawer, save_folder)
+            
+            cpu_times.append(time.process_time() - start_time)
+        
+    return np.mean(cpu_times), np.percentile(cpu_times, 95)
+
+def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script', 'benchmark', 'decoding_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+        
+    # Load image, or synthesize a 4K frame
+    if config.get('image_file'):
+        pilimage = Image.open(config.get('image_file'))
+        
+    else:
+        pilimage = Image.fromarray(
+            np.random.randint(0, 256, size = (2160, 3840, 3), dtype = np.uint8)
+        )
+        
+    b64image = pilimage_to_b64image(pilimage)
+    num_iterations = config.get('num_iterations', 10)
+    
+    # Benchmark
+    for name, request_fn in [
+        ('legacy', legacy_request), 
+        ('decoded_image', decoded_image_request)
+    ]:
+        mean_cpu_time, p95_cpu_time = measure(request_fn, b64image, num_iterations)
+        
+        print(f"{name:>16}: mean {mean_cpu_time * 1000:.1f} ms, p95 {p95_cpu_time * 1000:.1f} ms CPU per request")
+
+
+if __name__ == '__main__':
+    main()
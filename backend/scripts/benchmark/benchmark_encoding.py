@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+)
+
+import json
+import time
+
+import numpy as np
+
+from PIL import Image
+
+from source.utils.image import encode_pilimage
+
+from configs.general import paths_config
+
+DEFAULT_SETTINGS = [
+    {'format': 'PNG', 'compress_level': 1},
+    {'format': 'PNG', 'compress_level': 6},
+    {'format': 'PNG', 'compress_level': 9},
+    {'format': 'WEBP', 'quality': 80},
+    {'format': 'WEBP', 'quality': 90},
+    {'format': 'JPEG', 'quality': 80},
+    {'format': 'JPEG', 'quality': 90}
+]
+
+def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script', 'benchmark', 'encoding_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+        
+    # Load image, or synthesize a smooth 4K frame
+    if config.get('image_file'):
+        pilimage = Image.open(config.get('image_file'))
+        pilimage.load()
+        
+    else:
+        gradient = np.linspace(0, 255, 3840, dtype = np.uint8)
+        pilimage = Image.fromarray(
+            np.stack([np.tile(gradient, (2160, 1))] * 3, axis = -1)
+        )
+    
+    num_iterations = config.get('num_iterations', 5)
+    
+    # Benchmark
+    print(f"Image: {pilimage.size[0]}x{pilimage.size[1]}, raw {pilimage.size[0] * pilimage.size[1] * 3 / 1024:.0f} KiB")
+    
+    for settings in config.get('settings', DEFAULT_SETTINGS):
+        encode_times = []
+        
+        for _ in range(num_iterations):
+            start_time = time.perf_counter()
+            
+            image_data = encode_pilimage(pilimage, **settings)
+            
+            encode_times.append(time.perf_counter() - start_time)
+        
+        name = ', '.join(f'{key}={value}' for key, value in settings.items())
+        
+        print(f"{name:>32}: {len(image_data) / 1024:8.0f} KiB, encode {np.mean(encode_times) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+)
+
+import json
+import time
+import random
+
+import numpy as np
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from source.modules.database import HumanDetectorDatabase, Predictions, encode_cursor
+
+from configs.general import paths_config
+
+SEED_CHUNK_SIZE = 50000
+
+def seed(database, num_rows):
+    database.drop_tables()
+    database.create_tables()
+    
+    start_time = datetime(2024, 1, 1)
+    
+    with database.engine.begin() as connection:
+        for chunk_start in range(0, num_rows, SEED_CHUNK_SIZE):
+            connection.execute(
+                insert(Predictions),
+                [
+                    {
+                        'time': start_time + timedelta(seconds = index // 3),
+                        'query_image_file': f'media_storage/queries/{index}.png',
+                        'result_image_file': f'media_storage/results/{index}.png',
+                        'num_humans': random.randint(0, 20)
+                    }
+                    for index in range(chunk_start, min(chunk_start + SEED_CHUNK_SIZE, num_rows))
+                ]
+            )
+    
+    # Rows inserted in bulk bypass add_records, which maintains the rollups
+    database.rebuild_rollups()
+
+def measure(fn, num_iterations):
+    latencies = []
+    
+    for _ in range(num_iterations):
+        start_time = time.perf_counter()
+        
+        fn()
+        
+        latencies.append(time.perf_counter() - start_time)
+    
+    return np.median(latencies) * 1000
+
+def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script', 'benchmark', 'history_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    
+    # Tables are dropped and re-seeded: point this at a dedicated database
+    database = HumanDetectorDatabase(
+        database_url = config.get('database_url')
+    )
+    
+    page_size = config.get('page_size', 10)
+    num_iterations = config.get('num_iterations', 5)
+    
+    for num_rows in config.get('num_rows', [1000000, 10000000]):
+        print(f"Seeding {num_rows} rows ...")
+        seed(database, num_rows)
+        
+        for depth in config.get('depths', [0.0, 0.5, 0.99]):
+            page_index = int(num_rows * depth / page_size) + 1
+            
+            def get_page(**kwargs):
+                return database.get_records_from_predictions(
+                    query_id = None,
+                    time_min = None, time_max = None,
+                    num_humans_min = None, num_humans_max = None,
+                    page_size = page_size,
+                    **kwargs
+                )
+            
+            # Cursor of the page before, as a client walking the pages would hold
+            cursor = None
+            if page_index > 1:
+                records, _, _ = get_page(page_index = page_index - 1, total_mode = 'none')
+                cursor = encode_cursor(records[-1])
+            
+            results = {
+                'offset + exact total': measure(lambda: get_page(page_index = page_index, total_mode = 'exact'), num_iterations),
+                'offset, no total': measure(lambda: get_page(page_index = page_index, total_mode = 'none'), num_iterations),
+                'keyset, no total': measure(lambda: get_page(page_index = 1, cursor = cursor, total_mode = 'none'), num_iterations),
+                'keyset + estimate': measure(lambda: get_page(page_index = 1, cursor = cursor, total_mode = 'estimate'), num_iterations)
+            }
+            
+            print(f"  {num_rows} rows, page {page_index}:")
+            for name, latency in results.items():
+                print(f"    {name:>22}: {latency:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+)
+
+import glob
+import json
+import time
+
+import numpy as np
+
+from PIL import Image
+
+from source.core import HumanDetector
+
+from configs.general import env_config, paths_config
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
+
+def load_samples(split_folder, num_images, scale):
+    image_files = sorted(
+        image_file for image_file in glob.glob(os.path.join(split_folder, 'images', '*'))
+        if os.path.splitext(image_file)[1].lower() in IMAGE_EXTENSIONS
+    )[:num_images]
+    
+    samples = []
+    
+    for image_file in image_files:
+        pilimage = Image.open(image_file).convert('RGB')
+        
+        if scale != 1:
+            pilimage = pilimage.resize(
+                (round(pilimage.width * scale), round(pilimage.height * scale)),
+                Image.BILINEAR
+            )
+        
+        # YOLO labels: class, then center and size relative to the image
+        label_file = os.path.join(
+            split_folder, 'labels',
+            os.path.splitext(os.path.basename(image_file))[0] + '.txt'
+        )
+        
+        xyxys = []
+        
+        if os.path.exists(label_file):
+            with open(label_file, 'r') as file:
+                for line in file:
+                    values = line.split()
+                    
+                    if len(values) < 5:
+                        continue
+                    
+                    x, y, w, h = [float(value) for value in values[1:5]]
+                    
+                    xyxys.append([
+                        (x - w / 2) * pilimage.width, (y - h / 2) * pilimage.height,
+                        (x + w / 2) * pilimage.width, (y + h / 2) * pilimage.height
+                    ])
+        
+        # Same BGR arrays as the API feeds the model
+        samples.append((np.ascontiguousarray(np.asarray(pilimage)[:, :, ::-1]), xyxys))
+    
+    return samples
+
+def box_iou(xyxy, other_xyxy):
+    inter_width = max(0.0, min(xyxy[2], other_xyxy[2]) - max(xyxy[0], other_xyxy[0]))
+    inter_height = max(0.0, min(xyxy[3], other_xyxy[3]) - max(xyxy[1], other_xyxy[1]))
+    inter_area = inter_width * inter_height
+    
+    area = (xyxy[2] - xyxy[0]) * (xyxy[3] - xyxy[1])
+    other_area = (other_xyxy[2] - other_xyxy[0]) * (other_xyxy[3] - other_xyxy[1])
+    
+    return inter_area / (area + other_area - inter_area + 1e-9)
+
+def match(detections, label_xyxys, iou_threshold):
+    # Greedy, by decreasing confidence; returns the number of matched labels
+    unmatched = list(label_xyxys)
+    num_matched = 0
+    
+    for _, xyxy in sorted(zip(detections.confidences, detections.xyxys), reverse = True):
+        ious = [box_iou(xyxy, label_xyxy) for label_xyxy in unmatched]
+        
+        if ious and max(ious) >= iou_threshold:
+            unmatched.pop(int(np.argmax(ious)))
+            num_matched += 1
+    
+    return num_matched
+
+def measure(detector, samples, mode_config, confidence_threshold, iou_threshold):
+    image_times = []
+    num_labels = num_detections = num_matched = 0
+    
+    # Warm-up, at the resolution of the first image
+    detector.detect_nparrays(
+        [samples[0][0]], confidence_threshold,
+        image_size = mode_config.get('image_size'), mode = mode_config.get('mode', 'standard')
+    )
+    
+    # One image at a time, as the API sees them
+    for nparray, label_xyxys in samples:
+        start_time = time.perf_counter()
+        
+        detections = detector.detect_nparrays(
+            [nparray], confidence_threshold,
+            image_size = mode_config.get('image_size'), mode = mode_config.get('mode', 'standard')
+        )[0]
+        
+        image_times.append(time.perf_counter() - start_time)
+        
+        num_labels += len(label_xyxys)
+        num_detections += len(detections)
+        num_matched += match(detections, label_xyxys, iou_threshold)
+    
+    return {
+        'median_time': np.median(image_times),
+        'p95_time': np.percentile(image_times, 95),
+        'recall': num_matched / num_labels if num_labels else 0.0,
+        'precision': num_matched / num_detections if num_detections else 0.0
+    }
+
+def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script', 'benchmark', 'inference_modes_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    
+    detector = HumanDetector(
+        fast_max_image_size = env_config.inference_fast_max_image_size,
+        tile_min_size = env_config.inference_tile_min_size,
+        tile_overlap = env_config.inference_tile_overlap,
+        tile_iou_threshold = env_config.inference_tile_iou_threshold
+    )
+    
+    detector.load_model(
+        model_file = os.path.join(
+            paths_config.models_folder,
+            'finetuned',
+            config.get('trained_model_filename') or env_config.model_filename
+        ),
+        
+        runtime = config.get('runtime') or env_config.model_runtime,
+        int8 = config.get('int8', env_config.model_int8),
+        image_size = config.get('image_size') or env_config.model_image_size
+    )
+    
+    split_folder = os.path.join(
+        paths_config.datasets_folder,
+        config.get('dataset_name'),
+        config.get('split', 'test')
+    )
+    
+    # Standard first, so that the others are compared to it
+    mode_configs = config.get('modes') or [
+        {'mode': 'standard'},
+        {'mode': 'fast'},
+        {'mode': 'tiled'}
+    ]
+    
+    confidence_threshold = config.get('confidence_threshold', 0.25)
+    iou_threshold = config.get('iou_threshold', 0.5)
+    
+    # Downscaled copies show the fast mode at work, upscaled ones the tiled mode
+    for scale in config.get('scales', [1]):
+        samples = load_samples(split_folder, config.get('num_images', 50), scale)
+        
+        image_sides = [max(nparray.shape[:2]) for nparray, _ in samples]
+        
+        print(
+            f"Scale {scale}: {len(samples)} images, longest side {min(image_sides)}-{max(image_sides)} px, "
+            f"model image size {detector.image_size}"
+        )
+        
+        baseline = None
+        
+        for mode_config in mode_configs:
+            result = measure(detector, samples, mode_config, confidence_threshold, iou_threshold)
+            baseline = baseline or result
+            
+            name = mode_config.get('mode', 'standard') + (
+                f"@{mode_config['image_size']}" if mode_config.get('image_size') else ''
+            )
+            
+            print(
+                f"{name:>16}: median {result['median_time'] * 1000:.1f} ms, p95 {result['p95_time'] * 1000:.1f} ms, "
+                f"{baseline['median_time'] / result['median_time']:.2f}x, "
+                f"recall {result['recall']:.3f} ({result['recall'] - baseline['recall']:+.3f}), "
+                f"precision {result['precision']:.3f}"
+            )
+    
+    
+if __name__ == '__main__':
+    main()
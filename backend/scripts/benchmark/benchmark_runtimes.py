@@ -0,0 +1,137 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+)
+
+import glob
+import json
+import time
+
+import numpy as np
+
+from PIL import Image
+
+from source.core import HumanDetector
+
+from configs.general import env_config, paths_config
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
+
+def load_images(images_folder, num_images):
+    image_files = sorted(
+        image_file for image_file in glob.glob(os.path.join(images_folder, '**', '*'), recursive = True)
+        if os.path.splitext(image_file)[1].lower() in IMAGE_EXTENSIONS
+    )[:num_images]
+    
+    # Same BGR arrays as the API feeds the model
+    return [
+        np.ascontiguousarray(np.asarray(Image.open(image_file).convert('RGB'))[:, :, ::-1])
+        for image_file in image_files
+    ]
+
+def measure(detector, nparrays, batch_size, num_iterations):
+    # Warm-up, so that lazy runtime initialization is not measured
+    detector.detect_nparrays(nparrays[:batch_size], 0.25)
+    
+    batch_times = []
+    
+    for _ in range(num_iterations):
+        for index in range(0, len(nparrays), batch_size):
+            start_time = time.perf_counter()
+            
+            detector.detect_nparrays(nparrays[index:index + batch_size], 0.25)
+            
+            batch_times.append(time.perf_counter() - start_time)
+    
+    image_times = np.array(batch_times) / batch_size
+    
+    return np.median(image_times), np.percentile(image_times, 95)
+
+def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script', 'benchmark', 'runtimes_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    
+    model_file = os.path.join(
+        paths_config.models_folder,
+        'finetuned',
+        config.get('trained_model_filename') or env_config.model_filename
+    )
+    
+    # Accuracy on the dataset of scripts/train.py, which also calibrates INT8
+    data_file = os.path.join(
+        paths_config.datasets_folder,
+        config.get('dataset_name'),
+        'data.yaml'
+    )
+    
+    split = config.get('split', 'test')
+    image_size = config.get('image_size')
+    
+    nparrays = load_images(
+        images_folder = os.path.join(paths_config.datasets_folder, config.get('dataset_name'), split),
+        num_images = config.get('num_images', 32)
+    )
+    
+    # Baseline first, so that the others are compared to it
+    runtimes = config.get('runtimes') or [
+        {'runtime': 'pytorch'},
+        {'runtime': 'onnx'},
+        {'runtime': 'openvino'},
+        {'runtime': 'openvino', 'int8': True}
+    ]
+    
+    results = []
+    
+    for runtime_config in runtimes:
+        detector = HumanDetector()
+        
+        detector.load_model(
+            model_file = model_file,
+            runtime = runtime_config['runtime'],
+            int8 = runtime_config.get('int8', False),
+            calibration_data_file = data_file,
+            image_size = image_size
+        )
+        
+        metrics = detector.validate(data_file, image_size = image_size, split = split)
+        
+        latencies = {
+            batch_size: measure(
+                detector = detector,
+                nparrays = nparrays,
+                batch_size = batch_size,
+                num_iterations = config.get('num_iterations', 3)
+            )
+            for batch_size in config.get('batch_sizes', [1, 8])
+        }
+        
+        results.append((detector.model_version, metrics, latencies))
+    
+    # Report
+    _, baseline_metrics, baseline_latencies = results[0]
+    
+    for model_version, metrics, latencies in results:
+        print(
+            f"{model_version:>32}: mAP50 {metrics['map50']:.4f} ({metrics['map50'] - baseline_metrics['map50']:+.4f}), "
+            f"mAP50-95 {metrics['map50_95']:.4f} ({metrics['map50_95'] - baseline_metrics['map50_95']:+.4f})"
+        )
+        
+        for batch_size, (median_time, p95_time) in latencies.items():
+            speedup = baseline_latencies[batch_size][0] / median_time
+            
+            print(
+                f"{'':>32}  batch {batch_size}: median {median_time * 1000:.1f} ms, "
+                f"p95 {p95_time * 1000:.1f} ms per image, {speedup:.2f}x"
+            )
+    
+    
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(__file__))
+)
+
+import json
+
+from source.core import HumanDetector
+
+from configs.general import env_config, paths_config
+
+def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script',
+        'export_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    
+    calibration_dataset = config.get('calibration_dataset') or env_config.model_calibration_dataset
+    
+    # Export model next to its weights, where HumanDetector.load_model looks for it
+    exported_file = HumanDetector().export_model(
+        model_file = os.path.join(
+            paths_config.models_folder,
+            'finetuned',
+            config.get('trained_model_filename') or env_config.model_filename
+        ),
+        
+        runtime = config.get('runtime') or env_config.model_runtime,
+        int8 = config.get('int8', env_config.model_int8),
+        
+        calibration_data_file = os.path.join(
+            paths_config.datasets_folder,
+            calibration_dataset,
+            'data.yaml'
+        ) if calibration_dataset else None,
+        
+        image_size = config.get('image_size')
+    )
+    
+    print(f"Exported to {exported_file}")
+    
+    
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(__file__))
+)
+
+from source.modules import migrations
+from source.modules.database import HumanDetectorDatabase
+
+from configs.general import env_config
+
+def main():
+    database = HumanDetectorDatabase(
+        database_url = env_config.database_url
+    )
+    
+    # Safe to run before rolling out new API instances, while old ones keep serving
+    database.create_tables()
+    
+    applied_versions = migrations.get_applied_versions(database.engine)
+    
+    for version, description, _ in migrations.MIGRATIONS:
+        status = 'applied' if version in applied_versions else 'pending'
+        
+        print(f"{version:>4} {status:>8}  {description}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(__file__))
+)
+
+import re
+
+from source.modules.database import HumanDetectorDatabase, Predictions
+from source.modules.media_storage import MediaStorage
+
+from configs.general import env_config, paths_config
+
+BATCH_SIZE = 500
+
+CONTENT_FILE_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def is_content_file(file):
+    return CONTENT_FILE_PATTERN.match(
+        os.path.splitext(os.path.basename(file))[0]
+    ) is not None
+
+def migrate_file(media_storage, folder, file, legacy_files):
+    if file is None or is_content_file(file):
+        return file, False
+    
+    if not os.path.exists(file):
+        print(f"Missing file, left as is: {file}")
+        
+        return file, False
+    
+    with open(file, 'rb') as image_file:
+        image_data = image_file.read()
+    
+    content_file, _ = media_storage.store(
+        folder = folder,
+        image_data = image_data,
+        extension = os.path.splitext(file)[1]
+    )
+    
+    legacy_files.add(file)
+    
+    return content_file, True
+
+def main():
+    database = HumanDetectorDatabase(
+        database_url = env_config.database_url
+    )
+    
+    media_storage = MediaStorage(
+        root_folder = paths_config.media_storage_folder
+    )
+    
+    # Widens the file columns and creates media_files, among other migrations
+    database.create_tables()
+    
+    # Move files into content-addressed paths and repoint the rows
+    legacy_files = set()
+    num_migrated = 0
+    last_query_id = 0
+    
+    while True:
+        with database.Session() as session:
+            records = session.query(Predictions) \
+                .filter(Predictions.query_id > last_query_id) \
+                .order_by(Predictions.query_id) \
+                .limit(BATCH_SIZE) \
+                .all()
+            
+            if not records:
+                break
+            
+            for record in records:
+                record.query_image_file, query_migrated = migrate_file(
+                    media_storage, 'queries', record.query_image_file, legacy_files
+                )
+                
+                record.result_image_file, result_migrated = migrate_file(
+                    media_storage, 'results', record.result_image_file, legacy_files
+                )
+                
+                num_migrated += int(query_migrated or result_migrated)
+                
+            last_query_id = records[-1].query_id
+            
+            session.commit()
+            
+        print(f"Migrated {num_migrated} records up to query id {last_query_id}")
+    
+    database.rebuild_media_references()
+    
+    # Old files are removed only once every row points to the new paths
+    media_storage.remove(legacy_files)
+    
+    print(f"Done: {num_migrated} records migrated, {len(legacy_files)} legacy files removed")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,12 +5,175 @@ sys.path.append(
     os.path.dirname(os.path.dirname(__file__))
 )
 
+import csv
+import glob
 import json
+import time
+import queue
+import threading
 
 from source.core import HumanDetector
+from source.utils.image import DecodedImage
 
 from configs.general import env_config, paths_config
 
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
+
+CSV_COLUMNS = ['source', 'frame', 'num_humans', 'x1', 'y1', 'x2', 'y2', 'confidence', 'class_id']
+
+# Marks the end of the frame queue
+END_OF_FRAMES = None
+
+def expand_sources(sources):
+    # Directories (frame sequences, in name order), globs, image and video files
+    files = []
+    
+    for source in sources:
+        if os.path.isdir(source):
+            source_files = sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+            )
+            
+        elif glob.has_magic(source):
+            source_files = sorted(glob.glob(source, recursive = True))
+            
+        else:
+            source_files = [source]
+        
+        files += [
+            file for file in source_files 
+            if os.path.splitext(file)[1].lower() in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+        ]
+    
+    return files
+
+def read_video(video_file, stride):
+    import cv2
+    
+    capture = cv2.VideoCapture(video_file)
+    
+    try:
+        frame_index = 0
+        
+        while True:
+            # Skipped frames are grabbed but never decoded
+            if frame_index % stride != 0:
+                if not capture.grab():
+                    return
+                
+            else:
+                is_read, frame = capture.read()
+                
+                if not is_read:
+                    return
+                
+                yield frame_index, frame
+            
+            frame_index += 1
+            
+    finally:
+        capture.release()
+
+def produce_frames(files, stride, frames_queue, stats):
+    # Runs on its own thread, decoding ahead of inference: (source, frame index, BGR array)
+    try:
+        image_index = 0
+        
+        for file in files:
+            if os.path.splitext(file)[1].lower() in VIDEO_EXTENSIONS:
+                for frame_index, frame in read_video(file, stride):
+                    frames_queue.put((file, frame_index, frame))
+                    
+                continue
+            
+            # Images of a sequence share the stride
+            if image_index % stride == 0:
+                start_time = time.perf_counter()
+                
+                try:
+                    with open(file, 'rb') as image_file:
+                        nparray = DecodedImage.from_image_data(image_file.read()).nparray
+                    
+                except Exception as error:
+                    print(f"Skipped {file}: {error}")
+                    
+                    nparray = None
+                
+                stats['decode_time'] += time.perf_counter() - start_time
+                
+                # Images are numbered across the sequence
+                if nparray is not None:
+                    frames_queue.put((file, image_index, nparray))
+                    
+            image_index += 1
+            
+    finally:
+        frames_queue.put(END_OF_FRAMES)
+
+def iterate_batches(frames_queue, batch_size):
+    batch = []
+    
+    while True:
+        item = frames_queue.get()
+        
+        if item is END_OF_FRAMES:
+            break
+        
+        batch.append(item)
+        
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    
+    if batch:
+        yield batch
+
+class DetectionsWriter():
+    # JSONL: one line per frame; CSV: one row per box, or one empty row for a frame without boxes
+    def __init__(self, output_file):
+        self.output_format = 'csv' if output_file.lower().endswith('.csv') else 'jsonl'
+        
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok = True)
+        
+        self._file = open(output_file, 'w', newline = '')
+        
+        if self.output_format == 'csv':
+            self._csv_writer = csv.writer(self._file)
+            self._csv_writer.writerow(CSV_COLUMNS)
+    
+    def write(self, source, frame_index, detections):
+        if self.output_format == 'jsonl':
+            self._file.write(
+                json.dumps({
+                    'source': source,
+                    'frame': frame_index,
+                    'num_humans': len(detections),
+                    'detections': [
+                        {
+                            'xyxy': xyxy,
+                            'confidence': confidence,
+                            'class_id': int(class_id)
+                        }
+                        for xyxy, confidence, class_id in zip(
+                            detections.xyxys, detections.confidences, detections.classes
+                        )
+                    ]
+                }) + '\n'
+            )
+            
+            return
+        
+        if len(detections) == 0:
+            self._csv_writer.writerow([source, frame_index, 0] + [''] * 6)
+            
+        for xyxy, confidence, class_id in zip(detections.xyxys, detections.confidences, detections.classes):
+            self._csv_writer.writerow([source, frame_index, len(detections), *xyxy, confidence, int(class_id)])
+    
+    def close(self):
+        self._file.close()
+
 def main():
     # Load config
     config_file = os.path.join(
@@ -23,29 +186,104 @@ def main():
         config = json.load(file)
         
     # Init model
-    detector = HumanDetector()
+    detector = HumanDetector(
+        fast_max_image_size = env_config.inference_fast_max_image_size,
+        tile_min_size = env_config.inference_tile_min_size,
+        tile_overlap = env_config.inference_tile_overlap,
+        tile_iou_threshold = env_config.inference_tile_iou_threshold
+    )
     
     detector.load_model(
         model_file = os.path.join(
             paths_config.models_folder,
             'finetuned',
-            config.get('trained_model_filename')
-        )
+            config.get('trained_model_filename') or env_config.model_filename
+        ),
+        
+        runtime = config.get('runtime') or env_config.model_runtime,
+        int8 = config.get('int8', env_config.model_int8),
+        image_size = config.get('image_size') or env_config.model_image_size
     )
     
-    # Predict
-    predictions = detector.predict_from_file(
-        image_file = os.path.join(
+    # Without sources, the single test image of the dataset, as before
+    sources = config.get('sources') or [
+        os.path.join(
             paths_config.datasets_folder,
             config.get('dataset_name'),
             'test',
             config.get('test_image_filename')
-        ),
-        
-        confidence_threshold = 0.5
+        )
+    ]
+    
+    files = expand_sources(sources)
+    
+    confidence_threshold = config.get('confidence_threshold', 0.5)
+    inference_mode = config.get('inference_mode') or env_config.inference_mode
+    batch_size = config.get('batch_size', 8)
+    stride = config.get('stride', 1)
+    report_interval = config.get('report_interval', 5)
+    
+    output_file = config.get('output_file') or os.path.join(paths_config.outputs_folder, 'predictions.jsonl')
+    
+    print(f"Predicting on {len(files)} files, every {stride} frame(s), into {output_file} ...")
+    
+    # Bounded, so decoding stays a few batches ahead without filling memory
+    frames_queue = queue.Queue(maxsize = config.get('queue_size', 4 * batch_size))
+    stats = {'decode_time': 0.0}
+    
+    producer = threading.Thread(
+        target = produce_frames,
+        args = (files, stride, frames_queue, stats),
+        daemon = True
+    )
+    
+    writer = DetectionsWriter(output_file)
+    
+    num_frames = 0
+    num_humans = 0
+    inference_time = 0.0
+    
+    start_time = time.perf_counter()
+    last_report_time = start_time
+    
+    producer.start()
+    
+    try:
+        for batch in iterate_batches(frames_queue, batch_size):
+            batch_start_time = time.perf_counter()
+            
+            batch_detections = detector.detect_nparrays(
+                nparrays = [nparray for _, _, nparray in batch],
+                confidence_threshold = confidence_threshold,
+                mode = inference_mode
+            )
+            
+            inference_time += time.perf_counter() - batch_start_time
+            
+            for (source, frame_index, _), detections in zip(batch, batch_detections):
+                writer.write(source, frame_index, detections)
+                
+                num_humans += len(detections)
+            
+            num_frames += len(batch)
+            
+            if time.perf_counter() - last_report_time >= report_interval:
+                last_report_time = time.perf_counter()
+                
+                print(f"{num_frames} frames | {num_frames / (last_report_time - start_time):.1f} FPS")
+                
+    finally:
+        writer.close()
+    
+    producer.join()
+    
+    elapsed_time = time.perf_counter() - start_time
+    
+    print(
+        f"{num_frames} frames, {num_humans} humans in {elapsed_time:.1f} s"
+        f" | {num_frames / elapsed_time if elapsed_time > 0 else 0:.1f} FPS"
+        f" | inference {inference_time:.1f} s, image decoding {stats['decode_time']:.1f} s"
     )
-
-    print(predictions)
 
 
 if __name__ == '__main__':
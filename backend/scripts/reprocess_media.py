@@ -0,0 +1,250 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(__file__))
+)
+
+import json
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from source.core import HumanDetector, exported_model_file, model_version_name
+from source.modules.database import HumanDetectorDatabase, detection_records
+from source.utils.image import DecodedImage
+
+from configs.general import env_config, paths_config
+
+# The detector of this worker process, loaded once by init_worker
+_detector = None
+
+def init_worker(model_file, runtime, int8, image_size, num_threads):
+    import torch
+    
+    # Workers split the cores between them instead of each using all of them
+    torch.set_num_threads(num_threads)
+    
+    global _detector
+    
+    _detector = HumanDetector()
+    # The export already exists, written by main
+    _detector.load_model(
+        model_file = model_file,
+        runtime = runtime,
+        int8 = int8,
+        image_size = image_size
+    )
+
+def detect_batch(images_data, confidence_threshold):
+    return _detector.detect_batch(
+        decoded_images = [DecodedImage.from_image_data(image_data) for image_data in images_data],
+        confidence_threshold = confidence_threshold
+    )
+
+def read_batch(rows, default_confidence_threshold):
+    # (query_id, confidence threshold, image bytes), None for files that are gone
+    images_data = []
+    
+    for query_id, query_image_file, confidence_threshold in rows:
+        # Counted at the threshold of the original request; the config one for rows from before it was stored
+        if confidence_threshold is None:
+            confidence_threshold = default_confidence_threshold
+        
+        try:
+            with open(query_image_file, 'rb') as file:
+                images_data.append((query_id, confidence_threshold, file.read()))
+                
+        except (OSError, TypeError):
+            images_data.append((query_id, confidence_threshold, None))
+    
+    return images_data
+
+def storage_threshold(confidence_threshold):
+    return min(confidence_threshold, env_config.detections_min_confidence)
+
+def iterate_batches(database, model_version, page_size, batch_size):
+    # Keyset over query_id; rows already scored by model_version are skipped, so a rerun
+    # resumes where the previous one stopped
+    after_query_id = 0
+    
+    while True:
+        rows = database.get_predictions_to_reprocess(
+            model_version = model_version,
+            after_query_id = after_query_id,
+            limit = page_size
+        )
+        
+        if not rows:
+            return
+        
+        for batch_start in range(0, len(rows), batch_size):
+            yield rows[batch_start:batch_start + batch_size]
+        
+        after_query_id = rows[-1][0]
+
+def main():
+    # Load config
+    config_file = os.path.join(
+        paths_config.configs_folder,
+        'script',
+        'reprocess_config.json'
+    )
+    
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    
+    model_filename = config.get('model_filename') or env_config.model_filename
+    
+    model_file = os.path.join(
+        paths_config.models_folder,
+        'finetuned',
+        model_filename
+    )
+    
+    # Exported once here rather than by every worker
+    runtime = config.get('runtime') or env_config.model_runtime
+    int8 = config.get('int8', env_config.model_int8)
+    
+    # Same export, and so the same model version, as the API loads
+    image_size = config.get('image_size') or env_config.model_image_size
+    
+    if runtime != 'pytorch':
+        runtime_model_file = exported_model_file(model_file, runtime, int8, image_size)
+        
+        if not os.path.exists(runtime_model_file):
+            calibration_dataset = config.get('calibration_dataset') or env_config.model_calibration_dataset
+            
+            HumanDetector().export_model(
+                model_file = model_file,
+                runtime = runtime,
+                int8 = int8,
+                calibration_data_file = os.path.join(
+                    paths_config.datasets_folder,
+                    calibration_dataset,
+                    'data.yaml'
+                ) if calibration_dataset else None,
+                
+                image_size = image_size
+            )
+    
+    # Same version string as HumanDetector.model_version, and so as the API
+    model_version = model_version_name(model_file, runtime, int8, image_size)
+    
+    default_confidence_threshold = config.get('confidence_threshold', 0.25)
+    
+    batch_size = config.get('batch_size', 16)
+    num_workers = config.get('num_workers') or os.cpu_count()
+    threads_per_worker = config.get('threads_per_worker', 1)
+    prefetch_batches = config.get('prefetch_batches', 2 * num_workers)
+    report_interval = config.get('report_interval', 10)
+    
+    database = HumanDetectorDatabase(
+        database_url = env_config.database_url
+    )
+    
+    database.create_tables()
+    
+    num_total = database.count_predictions_to_reprocess(model_version)
+    
+    print(f"{num_total} predictions to score with {model_version} ...")
+    
+    batches = iterate_batches(
+        database = database,
+        model_version = model_version,
+        page_size = config.get('page_size', 1000),
+        batch_size = batch_size
+    )
+    
+    num_done = 0
+    num_missing = 0
+    
+    start_time = time.perf_counter()
+    last_report_time = start_time
+    
+    with ThreadPoolExecutor(max_workers = config.get('num_readers', 4)) as read_pool, \
+         ProcessPoolExecutor(
+             max_workers = num_workers,
+             initializer = init_worker,
+             initargs = (model_file, runtime, int8, image_size, threads_per_worker)
+         ) as process_pool:
+        
+        reads = deque()
+        detects = deque()
+        
+        def prefetch():
+            while len(reads) < prefetch_batches:
+                batch = next(batches, None)
+                
+                if batch is None:
+                    return
+                
+                reads.append(read_pool.submit(read_batch, batch, default_confidence_threshold))
+        
+        prefetch()
+        
+        while reads or detects:
+            # Keep two batches queued per worker
+            while reads and len(detects) < 2 * num_workers:
+                images_data = reads.popleft().result()
+                
+                found_images_data = [item for item in images_data if item[2] is not None]
+                num_missing += len(images_data) - len(found_images_data)
+                
+                if found_images_data:
+                    # Detected down to the lowest threshold of the batch, then filtered per row
+                    detects.append((
+                        [(query_id, confidence_threshold) for query_id, confidence_threshold, _ in found_images_data],
+                        process_pool.submit(
+                            detect_batch, 
+                            [image_data for _, _, image_data in found_images_data], 
+                            min(storage_threshold(confidence_threshold) for _, confidence_threshold, _ in found_images_data)
+                        )
+                    ))
+                
+                prefetch()
+            
+            if not detects:
+                continue
+            
+            rows, future = detects.popleft()
+            
+            # One transaction per batch: each committed batch is a checkpoint. The results
+            # replaced are kept in prediction_results
+            database.update_prediction_results([
+                {
+                    'query_id': query_id,
+                    'num_humans': len(detections.filter(confidence_threshold)),
+                    'confidence_threshold': confidence_threshold,
+                    'inference_time': detections.inference_time,
+                    'model_version': model_version,
+                    'detections_min_confidence': storage_threshold(confidence_threshold),
+                    'detections': detection_records(detections.filter(storage_threshold(confidence_threshold)))
+                }
+                for (query_id, confidence_threshold), detections in zip(rows, future.result())
+            ])
+            
+            num_done += len(rows)
+            
+            if time.perf_counter() - last_report_time >= report_interval:
+                last_report_time = time.perf_counter()
+                
+                throughput = num_done / (last_report_time - start_time)
+                eta = (num_total - num_done - num_missing) / throughput if throughput > 0 else float('inf')
+                
+                print(
+                    f"{num_done}/{num_total} scored, {num_missing} missing files"
+                    f" | {throughput:.1f} images/s | ETA {eta / 60:.1f} min"
+                )
+    
+    elapsed_time = time.perf_counter() - start_time
+    
+    print(
+        f"Scored {num_done} predictions with {model_version} in {elapsed_time:.1f} s"
+        f" ({num_done / elapsed_time if elapsed_time > 0 else 0:.1f} images/s), {num_missing} missing files"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -5,16 +5,312 @@ sys.path.append(
     os.path.dirname(os.path.dirname(__file__))
 )
 
-from ultralytics import YOLO
+import math
+import shutil
+import hashlib
+import threading
+
+import numpy as np
+
+from dataclasses import dataclass, field
 
 from source.utils.image import b64image_to_pilimage
 
+# ultralytics (and torch) are imported on first model load rather than with this module,
+# so that the API and tooling import quickly
+
+# Models already loaded in this process, so that detectors unpickled in
+# process-pool workers load their weights once per worker
+_process_models = {}
+
+# Optimized CPU runtimes, by the ultralytics export format they load from
+RUNTIMES = ['pytorch', 'onnx', 'openvino']
+
+def weights_hash(model_file):
+    sha256 = hashlib.sha256()
+    
+    with open(model_file, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha256.update(chunk)
+    
+    return sha256.hexdigest()[:12]
+
+def exported_model_file(model_file, runtime, int8 = False, image_size = None):
+    # Where the export of a .pt file is kept. Named after the content of the weights and the
+    # export size, so that retrained weights saved under the same name are exported again
+    if int8 and runtime != 'openvino':
+        raise ValueError("INT8 quantization is only supported with the openvino runtime.")
+    
+    if runtime not in ['onnx', 'openvino']:
+        raise ValueError(f"Not supported runtime: {runtime}")
+    
+    stem = os.path.splitext(model_file)[0] + f'_{weights_hash(model_file)}'
+    
+    if image_size:
+        stem += f'_{image_size}'
+    
+    if runtime == 'onnx':
+        return f'{stem}.onnx'
+    
+    return f'{stem}_{"int8_" if int8 else ""}openvino_model'
+
+def model_version_name(model_file, runtime = 'pytorch', int8 = False, image_size = None):
+    # Stored with each prediction. Exports are named after the weights already; .pt files get
+    # the same hash, so that retrained weights saved under the same name are a new version
+    if runtime != 'pytorch':
+        return os.path.basename(exported_model_file(model_file, runtime, int8, image_size))
+    
+    stem, extension = os.path.splitext(os.path.basename(model_file))
+    
+    return f'{stem}_{weights_hash(model_file)}{extension}'
+
+# Inference modes: the deployment resolution, the smallest one that fits the image,
+# or overlapping tiles at full resolution for very large images
+INFERENCE_MODES = ['standard', 'fast', 'tiled']
+
+# Model input sides must be multiples of the network stride
+MODEL_STRIDE = 32
+FAST_MIN_IMAGE_SIZE = 160
+
+# Tile boxes this close to an inner tile edge are cut off, and left to the neighbouring tile
+TILE_EDGE_MARGIN = 2
+
+def round_to_stride(size):
+    return max(MODEL_STRIDE, math.ceil(size / MODEL_STRIDE) * MODEL_STRIDE)
+
+def tile_starts(length, tile_size, step):
+    # Last tile is aligned to the far edge, so that every tile has the same shape
+    if length <= tile_size:
+        return [0]
+    
+    return list(range(0, length - tile_size, step)) + [length - tile_size]
+
+def nms(xyxys, scores, iou_threshold):
+    # Indices of the kept boxes, by decreasing score
+    x1, y1, x2, y2 = xyxys.T
+    areas = (x2 - x1) * (y2 - y1)
+    
+    order = scores.argsort()[::-1]
+    keep_indices = []
+    
+    while order.size > 0:
+        index = order[0]
+        keep_indices.append(int(index))
+        
+        inter_widths = np.clip(np.minimum(x2[index], x2[order[1:]]) - np.maximum(x1[index], x1[order[1:]]), 0, None)
+        inter_heights = np.clip(np.minimum(y2[index], y2[order[1:]]) - np.maximum(y1[index], y1[order[1:]]), 0, None)
+        inter_areas = inter_widths * inter_heights
+        
+        ious = inter_areas / (areas[index] + areas[order[1:]] - inter_areas + 1e-9)
+        
+        order = order[1:][ious <= iou_threshold]
+    
+    return keep_indices
+
+@dataclass
+class Detections:
+    xyxys: list = field(default_factory = list)
+    xywhs: list = field(default_factory = list)
+    confidences: list = field(default_factory = list)
+    classes: list = field(default_factory = list)
+    
+    # Milliseconds spent in pre-processing, inference and post-processing
+    inference_time: float = 0.0
+    
+    @classmethod
+    def from_prediction(cls, prediction):
+        return cls(
+            xyxys = prediction.boxes.xyxy.tolist(),
+            xywhs = prediction.boxes.xywh.tolist(),
+            confidences = prediction.boxes.conf.tolist(),
+            classes = prediction.boxes.cls.tolist(),
+            inference_time = sum(prediction.speed.values())
+        )
+    
+    def __len__(self):
+        return len(self.confidences)
+    
+    def filter(self, confidence_threshold):
+        keep_indices = [
+            index for index, confidence in enumerate(self.confidences)
+            if confidence >= confidence_threshold
+        ]
+        
+        return Detections(
+            xyxys = [self.xyxys[index] for index in keep_indices],
+            xywhs = [self.xywhs[index] for index in keep_indices],
+            confidences = [self.confidences[index] for index in keep_indices],
+            classes = [self.classes[index] for index in keep_indices],
+            inference_time = self.inference_time
+        )
+
 class HumanDetector():
-    def __init__(self):
-        pass
+    def __init__(
+        self, 
+        fast_max_image_size = 416, 
+        tile_min_size = 1920, 
+        tile_overlap = 0.2, 
+        tile_iou_threshold = 0.5
+    ):
+        self._model = None
+        self._model_file = None
+        self._model_version = None
+        
+        # Deployment resolution; None falls back to the one the model was trained at
+        self._image_size = None
+        self._trained_image_size = None
+        
+        self.fast_max_image_size = fast_max_image_size
+        self.tile_min_size = tile_min_size
+        self.tile_overlap = tile_overlap
+        self.tile_iou_threshold = tile_iou_threshold
+        
+        # An ultralytics predictor is not safe to call from several threads at once
+        self._predict_lock = threading.Lock()
+    
+    def __getstate__(self):
+        return {
+            '_model_file': self._model_file,
+            '_model_version': self._model_version,
+            '_image_size': self._image_size,
+            'fast_max_image_size': self.fast_max_image_size,
+            'tile_min_size': self.tile_min_size,
+            'tile_overlap': self.tile_overlap,
+            'tile_iou_threshold': self.tile_iou_threshold
+        }
+    
+    def __setstate__(self, state):
+        from ultralytics import YOLO
+        
+        self.__init__(
+            fast_max_image_size = state['fast_max_image_size'],
+            tile_min_size = state['tile_min_size'],
+            tile_overlap = state['tile_overlap'],
+            tile_iou_threshold = state['tile_iou_threshold']
+        )
+        
+        self._image_size = state['_image_size']
+        
+        # By version rather than path, as retrained weights may be saved under the same path
+        if state['_model_file'] is not None:
+            if state['_model_version'] not in _process_models:
+                _process_models[state['_model_version']] = YOLO(state['_model_file'], task = 'detect')
+                
+            self._model = _process_models[state['_model_version']]
+            self._model_file = state['_model_file']
+            self._model_version = state['_model_version']
+    
+    def load_model(
+        self, 
+        model_file, 
+        runtime = 'pytorch', 
+        int8 = False, 
+        calibration_data_file = None, 
+        image_size = None
+    ):
+        from ultralytics import YOLO
+        
+        # Other runtimes load the export of the .pt file, exporting it first if needed
+        if runtime != 'pytorch':
+            runtime_model_file = exported_model_file(model_file, runtime, int8, image_size)
+            
+            if not os.path.exists(runtime_model_file):
+                self.export_model(
+                    model_file = model_file,
+                    runtime = runtime,
+                    int8 = int8,
+                    calibration_data_file = calibration_data_file,
+                    image_size = image_size
+                )
+                
+            model_file = runtime_model_file
+            model_version = os.path.basename(runtime_model_file)
+            
+        else:
+            model_version = model_version_name(model_file)
+        
+        self._model = YOLO(model_file, task = 'detect')
+        self._model_file = model_file
+        self._model_version = model_version
+        self._image_size = image_size
+    
+    def export_model(
+        self, 
+        model_file, 
+        runtime, 
+        int8 = False, 
+        calibration_data_file = None, 
+        image_size = None
+    ):
+        # Rejects INT8 outside openvino. INT8 is post-training quantization, calibrated on the images of a dataset yaml
+        runtime_model_file = exported_model_file(model_file, runtime, int8, image_size)
+        
+        if int8 and calibration_data_file is None:
+            raise ValueError("INT8 quantization needs a calibration dataset.")
+        
+        from ultralytics import YOLO
+        
+        model = YOLO(model_file)
+        
+        # Dynamic batch axis, for the micro-batcher, and dynamic sides, for per-request resolutions
+        exported_file = model.export(
+            format = runtime,
+            imgsz = image_size or model.overrides.get('imgsz', 640),
+            int8 = int8,
+            data = calibration_data_file,
+            dynamic = True
+        )
+        
+        # ultralytics names the export after the .pt file only
+        if os.path.isdir(runtime_model_file):
+            shutil.rmtree(runtime_model_file)
+        
+        os.replace(exported_file, runtime_model_file)
+        
+        return runtime_model_file
+    
+    def validate(self, data_file, image_size = None, split = 'val'):
+        # Box mAP of the loaded model on a dataset split
+        if self._model:
+            metrics = self._model.val(
+                data = data_file, 
+                imgsz = image_size or self.image_size, 
+                split = split, 
+                verbose = False
+            )
+            
+            return {
+                'map50': float(metrics.box.map50),
+                'map50_95': float(metrics.box.map)
+            }
+        
+        else:
+            print("No model selected ...") 
+    
+    @property
+    def model_version(self):
+        return self._model_version
+    
+    @property
+    def image_size(self):
+        if self._image_size:
+            return self._image_size
+        
+        if self._trained_image_size:
+            return self._trained_image_size
+        
+        # .pt checkpoints keep the imgsz they were trained at
+        model_image_size = self._model.overrides.get('imgsz') if self._model else None
+        
+        if model_image_size:
+            return max(model_image_size) if isinstance(model_image_size, (list, tuple)) else model_image_size
+        
+        return 640
     
-    def load_model(self, model_file):
-        self._model = YOLO(model_file)
+    @property
+    def model_id(self):
+        # The version holds the weights hash, so retrained weights saved under the same name get their own cache entries
+        return self._model_version
     
     def train(self,
               base_model,
@@ -22,6 +318,8 @@ class HumanDetector():
               num_epochs,
               image_size
     ):
+        from ultralytics import YOLO
+        
         self._model = YOLO(base_model)
         self._trained_image_size = image_size
         
@@ -40,7 +338,7 @@ class HumanDetector():
             
             predictions = self._model.predict(
                 source = pilimage, 
-                imgsz = 640, 
+                imgsz = self.image_size, 
                 conf = confidence_threshold
             )
             
@@ -48,12 +346,141 @@ class HumanDetector():
         
         else:
             print("No model selected ...") 
+    
+    def inference_plan(self, image_width, image_height, image_size = None, mode = 'standard'):
+        # (mode, imgsz) an image actually runs with; images with the same plan can share a batch
+        image_size = image_size or self.image_size
+        longest_side = max(image_width, image_height)
+        
+        # Small images are not upscaled to the deployment resolution
+        if mode == 'fast':
+            return 'standard', min(
+                image_size, 
+                self.fast_max_image_size, 
+                max(FAST_MIN_IMAGE_SIZE, round_to_stride(longest_side))
+            )
+        
+        if mode == 'tiled' and longest_side >= max(self.tile_min_size, 2 * image_size):
+            return 'tiled', image_size
+        
+        return 'standard', image_size
+    
+    def detect_batch(self, decoded_images, confidence_threshold, image_size = None, mode = 'standard'):
+        return self.detect_nparrays(
+            nparrays = [decoded_image.nparray for decoded_image in decoded_images],
+            confidence_threshold = confidence_threshold,
+            image_size = image_size,
+            mode = mode
+        )
+    
+    def detect_nparrays(self, nparrays, confidence_threshold, image_size = None, mode = 'standard'):
+        # BGR, HWC, uint8 frames, e.g. straight from OpenCV
+        if self._model:
+            plans = [
+                self.inference_plan(nparray.shape[1], nparray.shape[0], image_size, mode) 
+                for nparray in nparrays
+            ]
+            
+            # Tiled images run one by one, each as a batch of its tiles
+            if any(plan_mode == 'tiled' for plan_mode, _ in plans):
+                return [
+                    self.detect_tiled(nparray, confidence_threshold, plan_image_size) 
+                    if plan_mode == 'tiled' else 
+                    self.detect_nparrays([nparray], confidence_threshold, plan_image_size)[0]
+                    for nparray, (plan_mode, plan_image_size) in zip(nparrays, plans)
+                ]
+            
+            with self._predict_lock:
+                predictions = self._model.predict(
+                    source = nparrays, 
+                    imgsz = max(plan_image_size for _, plan_image_size in plans), 
+                    conf = confidence_threshold,
+                    verbose = False
+                )
+            
+            return [Detections.from_prediction(prediction) for prediction in predictions]
+        
+        else:
+            print("No model selected ...") 
+    
+    def warm_up(self, image_sizes = None, num_iterations = 2):
+        # Dummy frames, so that lazy runtime initialization is paid before the first request
+        image_sizes = image_sizes or sorted({self.image_size, min(self.image_size, self.fast_max_image_size)})
+        
+        for image_size in image_sizes:
+            nparray = np.zeros((image_size, image_size, 3), dtype = np.uint8)
+            
+            for _ in range(num_iterations):
+                self.detect_nparrays([nparray], confidence_threshold = 0.25, image_size = image_size)
+    
+    def detect_tiled(self, nparray, confidence_threshold, image_size = None):
+        # Overlapping tiles at full resolution, plus the whole image for people larger than a tile
+        image_size = image_size or self.image_size
+        height, width = nparray.shape[:2]
+        
+        step = max(MODEL_STRIDE, int(image_size * (1 - self.tile_overlap)))
+        
+        offsets = [
+            (x_start, y_start)
+            for y_start in tile_starts(height, image_size, step)
+            for x_start in tile_starts(width, image_size, step)
+        ]
+        
+        tiles = [
+            nparray[y_start:y_start + image_size, x_start:x_start + image_size]
+            for x_start, y_start in offsets
+        ]
+        
+        with self._predict_lock:
+            predictions = self._model.predict(
+                source = tiles + [nparray], 
+                imgsz = image_size, 
+                conf = confidence_threshold,
+                verbose = False
+            )
+        
+        xyxys, confidences, classes = [], [], []
+        
+        for (x_start, y_start), prediction in zip(offsets + [(0, 0)], predictions):
+            tile_height, tile_width = prediction.orig_shape
+            
+            for (x1, y1, x2, y2), confidence, class_id in zip(
+                prediction.boxes.xyxy.tolist(), prediction.boxes.conf.tolist(), prediction.boxes.cls.tolist()
+            ):
+                # Boxes cut by an inner tile edge are whole in the overlapping tile
+                if (
+                    (x1 <= TILE_EDGE_MARGIN and x_start > 0) or 
+                    (y1 <= TILE_EDGE_MARGIN and y_start > 0) or 
+                    (x2 >= tile_width - TILE_EDGE_MARGIN and x_start + tile_width < width) or 
+                    (y2 >= tile_height - TILE_EDGE_MARGIN and y_start + tile_height < height)
+                ):
+                    continue
+                
+                xyxys.append([x1 + x_start, y1 + y_start, x2 + x_start, y2 + y_start])
+                confidences.append(confidence)
+                classes.append(class_id)
+        
+        keep_indices = nms(
+            np.array(xyxys).reshape(-1, 4), 
+            np.array(confidences), 
+            self.tile_iou_threshold
+        )
+        
+        xyxys = [xyxys[index] for index in keep_indices]
+        
+        return Detections(
+            xyxys = xyxys,
+            xywhs = [[(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1] for x1, y1, x2, y2 in xyxys],
+            confidences = [confidences[index] for index in keep_indices],
+            classes = [classes[index] for index in keep_indices],
+            inference_time = sum(sum(prediction.speed.values()) for prediction in predictions)
+        )
             
     def predict_from_file(self, image_file, confidence_threshold):
         if self._model:            
             predictions = self._model.predict(
                 source = image_file, 
-                imgsz = 640, 
+                imgsz = self.image_size, 
                 conf = confidence_threshold
             )
             
@@ -0,0 +1,137 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from source.modules.database import (
+    add_media_references, add_rollups, count_detections, delete_predictions_by_id, query_prediction_stats,
+    query_records_from_predictions, query_replaced_results, records_media_files
+)
+
+ASYNC_DRIVERS = {
+    'postgresql': 'asyncpg',
+    'sqlite': 'aiosqlite'
+}
+
+def to_async_database_url(database_url):
+    # postgresql[+psycopg2]:// -> postgresql+asyncpg://, sqlite:// -> sqlite+aiosqlite://
+    url = make_url(database_url)
+    
+    backend_name = url.get_backend_name()
+    
+    if backend_name not in ASYNC_DRIVERS:
+        raise ValueError(f"Not supported database dialect: {backend_name}")
+    
+    return url.set(drivername = f'{backend_name}+{ASYNC_DRIVERS[backend_name]}')
+
+class AsyncHumanDetectorDatabase:
+    # Same queries as HumanDetectorDatabase, run through run_sync on an async connection,
+    # so that awaiting them does not block the event loop. The schema and its migrations
+    # stay with HumanDetectorDatabase.
+    def __init__(
+        self, 
+        database_url, 
+        pool_size = 10, 
+        max_overflow = 20, 
+        pool_timeout = 30, 
+        pool_recycle = 1800
+    ):
+        database_url = to_async_database_url(database_url)
+        
+        if database_url.get_backend_name() == 'sqlite':
+            # SQLite picks its own pool class, which may not take these options
+            self.engine = create_async_engine(database_url)
+            
+        else:
+            self.engine = create_async_engine(
+                database_url,
+                pool_size = pool_size,
+                max_overflow = max_overflow,
+                pool_timeout = pool_timeout,
+                pool_recycle = pool_recycle,
+                pool_pre_ping = True
+            )
+        
+        self.Session = async_sessionmaker(bind = self.engine, expire_on_commit = False)
+    
+    async def dispose(self):
+        await self.engine.dispose()
+    
+    async def add_record(self, record):
+        await self.add_records([record])
+    
+    async def add_records(self, records):
+        async with self.Session() as session:
+            session.add_all(records)
+            
+            await session.run_sync(add_media_references, records_media_files(records))
+            await session.run_sync(add_rollups, records)
+            
+            await session.commit()
+    
+    async def get_record_by_id(self, model, record_id):
+        async with self.Session() as session:
+            return await session.get(model, record_id)
+    
+    async def get_records_from_predictions(
+        self,
+        query_id: int | None,
+        time_min, time_max,
+        num_humans_min, num_humans_max,
+        page_size, page_index,
+        cursor = None,
+        total_mode = 'exact',
+        detection_confidence_min = None, detection_region = None
+    ):
+        async with self.Session() as session:
+            return await session.run_sync(
+                query_records_from_predictions,
+                query_id = query_id,
+                time_min = time_min,
+                time_max = time_max,
+                num_humans_min = num_humans_min,
+                num_humans_max = num_humans_max,
+                page_size = page_size,
+                page_index = page_index,
+                cursor = cursor,
+                total_mode = total_mode,
+                detection_confidence_min = detection_confidence_min,
+                detection_region = detection_region
+            )
+    
+    async def get_prediction_stats(
+        self,
+        query_id: int | None,
+        time_min, time_max,
+        num_humans_min, num_humans_max,
+        granularity,
+        time_from = None,
+        detection_confidence_min = None, detection_region = None
+    ):
+        async with self.Session() as session:
+            return await session.run_sync(
+                query_prediction_stats,
+                query_id = query_id,
+                time_min = time_min,
+                time_max = time_max,
+                num_humans_min = num_humans_min,
+                num_humans_max = num_humans_max,
+                granularity = granularity,
+                time_from = time_from,
+                detection_confidence_min = detection_confidence_min,
+                detection_region = detection_region
+            )
+    
+    async def get_replaced_results(self, after_result_id = None):
+        async with self.Session() as session:
+            return await session.run_sync(query_replaced_results, after_result_id)
+    
+    async def count_detections(self, query_ids, confidence_threshold):
+        async with self.Session() as session:
+            return await session.run_sync(count_detections, query_ids, confidence_threshold)
+    
+    async def delete_predictions(self, query_ids):
+        async with self.Session() as session:
+            released_files = await session.run_sync(delete_predictions_by_id, query_ids)
+            
+            await session.commit()
+        
+        return released_files
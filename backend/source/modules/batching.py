@@ -0,0 +1,182 @@
+import time
+import asyncio
+
+from source.utils.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+
+class ImageDecodeError(ValueError):
+    pass
+
+def detect_decoded_images(detector, decoded_images, confidence_threshold, image_size = None, mode = 'standard'):
+    # Runs on the worker, where pixels are decoded if they were not already. An image that fails
+    # to decode gets its error, instead of failing the images it was batched with
+    nparrays, errors = [], []
+    
+    for decoded_image in decoded_images:
+        try:
+            nparrays.append(decoded_image.nparray)
+            errors.append(None)
+            
+        except Exception:
+            errors.append(ImageDecodeError("Invalid image data."))
+    
+    batch_detections = iter(
+        detector.detect_nparrays(
+            nparrays = nparrays,
+            confidence_threshold = confidence_threshold,
+            image_size = image_size,
+            mode = mode
+        ) if nparrays else []
+    )
+    
+    return [error if error is not None else next(batch_detections) for error in errors]
+
+class MicroBatcher():
+    def __init__(self, detector, executor, max_batch_size, max_wait_ms, cache = None):
+        self.detector = detector
+        self.executor = executor
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        
+        # Only touched from the event loop thread. Requests wait by inference plan,
+        # since a forward pass runs all of its images at one resolution
+        self._pending = {}
+        self._flush_handle = None
+        self._running_batches = set()
+        
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.batch_latency = Histogram()
+        self.request_latency = Histogram()
+        
+    async def submit(self, decoded_image, confidence_threshold, image_size = None, mode = 'standard'):
+        plan = self.detector.inference_plan(
+            image_width = decoded_image.size[0],
+            image_height = decoded_image.size[1],
+            image_size = image_size,
+            mode = mode
+        )
+        
+        # Same image at another resolution gives other boxes
+        cache_key = f'{decoded_image.sha256}:{plan[0]}:{plan[1]}'
+        
+        if self.cache is not None:
+            detections = self.cache.get(
+                image_hash = cache_key,
+                model_id = self.detector.model_id,
+                confidence_threshold = confidence_threshold
+            )
+            
+            if detections is not None:
+                return detections
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        pending = self._pending.setdefault(plan, [])
+        pending.append((decoded_image, cache_key, confidence_threshold, future, time.monotonic()))
+        
+        if len(pending) >= self.max_batch_size:
+            self._flush_plan(plan)
+            
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.max_wait_ms / 1000, 
+                self._flush
+            )
+        
+        return await future
+    
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        for plan in list(self._pending):
+            self._flush_plan(plan)
+    
+    def _flush_plan(self, plan):
+        pending = self._pending.pop(plan)
+        
+        while pending:
+            batch = pending[:self.max_batch_size]
+            pending = pending[self.max_batch_size:]
+            
+            task = asyncio.ensure_future(self._run_batch(plan, batch))
+            
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+        
+        # The timer of the others keeps running
+        if not self._pending and self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+            
+    async def _run_batch(self, plan, batch):
+        mode, image_size = plan
+        decoded_images = [decoded_image for decoded_image, _, _, _, _ in batch]
+        
+        # Run once at the lowest threshold, then post-filter for each request
+        min_confidence_threshold = min(confidence_threshold for _, _, confidence_threshold, _, _ in batch)
+        
+        if self.cache is not None:
+            min_confidence_threshold = min(min_confidence_threshold, self.cache.min_confidence_threshold)
+        
+        model_id = self.detector.model_id
+        
+        self.batch_size.observe(len(batch))
+        
+        started_at = time.monotonic()
+        
+        try:
+            batch_detections = await self.executor.run(
+                detect_decoded_images,
+                self.detector,
+                decoded_images = decoded_images,
+                confidence_threshold = min_confidence_threshold,
+                image_size = image_size,
+                mode = mode
+            )
+        
+        except Exception as exception:
+            for _, _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exception)
+                    
+            return
+        
+        finished_at = time.monotonic()
+        
+        self.batch_latency.observe(finished_at - started_at)
+        
+        for (_, cache_key, confidence_threshold, future, enqueued_at), detections in zip(batch, batch_detections):
+            self.request_latency.observe(finished_at - enqueued_at)
+            
+            if isinstance(detections, ImageDecodeError):
+                if not future.done():
+                    future.set_exception(detections)
+                
+                continue
+            
+            if self.cache is not None:
+                self.cache.put(
+                    image_hash = cache_key,
+                    model_id = model_id,
+                    detections = detections
+                )
+            
+            if not future.done():
+                future.set_result(detections.filter(confidence_threshold))
+        
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'pending': sum(len(pending) for pending in self._pending.values()),
+            'pending_plans': len(self._pending),
+            'running_batches': len(self._running_batches),
+            'batch_size': self.batch_size.snapshot(),
+            'batch_latency': self.batch_latency.snapshot(),
+            'request_latency': self.request_latency.snapshot()
+        }
@@ -1,25 +1,689 @@
-from datetime import datetime
+import json
+import base64
 
-from sqlalchemy import create_engine, Column, DateTime, Integer, String
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    create_engine, bindparam, delete, exists, func, insert, inspect, literal, or_, select, tuple_, update,
+    Column, DateTime, Float, ForeignKey, Index, Integer, String
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import relationship, sessionmaker
+
+from source.modules import migrations
 
 Base = declarative_base()
 
+# Dialects the upserts and time buckets are written for; others are rejected on startup instead of on the first query
+SUPPORTED_DIALECTS = ['postgresql', 'sqlite']
+
+TIME_BUCKET_FORMATS = {
+    'minute': '%Y-%m-%d %H:%M:00',
+    'hour': '%Y-%m-%d %H:00:00',
+    'day': '%Y-%m-%d 00:00:00'
+}
+
+TIME_BUCKET_UNITS = {
+    'minute': timedelta(minutes = 1),
+    'hour': timedelta(hours = 1),
+    'day': timedelta(days = 1)
+}
+
+def filter_predictions(
+    query,
+    query_id = None,
+    time_min = None, time_max = None,
+    num_humans_min = None, num_humans_max = None,
+    detection_confidence_min = None, detection_region = None
+):
+    if query_id is not None and query_id != "":
+        query = query.filter(Predictions.query_id == query_id)
+    
+    if time_min is not None and time_min != "":
+        query = query.filter(Predictions.time >= datetime.strptime(time_min, "%Y-%m-%d_%H-%M-%S"))
+    
+    if time_max is not None and time_max != "":
+        query = query.filter(Predictions.time <= datetime.strptime(time_max, "%Y-%m-%d_%H-%M-%S"))
+    
+    if num_humans_min is not None and num_humans_min != "":
+        query = query.filter(Predictions.num_humans >= int(num_humans_min))
+        
+    if num_humans_max is not None and num_humans_max != "":
+        query = query.filter(Predictions.num_humans <= int(num_humans_max))
+    
+    # Predictions with at least one stored box above the confidence and overlapping the region
+    detection_conditions = []
+    
+    if detection_confidence_min is not None and detection_confidence_min != "":
+        detection_conditions.append(PredictionDetections.confidence >= float(detection_confidence_min))
+        
+    if detection_region is not None and detection_region != "":
+        region_x1, region_y1, region_x2, region_y2 = parse_region(detection_region)
+        
+        detection_conditions += [
+            PredictionDetections.x1 < region_x2,
+            PredictionDetections.x2 > region_x1,
+            PredictionDetections.y1 < region_y2,
+            PredictionDetections.y2 > region_y1
+        ]
+    
+    if detection_conditions:
+        query = query.filter(
+            exists().where(PredictionDetections.query_id == Predictions.query_id, *detection_conditions)
+        )
+    
+    return query
+
+def parse_region(region):
+    # "x1,y1,x2,y2" in image pixels
+    region_x1, region_y1, region_x2, region_y2 = [float(value) for value in region.split(',')]
+    
+    if region_x1 >= region_x2 or region_y1 >= region_y2:
+        raise ValueError("Region must have x1 < x2 and y1 < y2.")
+    
+    return region_x1, region_y1, region_x2, region_y2
+
+def floor_time(value, granularity):
+    if granularity == 'minute':
+        return value.replace(second = 0, microsecond = 0)
+    
+    if granularity == 'hour':
+        return value.replace(minute = 0, second = 0, microsecond = 0)
+    
+    if granularity == 'day':
+        return value.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+    
+    raise ValueError(f"Not supported granularity: {granularity}")
+
+def ceil_time(value, granularity):
+    floored_value = floor_time(value, granularity)
+    
+    return floored_value if floored_value == value else floored_value + TIME_BUCKET_UNITS[granularity]
+
+def has_row_filters(
+    query_id, 
+    num_humans_min, num_humans_max, 
+    detection_confidence_min = None, detection_region = None
+):
+    # Rollups are kept per time bucket only: any other filter needs the rows
+    return any(
+        value is not None and value != "" 
+        for value in [query_id, num_humans_min, num_humans_max, detection_confidence_min, detection_region]
+    )
+
+def encode_cursor(record):
+    cursor = json.dumps([record.time.isoformat(), record.query_id])
+    
+    return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor):
+    cursor_time, cursor_query_id = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+    
+    return datetime.fromisoformat(cursor_time), int(cursor_query_id)
+
+# Session-level helpers, shared by HumanDetectorDatabase and AsyncHumanDetectorDatabase (through run_sync)
+def dialect_insert(session, model):
+    dialect_name = session.get_bind().dialect.name
+    
+    if dialect_name == 'postgresql':
+        return postgresql.insert(model)
+    
+    if dialect_name == 'sqlite':
+        return sqlite.insert(model)
+    
+    raise ValueError(f"Not supported database dialect: {dialect_name}")
+
+def dialect_greatest(session, *values):
+    # max() with several arguments is SQLite's scalar greatest
+    if session.get_bind().dialect.name == 'sqlite':
+        return func.max(*values)
+    
+    return func.greatest(*values)
+
+def detection_records(detections):
+    # Rows for the boxes of a source.core.Detections
+    return [
+        PredictionDetections(
+            x1 = x1, y1 = y1, x2 = x2, y2 = y2,
+            confidence = confidence,
+            class_id = int(class_id)
+        )
+        for (x1, y1, x2, y2), confidence, class_id in zip(
+            detections.xyxys, detections.confidences, detections.classes
+        )
+    ]
+
+def records_media_files(records):
+    return [
+        file 
+        for record in records if isinstance(record, Predictions)
+        for file in [record.query_image_file, record.result_image_file]
+    ]
+
+def add_media_references(session, files):
+    ref_counts = {}
+    
+    for file in files:
+        if file is not None:
+            ref_counts[file] = ref_counts.get(file, 0) + 1
+            
+    for file, ref_count in ref_counts.items():
+        insert_statement = dialect_insert(session, MediaFiles).values(file = file, ref_count = ref_count)
+        
+        session.execute(
+            insert_statement.on_conflict_do_update(
+                index_elements = [MediaFiles.file],
+                set_ = {'ref_count': MediaFiles.ref_count + ref_count}
+            )
+        )
+
+def release_media_references(session, files):
+    # Returns the files no record points to any more
+    ref_counts = {}
+    
+    for file in files:
+        if file is not None:
+            ref_counts[file] = ref_counts.get(file, 0) + 1
+    
+    if not ref_counts:
+        return []
+    
+    media_files = MediaFiles.__table__
+    
+    session.connection().execute(
+        update(media_files)
+            .where(media_files.c.file == bindparam('released_file'))
+            .values(ref_count = media_files.c.ref_count - bindparam('released_count')),
+        [
+            {'released_file': file, 'released_count': ref_count} 
+            for file, ref_count in ref_counts.items()
+        ]
+    )
+    
+    released_files = session.scalars(
+        select(MediaFiles.file).where(
+            MediaFiles.file.in_(list(ref_counts)), 
+            MediaFiles.ref_count <= 0
+        )
+    ).all()
+    
+    if released_files:
+        session.execute(delete(MediaFiles).where(MediaFiles.file.in_(released_files)))
+    
+    return released_files
+
+def archive_prediction_results(session, query_ids):
+    # Copies the current results of the predictions before they are replaced; their boxes are not kept
+    columns = ['query_id', 'model_version', 'num_humans', 'confidence_threshold', 'inference_time', 'detections_min_confidence']
+    
+    session.execute(
+        insert(PredictionResults).from_select(
+            columns + ['replaced_at'],
+            select(
+                *[getattr(Predictions, column) for column in columns],
+                literal(datetime.now(), DateTime)
+            ).where(Predictions.query_id.in_(query_ids))
+        )
+    )
+
+def query_replaced_results(session, after_result_id = None):
+    # (last result_id, earliest time of the predictions whose results were replaced after after_result_id);
+    # result_ids only grow, so this lets other processes see what reprocessing changed
+    last_result_id = session.scalar(select(func.max(PredictionResults.result_id))) or 0
+    
+    if after_result_id is None or last_result_id <= after_result_id:
+        return last_result_id, None
+    
+    replaced_since = session.scalar(
+        select(func.min(Predictions.time))
+            .join(PredictionResults, PredictionResults.query_id == Predictions.query_id)
+            .where(PredictionResults.result_id > after_result_id)
+    )
+    
+    return last_result_id, replaced_since
+
+def delete_prediction_rows(session, rows):
+    # rows: (query_id, query_image_file, result_image_file, time)
+    query_ids = [row[0] for row in rows]
+    
+    # Explicitly, as SQLite does not enforce the foreign key cascade
+    session.execute(
+        delete(PredictionDetections).where(PredictionDetections.query_id.in_(query_ids))
+    )
+    
+    session.execute(
+        delete(PredictionResults).where(PredictionResults.query_id.in_(query_ids))
+    )
+    
+    session.execute(
+        delete(Predictions).where(Predictions.query_id.in_(query_ids))
+    )
+    
+    refresh_rollups(session, [row[3] for row in rows if row[3] is not None])
+    
+    return release_media_references(
+        session,
+        [file for row in rows for file in row[1:3]]
+    )
+
+def delete_predictions_by_id(session, query_ids):
+    rows = session.query(
+        Predictions.query_id, Predictions.query_image_file, Predictions.result_image_file, Predictions.time
+    ).filter(Predictions.query_id.in_(query_ids)).all()
+    
+    return delete_prediction_rows(session, rows)
+
+def query_records_from_predictions(
+    session,
+    query_id,
+    time_min, time_max,
+    num_humans_min, num_humans_max,
+    page_size, page_index,
+    cursor = None,
+    total_mode = 'exact',
+    detection_confidence_min = None, detection_region = None
+):
+    query = filter_predictions(
+        session.query(Predictions),
+        query_id = query_id,
+        time_min = time_min,
+        time_max = time_max,
+        num_humans_min = num_humans_min,
+        num_humans_max = num_humans_max,
+        detection_confidence_min = detection_confidence_min,
+        detection_region = detection_region
+    )
+    
+    total = None
+    
+    # Without row filters, the day rollup counts all but the partial first and last days
+    count_from_rollups = total_mode == 'exact' and not has_row_filters(
+        query_id, num_humans_min, num_humans_max, detection_confidence_min, detection_region
+    )
+    
+    if count_from_rollups:
+        total = sum(
+            count for _, count, _, _ in query_prediction_stats(
+                session,
+                query_id = query_id,
+                time_min = time_min,
+                time_max = time_max,
+                num_humans_min = num_humans_min,
+                num_humans_max = num_humans_max,
+                granularity = 'day'
+            )
+        )
+    
+    elif total_mode == 'estimate':
+        total = estimate_count(session, query)
+    
+    elif total_mode == 'exact' and cursor is not None:
+        total = query.count()
+    
+    # Newest first; query_id breaks ties so the order is total
+    page_query = query.order_by(Predictions.time.desc(), Predictions.query_id.desc())
+    
+    if cursor is not None:
+        cursor_time, cursor_query_id = decode_cursor(cursor)
+        
+        page_query = page_query.filter(
+            tuple_(Predictions.time, Predictions.query_id) < tuple_(cursor_time, cursor_query_id)
+        )
+        
+    else:
+        page_query = page_query.offset(page_size * (page_index - 1))
+    
+    page_query = page_query.limit(page_size)
+    
+    if total_mode == 'exact' and cursor is None and not count_from_rollups:
+        # Count in the same round trip as the page
+        rows = page_query.add_columns(func.count().over()).all()
+        
+        records = [record for record, _ in rows]
+        
+        if rows:
+            total = rows[0][1]
+            
+        elif page_index == 1:
+            total = 0
+            
+        else:
+            total = query.count()
+        
+    else:
+        records = page_query.all()
+    
+    next_cursor = encode_cursor(records[-1]) if len(records) == page_size else None
+    
+    return records, total, next_cursor
+
+def time_bucket(session, granularity):
+    # Start of the minute, hour or day of each prediction
+    dialect_name = session.get_bind().dialect.name
+    
+    if dialect_name == 'postgresql':
+        return func.date_trunc(granularity, Predictions.time)
+    
+    if dialect_name == 'sqlite':
+        return func.strftime(TIME_BUCKET_FORMATS[granularity], Predictions.time)
+    
+    raise ValueError(f"Not supported database dialect: {dialect_name}")
+
+def aggregate_predictions(
+    session,
+    granularity,
+    query_id = None,
+    time_min = None, time_max = None,
+    num_humans_min = None, num_humans_max = None,
+    detection_confidence_min = None, detection_region = None,
+    time_from = None, time_to = None
+):
+    # From the rows, one per non-empty bucket, oldest first: (bucket start, count, sum, max of num_humans)
+    bucket = time_bucket(session, granularity).label('bucket')
+    
+    query = filter_predictions(
+        session.query(
+            bucket, 
+            func.count(), 
+            func.sum(Predictions.num_humans), 
+            func.max(Predictions.num_humans)
+        ),
+        query_id = query_id,
+        time_min = time_min,
+        time_max = time_max,
+        num_humans_min = num_humans_min,
+        num_humans_max = num_humans_max,
+        detection_confidence_min = detection_confidence_min,
+        detection_region = detection_region
+    )
+    
+    if time_from is not None:
+        query = query.filter(Predictions.time >= time_from)
+        
+    if time_to is not None:
+        query = query.filter(Predictions.time < time_to)
+    
+    return [
+        (
+            datetime.strptime(bucket_start, "%Y-%m-%d %H:%M:%S") if isinstance(bucket_start, str) else bucket_start,
+            count, 
+            int(sum_num_humans or 0), 
+            max_num_humans
+        )
+        for bucket_start, count, sum_num_humans, max_num_humans in query.group_by(bucket).order_by(bucket)
+    ]
+
+def read_rollups(session, granularity, time_from = None, time_to = None):
+    model = ROLLUP_MODELS[granularity]
+    
+    query = session.query(model.bucket, model.count, model.sum_num_humans, model.max_num_humans)
+    
+    if time_from is not None:
+        query = query.filter(model.bucket >= time_from)
+        
+    if time_to is not None:
+        query = query.filter(model.bucket < time_to)
+    
+    return [tuple(row) for row in query.order_by(model.bucket)]
+
+def query_prediction_stats(
+    session,
+    query_id,
+    time_min, time_max,
+    num_humans_min, num_humans_max,
+    granularity,
+    time_from = None,
+    detection_confidence_min = None, detection_region = None
+):
+    # One row per non-empty bucket, oldest first: (bucket start, count, sum, max of num_humans)
+    filters = {
+        'query_id': query_id,
+        'time_min': time_min,
+        'time_max': time_max,
+        'num_humans_min': num_humans_min,
+        'num_humans_max': num_humans_max,
+        'detection_confidence_min': detection_confidence_min,
+        'detection_region': detection_region
+    }
+    
+    if has_row_filters(query_id, num_humans_min, num_humans_max, detection_confidence_min, detection_region):
+        return aggregate_predictions(session, granularity, time_from = time_from, **filters)
+    
+    start_times = [
+        value for value in [
+            datetime.strptime(time_min, "%Y-%m-%d_%H-%M-%S") if time_min else None,
+            time_from
+        ] 
+        if value is not None
+    ]
+    
+    start_time = max(start_times) if start_times else None
+    end_time = datetime.strptime(time_max, "%Y-%m-%d_%H-%M-%S") if time_max else None
+    
+    # Buckets wholly in range come from the rollup; only the partial first and last ones from the rows
+    full_from = ceil_time(start_time, granularity) if start_time is not None else None
+    full_to = floor_time(end_time, granularity) if end_time is not None else None
+    
+    if full_from is not None and full_to is not None and full_from >= full_to:
+        return aggregate_predictions(session, granularity, time_from = time_from, **filters)
+    
+    series = []
+    
+    if start_time is not None and start_time < full_from:
+        series += aggregate_predictions(session, granularity, time_from = start_time, time_to = full_from, **filters)
+    
+    series += read_rollups(session, granularity, time_from = full_from, time_to = full_to)
+    
+    if end_time is not None:
+        series += aggregate_predictions(session, granularity, time_from = full_to, **filters)
+    
+    return series
+
+def add_rollups(session, records):
+    records = [record for record in records if isinstance(record, Predictions) and record.time is not None]
+    
+    for granularity, model in ROLLUP_MODELS.items():
+        buckets = {}
+        
+        for record in records:
+            bucket = floor_time(record.time, granularity)
+            count, sum_num_humans, max_num_humans = buckets.get(bucket, (0, 0, 0))
+            
+            buckets[bucket] = (
+                count + 1, 
+                sum_num_humans + record.num_humans, 
+                max(max_num_humans, record.num_humans)
+            )
+        
+        for bucket, (count, sum_num_humans, max_num_humans) in buckets.items():
+            insert_statement = dialect_insert(session, model).values(
+                bucket = bucket, 
+                count = count, 
+                sum_num_humans = sum_num_humans, 
+                max_num_humans = max_num_humans
+            )
+            
+            session.execute(
+                insert_statement.on_conflict_do_update(
+                    index_elements = [model.bucket],
+                    set_ = {
+                        'count': model.count + insert_statement.excluded.count,
+                        'sum_num_humans': model.sum_num_humans + insert_statement.excluded.sum_num_humans,
+                        'max_num_humans': dialect_greatest(
+                            session, model.max_num_humans, insert_statement.excluded.max_num_humans
+                        )
+                    }
+                )
+            )
+
+def rebuild_rollup(session, granularity, time_from = None, time_to = None):
+    # Recomputes the buckets in [time_from, time_to) from the rows; bounds are bucket-aligned
+    model = ROLLUP_MODELS[granularity]
+    
+    delete_statement = delete(model)
+    
+    if time_from is not None:
+        delete_statement = delete_statement.where(model.bucket >= time_from)
+        
+    if time_to is not None:
+        delete_statement = delete_statement.where(model.bucket < time_to)
+    
+    session.execute(delete_statement)
+    
+    rows = aggregate_predictions(session, granularity, time_from = time_from, time_to = time_to)
+    
+    if rows:
+        session.execute(
+            model.__table__.insert(),
+            [
+                {
+                    'bucket': bucket, 
+                    'count': count, 
+                    'sum_num_humans': sum_num_humans, 
+                    'max_num_humans': max_num_humans
+                }
+                for bucket, count, sum_num_humans, max_num_humans in rows
+                if bucket is not None
+            ]
+        )
+
+def rebuild_rollups(session, time_from = None, time_to = None):
+    for granularity in ROLLUP_MODELS:
+        rebuild_rollup(
+            session, 
+            granularity,
+            time_from = floor_time(time_from, granularity) if time_from is not None else None,
+            time_to = ceil_time(time_to, granularity) if time_to is not None else None
+        )
+
+def refresh_rollups(session, times):
+    # After deletes: a max cannot be decremented, so the touched buckets are recomputed,
+    # adjacent ones in a single range
+    for granularity in ROLLUP_MODELS:
+        unit = TIME_BUCKET_UNITS[granularity]
+        
+        ranges = []
+        
+        for bucket in sorted({floor_time(value, granularity) for value in times}):
+            if ranges and ranges[-1][1] == bucket:
+                ranges[-1][1] = bucket + unit
+                
+            else:
+                ranges.append([bucket, bucket + unit])
+        
+        for time_from, time_to in ranges:
+            rebuild_rollup(session, granularity, time_from = time_from, time_to = time_to)
+
+def count_detections(session, query_ids, confidence_threshold):
+    # Humans per prediction at another threshold, from the stored boxes; None where boxes
+    # were not stored down to that threshold
+    floors = dict(
+        session.query(Predictions.query_id, Predictions.detections_min_confidence)
+            .filter(Predictions.query_id.in_(query_ids))
+    )
+    
+    counts = dict(
+        session.query(PredictionDetections.query_id, func.count())
+            .filter(
+                PredictionDetections.query_id.in_(query_ids),
+                PredictionDetections.confidence >= confidence_threshold
+            )
+            .group_by(PredictionDetections.query_id)
+    )
+    
+    return {
+        query_id: counts.get(query_id, 0) if floor is not None and floor <= confidence_threshold else None
+        for query_id, floor in floors.items()
+    }
+
+def estimate_count(session, query):
+    # Planner row estimate on Postgres; other databases count exactly
+    dialect = session.get_bind().dialect
+    
+    if dialect.name != 'postgresql':
+        return query.count()
+    
+    explain_sql, explain_params = explain_statement(query.statement, dialect)
+    
+    plan = session.connection().exec_driver_sql(explain_sql, explain_params).scalar()
+    
+    # asyncpg hands back the JSON column as text
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def explain_statement(statement, dialect):
+    # exec_driver_sql skips SQLAlchemy's parameter handling, so positional drivers
+    # (asyncpg) need the values in bind order rather than the dict
+    compiled_statement = statement.compile(dialect = dialect)
+    explain_params = compiled_statement.params
+    
+    if compiled_statement.positional:
+        explain_params = tuple(explain_params[name] for name in compiled_statement.positiontup)
+    
+    return f'EXPLAIN (FORMAT JSON) {compiled_statement}', explain_params
+
 class HumanDetectorDatabase:
-    def __init__(self, database_url):
-        self.engine = create_engine(database_url)
-        self.Session = sessionmaker(bind = self.engine)
+    def __init__(
+        self, 
+        database_url, 
+        pool_size = 10, 
+        max_overflow = 20, 
+        pool_timeout = 30, 
+        pool_recycle = 1800
+    ):
+        dialect_name = make_url(database_url).get_backend_name()
+        
+        if dialect_name not in SUPPORTED_DIALECTS:
+            raise ValueError(f"Not supported database dialect: {dialect_name}")
+        
+        if dialect_name == 'sqlite':
+            # SQLite picks its own pool class, which may not take these options
+            self.engine = create_engine(database_url)
+            
+        else:
+            self.engine = create_engine(
+                database_url,
+                pool_size = pool_size,
+                max_overflow = max_overflow,
+                pool_timeout = pool_timeout,
+                pool_recycle = pool_recycle,
+                pool_pre_ping = True
+            )
+            
+        self.Session = sessionmaker(bind = self.engine, expire_on_commit = False)
                 
     def create_tables(self):
+        is_new_database = not inspect(self.engine).has_table(Predictions.__tablename__)
+        
         Base.metadata.create_all(self.engine)
+        
+        # A schema created from the models is already at the latest version
+        if is_new_database:
+            migrations.stamp(self.engine)
+            
+        else:
+            self.migrate()
+    
+    def migrate(self):
+        return migrations.migrate(self.engine)
 
     def drop_tables(self):
         Base.metadata.drop_all(self.engine)
 
     def add_record(self, record):
+        self.add_records([record])
+
+    def add_records(self, records):
         with self.Session() as session:
-            session.add(record)
+            session.add_all(records)
+            
+            add_media_references(session, records_media_files(records))
+            add_rollups(session, records)
+            
             session.commit()
 
     def get_record_by_id(self, model, record_id):
@@ -35,54 +699,305 @@ class HumanDetectorDatabase:
         query_id: int | None,
         time_min, time_max,
         num_humans_min, num_humans_max,
-        page_size, page_index
+        page_size, page_index,
+        cursor = None,
+        total_mode = 'exact',
+        detection_confidence_min = None, detection_region = None
+    ):
+        with self.Session() as session:
+            return query_records_from_predictions(
+                session,
+                query_id = query_id,
+                time_min = time_min,
+                time_max = time_max,
+                num_humans_min = num_humans_min,
+                num_humans_max = num_humans_max,
+                page_size = page_size,
+                page_index = page_index,
+                cursor = cursor,
+                total_mode = total_mode,
+                detection_confidence_min = detection_confidence_min,
+                detection_region = detection_region
+            )
+    
+    def get_prediction_stats(
+        self,
+        query_id: int | None,
+        time_min, time_max,
+        num_humans_min, num_humans_max,
+        granularity,
+        time_from = None,
+        detection_confidence_min = None, detection_region = None
     ):
         with self.Session() as session:
-            query = session.query(Predictions)
+            return query_prediction_stats(
+                session,
+                query_id = query_id,
+                time_min = time_min,
+                time_max = time_max,
+                num_humans_min = num_humans_min,
+                num_humans_max = num_humans_max,
+                granularity = granularity,
+                time_from = time_from,
+                detection_confidence_min = detection_confidence_min,
+                detection_region = detection_region
+            )
+    
+    def count_detections(self, query_ids, confidence_threshold):
+        with self.Session() as session:
+            return count_detections(session, query_ids, confidence_threshold)
+    
+    def rebuild_rollups(self, time_from = None, time_to = None):
+        with self.Session() as session:
+            rebuild_rollups(session, time_from = time_from, time_to = time_to)
+            
+            session.commit()
+    
+    def _to_reprocess(self, query, model_version):
+        return query.filter(
+            or_(Predictions.model_version.is_(None), Predictions.model_version != model_version)
+        )
+    
+    def count_predictions_to_reprocess(self, model_version):
+        with self.Session() as session:
+            return self._to_reprocess(session.query(Predictions), model_version).count()
+    
+    def get_predictions_to_reprocess(self, model_version, after_query_id, limit):
+        # Rows not scored by model_version yet, in query_id order from a checkpoint
+        with self.Session() as session:
+            return self._to_reprocess(
+                session.query(Predictions.query_id, Predictions.query_image_file, Predictions.confidence_threshold), 
+                model_version
+            ).filter(
+                Predictions.query_id > after_query_id
+            ).order_by(
+                Predictions.query_id
+            ).limit(limit).all()
+    
+    def update_prediction_results(self, results):
+        # results: dicts of query_id, num_humans, confidence_threshold, inference_time, model_version,
+        # detections_min_confidence and detections (PredictionDetections); replaces the current results
+        # of those predictions, which are kept in prediction_results
+        query_ids = [result['query_id'] for result in results]
+        
+        with self.Session() as session:
+            times = session.scalars(
+                select(Predictions.time).where(Predictions.query_id.in_(query_ids))
+            ).all()
             
-            if query_id is not None and query_id != "":
-                query = query.filter(Predictions.query_id == query_id)
+            archive_prediction_results(session, query_ids)
             
-            if time_min is not None and time_min != "":
-                query = query.filter(Predictions.time >= datetime.strptime(time_min, "%Y-%m-%d_%H-%M-%S"))
+            session.execute(
+                delete(PredictionDetections).where(PredictionDetections.query_id.in_(query_ids))
+            )
             
-            if time_max is not None and time_max != "":
-                query = query.filter(Predictions.time <= datetime.strptime(time_max, "%Y-%m-%d_%H-%M-%S"))
+            # Bulk UPDATE by primary key
+            session.execute(
+                update(Predictions),
+                [
+                    {key: value for key, value in result.items() if key != 'detections'} 
+                    for result in results
+                ]
+            )
             
-            if num_humans_min is not None and num_humans_min != "":
-                query = query.filter(Predictions.num_humans >= int(num_humans_min))
-                
-            if num_humans_max is not None and num_humans_max != "":
-                query = query.filter(Predictions.num_humans <= int(num_humans_max))
-                
-            total = query.count()
+            for result in results:
+                for detection in result['detections']:
+                    detection.query_id = result['query_id']
+                    
+                session.add_all(result['detections'])
             
-            records = query.limit(page_size).offset(page_size * (page_index - 1)).all()
-        
-        return records, total
+            refresh_rollups(session, [value for value in times if value is not None])
+            
+            session.commit()
     
     def update_record(self, model, record_id, **kwargs):
         with self.Session() as session:
             record = session.query(model).get(record_id)
             if record:
+                previous_time = getattr(record, 'time', None)
+                
                 for key, value in kwargs.items():
                     setattr(record, key, value)
+                    
+                if isinstance(record, Predictions):
+                    session.flush()
+                    
+                    refresh_rollups(session, [value for value in [previous_time, record.time] if value is not None])
+                    
                 session.commit()
 
     def delete_record(self, model, record_id):
+        # Predictions also release their media references, rollups and boxes
+        if model is Predictions:
+            return self.delete_predictions([record_id])
+        
         with self.Session() as session:
             record = session.query(model).get(record_id)
             if record:
                 session.delete(record)
                 session.commit()
+
+    def delete_predictions(self, query_ids):
+        with self.Session() as session:
+            released_files = delete_predictions_by_id(session, query_ids)
+                
+            session.commit()
+        
+        return released_files
+
+    def delete_predictions_before(self, cutoff_time, batch_size):
+        # Oldest first, one bounded batch per transaction; returns (deleted rows, released files)
+        with self.Session() as session:
+            rows = session.query(
+                Predictions.query_id, Predictions.query_image_file, Predictions.result_image_file, Predictions.time
+            ).filter(
+                Predictions.time < cutoff_time
+            ).order_by(
+                Predictions.time, Predictions.query_id
+            ).limit(batch_size).all()
+            
+            if not rows:
+                return 0, []
+            
+            released_files = delete_prediction_rows(session, rows)
+            
+            session.commit()
+        
+        return len(rows), released_files
+
+    def referenced_media_files(self, files):
+        # The files at least one row still points to
+        if not files:
+            return set()
+        
+        with self.Session() as session:
+            return set(
+                session.scalars(
+                    select(MediaFiles.file).where(
+                        MediaFiles.file.in_(list(files)), 
+                        MediaFiles.ref_count > 0
+                    )
+                ).all()
+            )
+
+    def rebuild_media_references(self):
+        with self.Session() as session:
+            session.query(MediaFiles).delete()
+            
+            ref_counts = {}
+            
+            for query_image_file, result_image_file in session.query(
+                Predictions.query_image_file, Predictions.result_image_file
+            ):
+                for file in [query_image_file, result_image_file]:
+                    if file is not None:
+                        ref_counts[file] = ref_counts.get(file, 0) + 1
+            
+            session.add_all(
+                [
+                    MediaFiles(file = file, ref_count = ref_count) 
+                    for file, ref_count in ref_counts.items()
+                ]
+            )
+            
+            session.commit()
         
 class Predictions(Base):
     __tablename__ = 'predictions'
+    
+    # Match the history filters and order; existing databases get them from migrations
+    __table_args__ = (
+        Index('ix_predictions_time_query_id', 'time', 'query_id'),
+        Index('ix_predictions_num_humans_time', 'num_humans', 'time')
+    )
 
     query_id = Column(Integer, primary_key = True)
     time = Column(DateTime)
     
-    query_image_file = Column(String(64))
-    result_image_file = Column(String(64))
+    query_image_file = Column(String(255))
+    result_image_file = Column(String(255))
+    num_humans = Column(Integer)
+    
+    image_width = Column(Integer)
+    image_height = Column(Integer)
+    model_version = Column(String(255))
+    
+    # Milliseconds
+    inference_time = Column(Float)
+    
+    # Boxes are stored down to this confidence; None for predictions from before they were stored
+    detections_min_confidence = Column(Float)
+    
+    # Confidence num_humans is counted at; None for predictions from before it was stored
+    confidence_threshold = Column(Float)
+    
+    # Written in bulk with the prediction; never loaded implicitly
+    detections = relationship('PredictionDetections', lazy = 'raise', passive_deletes = True)
+
+class PredictionDetections(Base):
+    __tablename__ = 'detections'
+    
+    # Boxes of a prediction, and counts above a threshold
+    __table_args__ = (
+        Index('ix_detections_query_id_confidence', 'query_id', 'confidence'),
+    )
+    
+    detection_id = Column(Integer, primary_key = True)
+    query_id = Column(Integer, ForeignKey('predictions.query_id', ondelete = 'CASCADE'), nullable = False)
+    
+    # Corners in image pixels
+    x1 = Column(Float, nullable = False)
+    y1 = Column(Float, nullable = False)
+    x2 = Column(Float, nullable = False)
+    y2 = Column(Float, nullable = False)
+    
+    confidence = Column(Float, nullable = False)
+    class_id = Column(Integer, nullable = False)
+
+class PredictionResults(Base):
+    __tablename__ = 'prediction_results'
+    
+    # Earlier results of a prediction, kept when reprocessing replaces them
+    __table_args__ = (
+        Index('ix_prediction_results_query_id', 'query_id'),
+    )
+    
+    result_id = Column(Integer, primary_key = True)
+    query_id = Column(Integer, ForeignKey('predictions.query_id', ondelete = 'CASCADE'), nullable = False)
+    
+    model_version = Column(String(255))
     num_humans = Column(Integer)
-    
\ No newline at end of file
+    confidence_threshold = Column(Float)
+    inference_time = Column(Float)
+    detections_min_confidence = Column(Float)
+    
+    replaced_at = Column(DateTime, nullable = False)
+
+class MediaFiles(Base):
+    __tablename__ = 'media_files'
+    
+    file = Column(String(255), primary_key = True)
+    ref_count = Column(Integer, nullable = False, default = 0)
+    
+class RollupColumns:
+    # Occupancy per time bucket, maintained with every insert and delete of Predictions
+    bucket = Column(DateTime, primary_key = True)
+    
+    count = Column(Integer, nullable = False)
+    sum_num_humans = Column(Integer, nullable = False)
+    max_num_humans = Column(Integer, nullable = False)
+
+class PredictionsRollupMinute(RollupColumns, Base):
+    __tablename__ = 'predictions_rollup_minute'
+
+class PredictionsRollupHour(RollupColumns, Base):
+    __tablename__ = 'predictions_rollup_hour'
+
+class PredictionsRollupDay(RollupColumns, Base):
+    __tablename__ = 'predictions_rollup_day'
+
+ROLLUP_MODELS = {
+    'minute': PredictionsRollupMinute,
+    'hour': PredictionsRollupHour,
+    'day': PredictionsRollupDay
+}
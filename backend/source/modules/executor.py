@@ -0,0 +1,92 @@
+import time
+import asyncio
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from source.utils.metrics import Histogram
+
+class ExecutorQueueFullError(Exception):
+    pass
+
+def _timed_call(fn, args, kwargs):
+    started_at = time.monotonic()
+    
+    result = fn(*args, **kwargs)
+    
+    return result, started_at, time.monotonic()
+
+class BoundedExecutor():
+    def __init__(self, executor_type, max_workers, max_queue_size):
+        if executor_type == 'thread':
+            self._executor = ThreadPoolExecutor(
+                max_workers = max_workers,
+                thread_name_prefix = 'inference'
+            )
+            
+        elif executor_type == 'process':
+            # Callables and arguments are pickled into the workers
+            self._executor = ProcessPoolExecutor(
+                max_workers = max_workers
+            )
+            
+        else:
+            raise ValueError(f"Not supported executor type: {executor_type}")
+        
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        
+        self._lock = threading.Lock()
+        self._num_in_flight = 0
+        self._num_completed = 0
+        self._num_rejected = 0
+        
+        self.wait_time = Histogram()
+        self.execution_time = Histogram()
+    
+    @property
+    def queue_depth(self):
+        return max(0, self._num_in_flight - self.max_workers)
+    
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._num_in_flight >= self.max_workers + self.max_queue_size:
+                self._num_rejected += 1
+                
+                raise ExecutorQueueFullError()
+            
+            self._num_in_flight += 1
+        
+        try:
+            submitted_at = time.monotonic()
+            
+            result, started_at, finished_at = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed_call, fn, args, kwargs
+            )
+            
+            self.wait_time.observe(started_at - submitted_at)
+            self.execution_time.observe(finished_at - started_at)
+            
+            return result
+        
+        finally:
+            with self._lock:
+                self._num_in_flight -= 1
+                self._num_completed += 1
+    
+    def stats(self):
+        return {
+            'executor_type': self.executor_type,
+            'max_workers': self.max_workers,
+            'max_queue_size': self.max_queue_size,
+            'in_flight': self._num_in_flight,
+            'queue_depth': self.queue_depth,
+            'completed': self._num_completed,
+            'rejected': self._num_rejected,
+            'wait_time': self.wait_time.snapshot(),
+            'execution_time': self.execution_time.snapshot()
+        }
+    
+    def shutdown(self, wait = True):
+        self._executor.shutdown(wait = wait)
@@ -0,0 +1,123 @@
+import time
+import threading
+
+from collections import OrderedDict
+
+# Rough in-memory footprint of a cached entry and of each box it holds
+ENTRY_OVERHEAD_BYTES = 512
+BOX_BYTES = 480
+
+class InferenceCache():
+    def __init__(self, max_bytes, ttl_seconds, min_confidence_threshold):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        
+        # Entries hold every box above this threshold, so any higher one is a filter away
+        self.min_confidence_threshold = min_confidence_threshold
+        
+        self._lock = threading.Lock()
+        
+        # By (model_id, image_hash), so that loaded models share one budget
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_bypassed = 0
+        self._num_evicted = 0
+        self._num_expired = 0
+        self._num_invalidated = 0
+    
+    def invalidate(self, model_id):
+        # Entries of replaced or unloaded weights would otherwise wait for eviction
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == model_id]
+            
+            for key in keys:
+                self._num_bytes -= self._entries.pop(key)[1]
+            
+            if keys:
+                self._num_invalidated += 1
+    
+    def get(self, image_hash, model_id, confidence_threshold):
+        if confidence_threshold < self.min_confidence_threshold:
+            with self._lock:
+                self._num_bypassed += 1
+                
+            return None
+        
+        key = (model_id, image_hash)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            
+            if entry is None:
+                self._num_misses += 1
+                
+                return None
+            
+            detections, num_bytes, expires_at = entry
+            
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._num_bytes -= num_bytes
+                
+                self._num_expired += 1
+                self._num_misses += 1
+                
+                return None
+            
+            self._entries.move_to_end(key)
+            self._num_hits += 1
+        
+        detections = detections.filter(confidence_threshold)
+        
+        # Served without running the model
+        detections.inference_time = 0.0
+        
+        return detections
+    
+    def put(self, image_hash, model_id, detections):
+        num_bytes = ENTRY_OVERHEAD_BYTES + BOX_BYTES * len(detections)
+        
+        if num_bytes > self.max_bytes:
+            return
+        
+        key = (model_id, image_hash)
+        
+        with self._lock:
+            if key in self._entries:
+                self._num_bytes -= self._entries.pop(key)[1]
+            
+            self._entries[key] = (detections, num_bytes, time.monotonic() + self.ttl_seconds)
+            self._num_bytes += num_bytes
+            
+            # Least recently used entries go first
+            while self._num_bytes > self.max_bytes:
+                _, (_, evicted_bytes, _) = self._entries.popitem(last = False)
+                
+                self._num_bytes -= evicted_bytes
+                self._num_evicted += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+    
+    def stats(self):
+        num_lookups = self._num_hits + self._num_misses
+        
+        return {
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'min_confidence_threshold': self.min_confidence_threshold,
+            'entries': len(self._entries),
+            'bytes': self._num_bytes,
+            'hits': self._num_hits,
+            'misses': self._num_misses,
+            'hit_rate': self._num_hits / num_lookups if num_lookups else 0.0,
+            'bypassed': self._num_bypassed,
+            'evicted': self._num_evicted,
+            'expired': self._num_expired,
+            'invalidated': self._num_invalidated
+        }
@@ -0,0 +1,150 @@
+import os
+import glob
+import hashlib
+import tempfile
+import threading
+
+from PIL import Image
+
+from source.utils.image import IMAGE_EXTENSIONS, encode_pilimage
+
+# Folders of content-addressed media, the only ones served by path
+MEDIA_FOLDERS = ['queries', 'results']
+
+def content_hash(image_data):
+    return hashlib.sha256(image_data).hexdigest()
+
+class MediaStorage():
+    def __init__(self, root_folder):
+        self.root_folder = root_folder
+        
+        # Held while released files are unlinked and while files are restored after a commit,
+        # so that a file referenced again is never unlinked behind its new row
+        self.lock = threading.Lock()
+    
+    def content_file(self, folder, file_hash, extension):
+        # Sharded by the first two byte pairs of the hash to keep directories small
+        return os.path.join(
+            self.root_folder,
+            folder,
+            file_hash[:2],
+            file_hash[2:4],
+            f'{file_hash}{extension}'
+        )
+    
+    def _write(self, save_file, image_data):
+        save_folder = os.path.dirname(save_file)
+        os.makedirs(save_folder, exist_ok = True)
+        
+        # Write then rename, so a file under a content name is always complete
+        file_descriptor, temp_file = tempfile.mkstemp(dir = save_folder, suffix = '.tmp')
+        
+        try:
+            with os.fdopen(file_descriptor, 'wb') as file:
+                file.write(image_data)
+                
+            os.replace(temp_file, save_file)
+            
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+                
+            raise
+    
+    def store(self, folder, image_data, extension, file_hash = None):
+        if file_hash is None:
+            file_hash = content_hash(image_data)
+            
+        save_file = self.content_file(folder, file_hash, extension)
+        
+        # Identical content is already stored under the same name
+        if os.path.exists(save_file):
+            return save_file, False
+        
+        self._write(save_file, image_data)
+        
+        return save_file, True
+    
+    def relative_path(self, file):
+        # Path under the root, as used in media URLs; None for files stored elsewhere
+        relative_path = os.path.relpath(file, self.root_folder)
+        
+        if relative_path.startswith(os.pardir) or os.path.isabs(relative_path):
+            return None
+        
+        return relative_path.replace(os.sep, '/')
+    
+    def resolve(self, relative_path):
+        # Untrusted path from a URL: only files inside the media folders, never outside the root
+        parts = relative_path.split('/')
+        
+        if len(parts) < 2 or parts[0] not in MEDIA_FOLDERS or any(part in ['', '.', '..'] for part in parts):
+            return None
+        
+        media_folder = os.path.realpath(os.path.join(self.root_folder, parts[0]))
+        media_file = os.path.realpath(os.path.join(self.root_folder, *parts))
+        
+        if os.path.commonpath([media_folder, media_file]) != media_folder or not os.path.isfile(media_file):
+            return None
+        
+        return media_file
+    
+    def thumbnail_file(self, relative_path, size, format):
+        stem = os.path.splitext(relative_path)[0]
+        
+        return os.path.join(
+            self.root_folder, 
+            'thumbnails', 
+            str(size), 
+            *stem.split('/')
+        ) + IMAGE_EXTENSIONS[format]
+    
+    def thumbnail(self, relative_path, size, format = 'WEBP', quality = 80):
+        # Made on first request and kept on disk; None if the media does not exist
+        media_file = self.resolve(relative_path)
+        
+        if media_file is None:
+            return None
+        
+        thumbnail_file = self.thumbnail_file(relative_path, size, format)
+        
+        if os.path.exists(thumbnail_file):
+            return thumbnail_file
+        
+        with Image.open(media_file) as pilimage:
+            # JPEG decodes at a reduced scale when asked for a small size
+            pilimage.draft('RGB', (size, size))
+            pilimage.thumbnail((size, size))
+            
+            image_data = encode_pilimage(pilimage, format = format, quality = quality)
+        
+        self._write(thumbnail_file, image_data)
+        
+        return thumbnail_file
+    
+    def remove(self, files):
+        for file in files:
+            if file is not None and os.path.exists(file):
+                os.remove(file)
+            
+            relative_path = self.relative_path(file) if file is not None else None
+            
+            # Thumbnails of every size and format
+            if relative_path is not None:
+                stem = os.path.splitext(relative_path)[0]
+                
+                for thumbnail_file in glob.glob(
+                    os.path.join(glob.escape(self.root_folder), 'thumbnails', '*', glob.escape(stem) + '.*')
+                ):
+                    os.remove(thumbnail_file)
+    
+    def remove_released(self, files, referenced_files):
+        # An identical upload may have referenced a released file again since its release committed.
+        # `referenced_files` re-reads the reference counts, and only files still at 0 are removed
+        with self.lock:
+            referenced = referenced_files(files)
+            removed_files = [file for file in files if file not in referenced]
+            
+            self.remove(removed_files)
+        
+        return removed_files
@@ -0,0 +1,124 @@
+import time
+import queue
+import asyncio
+import threading
+import traceback
+
+from source.utils.metrics import Histogram
+
+class MediaWriterQueueFullError(Exception):
+    pass
+
+class MediaWriter():
+    def __init__(self, num_threads, max_queue_size, put_timeout):
+        self.num_threads = num_threads
+        self.max_queue_size = max_queue_size
+        self.put_timeout = put_timeout
+        
+        self._queue = queue.Queue(maxsize = max_queue_size)
+        
+        self._lock = threading.Lock()
+        self._num_written = 0
+        self._num_failed = 0
+        self._num_backpressured = 0
+        self._num_rejected = 0
+        
+        self.queue_wait = Histogram()
+        self.flush_latency = Histogram()
+        self.backpressure_wait = Histogram()
+        
+        # Started by `start`, so that importing the API starts no threads
+        self._threads = []
+    
+    def start(self):
+        self._threads = [
+            threading.Thread(
+                target = self._work,
+                name = f'media-writer-{index}',
+                daemon = True
+            )
+            for index in range(self.num_threads)
+        ]
+        
+        for thread in self._threads:
+            thread.start()
+    
+    async def submit(self, fn, *args, **kwargs):
+        job = (fn, args, kwargs, time.monotonic())
+        
+        try:
+            self._queue.put_nowait(job)
+            
+            return
+        
+        except queue.Full:
+            with self._lock:
+                self._num_backpressured += 1
+        
+        # Queue full: wait for room off the event loop, up to put_timeout
+        started_at = time.monotonic()
+        
+        try:
+            await asyncio.to_thread(self._queue.put, job, True, self.put_timeout)
+            
+        except queue.Full:
+            with self._lock:
+                self._num_rejected += 1
+                
+            raise MediaWriterQueueFullError()
+        
+        finally:
+            self.backpressure_wait.observe(time.monotonic() - started_at)
+    
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            
+            try:
+                if job is None:
+                    return
+                
+                fn, args, kwargs, submitted_at = job
+                
+                started_at = time.monotonic()
+                self.queue_wait.observe(started_at - submitted_at)
+                
+                try:
+                    fn(*args, **kwargs)
+                    
+                    with self._lock:
+                        self._num_written += 1
+                        
+                except Exception:
+                    with self._lock:
+                        self._num_failed += 1
+                        
+                    print("Media write failed ...")
+                    traceback.print_exc()
+                
+                self.flush_latency.observe(time.monotonic() - started_at)
+            
+            finally:
+                self._queue.task_done()
+    
+    def close(self):
+        # Jobs queued before the sentinels are still written
+        for _ in self._threads:
+            self._queue.put(None)
+            
+        for thread in self._threads:
+            thread.join()
+    
+    def stats(self):
+        return {
+            'num_threads': self.num_threads,
+            'max_queue_size': self.max_queue_size,
+            'queue_depth': self._queue.qsize(),
+            'written': self._num_written,
+            'failed': self._num_failed,
+            'backpressured': self._num_backpressured,
+            'rejected': self._num_rejected,
+            'queue_wait': self.queue_wait.snapshot(),
+            'flush_latency': self.flush_latency.snapshot(),
+            'backpressure_wait': self.backpressure_wait.snapshot()
+        }
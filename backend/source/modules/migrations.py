@@ -0,0 +1,181 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+# Every step is idempotent and safe to run while the API serves traffic:
+# columns are added nullable without defaults, and indexes are built
+# CONCURRENTLY on PostgreSQL, so no step holds a long table lock.
+
+def _add_column(connection, table, column, column_type):
+    if column in [existing['name'] for existing in inspect(connection).get_columns(table)]:
+        return
+    
+    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}'))
+
+def _create_index(connection, name, table, columns):
+    concurrently = 'CONCURRENTLY ' if connection.dialect.name == 'postgresql' else ''
+    
+    connection.execute(
+        text(f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({", ".join(columns)})')
+    )
+
+def widen_media_file_columns(connection):
+    if connection.dialect.name == 'postgresql':
+        for column in ['query_image_file', 'result_image_file']:
+            connection.execute(
+                text(f'ALTER TABLE predictions ALTER COLUMN {column} TYPE VARCHAR(255)')
+            )
+
+def create_media_files_table(connection):
+    connection.execute(
+        text(
+            'CREATE TABLE IF NOT EXISTS media_files ('
+            'file VARCHAR(255) PRIMARY KEY, '
+            'ref_count INTEGER NOT NULL)'
+        )
+    )
+
+def create_history_indexes(connection):
+    # Time range filters and the (time, query_id) history order
+    _create_index(connection, 'ix_predictions_time_query_id', 'predictions', ['time', 'query_id'])
+    
+    # Human count filters, then time within a count
+    _create_index(connection, 'ix_predictions_num_humans_time', 'predictions', ['num_humans', 'time'])
+
+def add_prediction_metadata_columns(connection):
+    float_type = 'DOUBLE PRECISION' if connection.dialect.name == 'postgresql' else 'FLOAT'
+    
+    _add_column(connection, 'predictions', 'image_width', 'INTEGER')
+    _add_column(connection, 'predictions', 'image_height', 'INTEGER')
+    _add_column(connection, 'predictions', 'model_version', 'VARCHAR(255)')
+    _add_column(connection, 'predictions', 'inference_time', float_type)
+
+def create_rollup_tables(connection):
+    for granularity in ['minute', 'hour', 'day']:
+        connection.execute(
+            text(
+                f'CREATE TABLE IF NOT EXISTS predictions_rollup_{granularity} ('
+                'bucket TIMESTAMP PRIMARY KEY, '
+                'count INTEGER NOT NULL, '
+                'sum_num_humans INTEGER NOT NULL, '
+                'max_num_humans INTEGER NOT NULL)'
+            )
+        )
+    
+    # Filled from the existing rows once; inserts and deletes keep them current from here.
+    # Imported here, as the database module imports this one
+    from source.modules.database import rebuild_rollups
+    
+    with Session(bind = connection) as session:
+        rebuild_rollups(session)
+        
+        session.commit()
+
+def create_detections_table(connection):
+    is_postgresql = connection.dialect.name == 'postgresql'
+    
+    float_type = 'DOUBLE PRECISION' if is_postgresql else 'FLOAT'
+    id_type = 'SERIAL' if is_postgresql else 'INTEGER'
+    
+    connection.execute(
+        text(
+            'CREATE TABLE IF NOT EXISTS detections ('
+            f'detection_id {id_type} PRIMARY KEY, '
+            'query_id INTEGER NOT NULL REFERENCES predictions (query_id) ON DELETE CASCADE, '
+            f'x1 {float_type} NOT NULL, y1 {float_type} NOT NULL, '
+            f'x2 {float_type} NOT NULL, y2 {float_type} NOT NULL, '
+            f'confidence {float_type} NOT NULL, '
+            'class_id INTEGER NOT NULL)'
+        )
+    )
+    
+    _create_index(connection, 'ix_detections_query_id_confidence', 'detections', ['query_id', 'confidence'])
+    
+    _add_column(connection, 'predictions', 'detections_min_confidence', float_type)
+
+def create_prediction_results_table(connection):
+    is_postgresql = connection.dialect.name == 'postgresql'
+    
+    float_type = 'DOUBLE PRECISION' if is_postgresql else 'FLOAT'
+    id_type = 'SERIAL' if is_postgresql else 'INTEGER'
+    
+    _add_column(connection, 'predictions', 'confidence_threshold', float_type)
+    
+    connection.execute(
+        text(
+            'CREATE TABLE IF NOT EXISTS prediction_results ('
+            f'result_id {id_type} PRIMARY KEY, '
+            'query_id INTEGER NOT NULL REFERENCES predictions (query_id) ON DELETE CASCADE, '
+            'model_version VARCHAR(255), '
+            'num_humans INTEGER, '
+            f'confidence_threshold {float_type}, '
+            f'inference_time {float_type}, '
+            f'detections_min_confidence {float_type}, '
+            'replaced_at TIMESTAMP NOT NULL)'
+        )
+    )
+    
+    _create_index(connection, 'ix_prediction_results_query_id', 'prediction_results', ['query_id'])
+
+MIGRATIONS = [
+    (1, "Widen media file columns", widen_media_file_columns),
+    (2, "Media reference counts", create_media_files_table),
+    (3, "History filter indexes", create_history_indexes),
+    (4, "Prediction metadata columns", add_prediction_metadata_columns),
+    (5, "Occupancy rollup tables", create_rollup_tables),
+    (6, "Detection boxes", create_detections_table),
+    (7, "Prediction thresholds and earlier results", create_prediction_results_table)
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _create_version_table(connection):
+    connection.execute(
+        text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version INTEGER PRIMARY KEY, '
+            'description VARCHAR(255) NOT NULL, '
+            'applied_at TIMESTAMP NOT NULL)'
+        )
+    )
+
+def _record_version(connection, version, description):
+    connection.execute(
+        text('INSERT INTO schema_migrations (version, description, applied_at) VALUES (:version, :description, :applied_at)'),
+        {'version': version, 'description': description, 'applied_at': datetime.now()}
+    )
+
+def get_applied_versions(engine):
+    with engine.begin() as connection:
+        _create_version_table(connection)
+        
+        return set(connection.execute(text('SELECT version FROM schema_migrations')).scalars())
+
+def stamp(engine, version = LATEST_VERSION):
+    # For a schema created from the models, which already matches `version`
+    applied_versions = get_applied_versions(engine)
+    
+    with engine.begin() as connection:
+        for migration_version, description, _ in MIGRATIONS:
+            if migration_version <= version and migration_version not in applied_versions:
+                _record_version(connection, migration_version, description)
+
+def migrate(engine, target_version = LATEST_VERSION):
+    applied_versions = get_applied_versions(engine)
+    
+    applied = []
+    
+    for version, description, upgrade in MIGRATIONS:
+        if version in applied_versions or version > target_version:
+            continue
+        
+        # Autocommit: CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level = 'AUTOCOMMIT') as connection:
+            upgrade(connection)
+            
+            _record_version(connection, version, description)
+        
+        applied.append((version, description))
+    
+    return applied
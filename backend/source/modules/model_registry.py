@@ -0,0 +1,171 @@
+import time
+import threading
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from source.core import HumanDetector
+from source.modules.batching import MicroBatcher
+
+@dataclass
+class LoadedModel:
+    detector: HumanDetector
+    batcher: MicroBatcher
+    
+    model_file: str
+    runtime: str
+    loaded_at: datetime
+    
+    # Seconds spent reading the weights (and exporting them, for other runtimes) and warming up
+    load_time: float
+    warm_up_time: float
+    
+    @property
+    def name(self):
+        return self.detector.model_version
+    
+    def info(self):
+        return {
+            'name': self.name,
+            'model_file': self.model_file,
+            'runtime': self.runtime,
+            'image_size': self.detector.image_size,
+            'loaded_at': self.loaded_at.isoformat(),
+            'load_time': self.load_time,
+            'warm_up_time': self.warm_up_time
+        }
+
+class ModelRegistry():
+    def __init__(
+        self,
+        executor,
+        max_batch_size,
+        max_wait_ms,
+        cache = None,
+        detector_options = None,
+        warm_up_iterations = 2
+    ):
+        # Shared by every loaded model
+        self.executor = executor
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        
+        # HumanDetector arguments, e.g. the fast and tiled mode settings
+        self.detector_options = detector_options or {}
+        self.warm_up_iterations = warm_up_iterations
+        
+        self._lock = threading.Lock()
+        self._models = {}
+        self._active_name = None
+        
+        self._num_swaps = 0
+    
+    def load(
+        self,
+        model_file,
+        runtime = 'pytorch',
+        int8 = False,
+        calibration_data_file = None,
+        image_size = None
+    ):
+        # Blocking; the model is not served until it is added
+        detector = HumanDetector(**self.detector_options)
+        
+        started_at = time.perf_counter()
+        
+        detector.load_model(
+            model_file = model_file,
+            runtime = runtime,
+            int8 = int8,
+            calibration_data_file = calibration_data_file,
+            image_size = image_size
+        )
+        
+        loaded_at = time.perf_counter()
+        
+        if self.warm_up_iterations > 0:
+            detector.warm_up(num_iterations = self.warm_up_iterations)
+        
+        return LoadedModel(
+            detector = detector,
+            
+            # Its own batcher, since a forward pass runs one model
+            batcher = MicroBatcher(
+                detector = detector,
+                executor = self.executor,
+                max_batch_size = self.max_batch_size,
+                max_wait_ms = self.max_wait_ms,
+                cache = self.cache
+            ),
+            
+            model_file = model_file,
+            runtime = runtime,
+            loaded_at = datetime.now(),
+            load_time = loaded_at - started_at,
+            warm_up_time = time.perf_counter() - loaded_at
+        )
+    
+    def add(self, loaded_model, activate = False):
+        # Requests already holding a replaced model finish on it. A replaced model has the same weights,
+        # as names hold the weights hash, so its cache entries stay valid
+        with self._lock:
+            self._models[loaded_model.name] = loaded_model
+            
+            if activate or self._active_name is None:
+                if self._active_name is not None:
+                    self._num_swaps += 1
+                
+                self._active_name = loaded_model.name
+    
+    def activate(self, name):
+        with self._lock:
+            if name not in self._models:
+                raise KeyError(name)
+            
+            if name != self._active_name:
+                self._active_name = name
+                self._num_swaps += 1
+    
+    def remove(self, name):
+        with self._lock:
+            if name not in self._models:
+                raise KeyError(name)
+            
+            if name == self._active_name:
+                raise ValueError("The active model cannot be unloaded.")
+            
+            removed_model = self._models.pop(name)
+        
+        if self.cache is not None:
+            self.cache.invalidate(removed_model.detector.model_id)
+    
+    def get(self, name = None):
+        # The active model, unless another one is asked for
+        with self._lock:
+            return self._models[name or self._active_name]
+    
+    @property
+    def active(self):
+        return self.get()
+    
+    def models(self):
+        with self._lock:
+            return list(self._models.values())
+    
+    def stats(self):
+        with self._lock:
+            loaded_models = list(self._models.values())
+            active_name = self._active_name
+        
+        return {
+            'active': active_name,
+            'swaps': self._num_swaps,
+            'models': {
+                loaded_model.name: {
+                    **loaded_model.info(),
+                    'batcher': loaded_model.batcher.stats()
+                }
+                for loaded_model in loaded_models
+            }
+        }
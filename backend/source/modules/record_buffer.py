@@ -0,0 +1,183 @@
+import time
+import threading
+import traceback
+
+from source.utils.metrics import Histogram
+
+FLUSH_SIZE_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+class RecordBuffer():
+    def __init__(self, database, max_records, max_wait_ms, max_retries = 3, retry_backoff_ms = 100):
+        self.database = database
+        self.max_records = max_records
+        self.max_wait_ms = max_wait_ms
+        
+        # A failed flush is retried with exponential backoff, then each request is inserted on its own
+        self.max_retries = max_retries
+        self.retry_backoff_ms = retry_backoff_ms
+        
+        self._condition = threading.Condition()
+        self._pending = []
+        self._num_pending_records = 0
+        self._first_added_at = None
+        self._is_closed = False
+        
+        self._num_flushed = 0
+        self._num_failed = 0
+        self._num_retries = 0
+        self._num_fallbacks = 0
+        
+        self.flush_size = Histogram(FLUSH_SIZE_BUCKETS)
+        self.flush_latency = Histogram()
+        
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(
+            target = self._work,
+            name = 'record-buffer',
+            daemon = True
+        )
+        
+        self._thread.start()
+    
+    def add(self, records, callback = None):
+        # callback(error) runs on the buffer thread once the records are committed
+        # (error is None, and every record has its primary key) or have failed
+        with self._condition:
+            if self._is_closed:
+                raise RuntimeError("Record buffer is closed.")
+            
+            if self._first_added_at is None:
+                self._first_added_at = time.monotonic()
+                
+            self._pending.append((records, callback))
+            self._num_pending_records += len(records)
+            
+            # Wakes the flush thread to start the wait timer, or to flush a full buffer
+            self._condition.notify()
+    
+    def _take_batch(self):
+        with self._condition:
+            while True:
+                if self._pending:
+                    if self._num_pending_records >= self.max_records or self._is_closed:
+                        break
+                    
+                    remaining_time = self._first_added_at + self.max_wait_ms / 1000 - time.monotonic()
+                    
+                    if remaining_time <= 0:
+                        break
+                    
+                    self._condition.wait(remaining_time)
+                    
+                elif self._is_closed:
+                    return None
+                
+                else:
+                    self._condition.wait()
+            
+            batch = self._pending
+            
+            self._pending = []
+            self._num_pending_records = 0
+            self._first_added_at = None
+            
+            return batch
+    
+    def _flush(self, records):
+        # One transaction and multi-row INSERT ... RETURNING for the whole batch; transient
+        # errors (a dropped connection, a failover) are retried
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.database.add_records(records)
+                
+                return None
+                
+            except Exception as exception:
+                error = exception
+                
+                print(f"Record flush failed (attempt {attempt + 1} of {self.max_retries + 1}) ...")
+                traceback.print_exc()
+            
+            if attempt < self.max_retries:
+                self._num_retries += 1
+                
+                time.sleep(self.retry_backoff_ms / 1000 * 2 ** attempt)
+        
+        return error
+    
+    def _work(self):
+        while True:
+            batch = self._take_batch()
+            
+            if batch is None:
+                return
+            
+            records = [record for batch_records, _ in batch for record in batch_records]
+            
+            started_at = time.monotonic()
+            
+            error = self._flush(records)
+            
+            if error is None:
+                errors = [None] * len(batch)
+                
+            elif len(batch) == 1:
+                errors = [error]
+                
+            else:
+                # One bad request, e.g. a constraint violation, does not drop the rows of the others
+                self._num_fallbacks += 1
+                
+                errors = []
+                
+                for batch_records, _ in batch:
+                    try:
+                        self.database.add_records(batch_records)
+                        errors.append(None)
+                        
+                    except Exception as exception:
+                        errors.append(exception)
+                        
+                        traceback.print_exc()
+            
+            for (batch_records, _), error in zip(batch, errors):
+                if error is None:
+                    self._num_flushed += len(batch_records)
+                    
+                else:
+                    self._num_failed += len(batch_records)
+            
+            self.flush_size.observe(len(records))
+            self.flush_latency.observe(time.monotonic() - started_at)
+            
+            for (_, callback), error in zip(batch, errors):
+                if callback is not None:
+                    try:
+                        callback(error)
+                        
+                    except Exception:
+                        traceback.print_exc()
+    
+    def close(self):
+        # Flushes what is pending before stopping
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify()
+        
+        if self._thread is not None:
+            self._thread.join()
+    
+    def stats(self):
+        return {
+            'max_records': self.max_records,
+            'max_wait_ms': self.max_wait_ms,
+            'depth': self._num_pending_records,
+            'flushed': self._num_flushed,
+            'failed': self._num_failed,
+            'retries': self._num_retries,
+            'fallbacks': self._num_fallbacks,
+            'flush_size': self.flush_size.snapshot(),
+            'flush_latency': self.flush_latency.snapshot()
+        }
@@ -0,0 +1,93 @@
+import time
+import threading
+import traceback
+
+from datetime import datetime, timedelta
+
+class RetentionWorker():
+    def __init__(self, database, media_storage, retention_days, batch_size, interval_seconds):
+        self.database = database
+        self.media_storage = media_storage
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        
+        self._stop_event = threading.Event()
+        self._thread = None
+        
+        self._last_run_at = None
+        self._last_run_duration = None
+        self._num_deleted_rows = 0
+        self._num_deleted_files = 0
+        self._num_failed_runs = 0
+    
+    def run_once(self):
+        cutoff_time = datetime.now() - timedelta(days = self.retention_days)
+        started_at = time.monotonic()
+        
+        num_deleted_rows = 0
+        
+        # Small transactions keep row locks short for the API
+        while not self._stop_event.is_set():
+            num_rows, released_files = self.database.delete_predictions_before(
+                cutoff_time = cutoff_time,
+                batch_size = self.batch_size
+            )
+            
+            # Only files no row points to, now that the delete has committed, are removed
+            removed_files = self.media_storage.remove_released(
+                released_files, 
+                self.database.referenced_media_files
+            )
+            
+            num_deleted_rows += num_rows
+            self._num_deleted_rows += num_rows
+            self._num_deleted_files += len(removed_files)
+            
+            if num_rows < self.batch_size:
+                break
+        
+        self._last_run_at = datetime.now()
+        self._last_run_duration = time.monotonic() - started_at
+        
+        return num_deleted_rows
+    
+    def _work(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+                
+            except Exception:
+                self._num_failed_runs += 1
+                
+                print("Retention run failed ...")
+                traceback.print_exc()
+            
+            self._stop_event.wait(self.interval_seconds)
+    
+    def start(self):
+        self._thread = threading.Thread(
+            target = self._work,
+            name = 'retention',
+            daemon = True
+        )
+        
+        self._thread.start()
+    
+    def stop(self):
+        self._stop_event.set()
+        
+        if self._thread is not None:
+            self._thread.join()
+    
+    def stats(self):
+        return {
+            'retention_days': self.retention_days,
+            'batch_size': self.batch_size,
+            'interval_seconds': self.interval_seconds,
+            'last_run_at': self._last_run_at.isoformat() if self._last_run_at is not None else None,
+            'last_run_duration': self._last_run_duration,
+            'deleted_rows': self._num_deleted_rows,
+            'deleted_files': self._num_deleted_files,
+            'failed_runs': self._num_failed_runs
+        }
@@ -0,0 +1,72 @@
+import time
+import threading
+import traceback
+
+from contextlib import contextmanager
+
+class StartupTracker():
+    def __init__(self, phases, started_at = None):
+        # Counted from the first import of the API module when started_at is given
+        self._started_at = started_at if started_at is not None else time.perf_counter()
+        
+        self._lock = threading.Lock()
+        self._phases = {
+            name: {'status': 'pending', 'duration': None, 'error': None}
+            for name in phases
+        }
+        
+        self._ready_at = None
+    
+    def record(self, name, duration):
+        # A phase timed by the caller, e.g. module import
+        with self._lock:
+            self._phases[name] = {'status': 'done', 'duration': duration, 'error': None}
+    
+    @contextmanager
+    def phase(self, name):
+        started_at = time.perf_counter()
+        
+        with self._lock:
+            self._phases[name] = {'status': 'running', 'duration': None, 'error': None}
+        
+        try:
+            yield
+        
+        except Exception as error:
+            with self._lock:
+                self._phases[name] = {
+                    'status': 'failed',
+                    'duration': time.perf_counter() - started_at,
+                    'error': repr(error)
+                }
+            
+            traceback.print_exc()
+            
+            raise
+        
+        with self._lock:
+            self._phases[name] = {'status': 'done', 'duration': time.perf_counter() - started_at, 'error': None}
+    
+    def mark_ready(self):
+        self._ready_at = time.perf_counter()
+    
+    @property
+    def ready(self):
+        return self._ready_at is not None
+    
+    @property
+    def failed(self):
+        with self._lock:
+            return any(phase['status'] == 'failed' for phase in self._phases.values())
+    
+    def stats(self):
+        with self._lock:
+            phases = {name: dict(phase) for name, phase in self._phases.items()}
+        
+        return {
+            'ready': self.ready,
+            'failed': self.failed,
+            'time_to_ready': self._ready_at - self._started_at if self._ready_at is not None else None,
+            'uptime': time.perf_counter() - self._started_at,
+            'phases': phases
+        }
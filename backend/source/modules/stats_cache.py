@@ -0,0 +1,122 @@
+import time
+import threading
+
+from collections import OrderedDict
+from datetime import timedelta
+
+from source.modules.database import floor_time
+
+class StatsCache():
+    # Buckets of a series that are closed (older than now minus the grace period, which
+    # covers rows still on their way through the media writer) only change when reprocessing
+    # replaces results, so only the open tail is queried again. The TTL bounds staleness
+    # after retention deletes.
+    def __init__(self, max_entries, ttl_seconds, grace_seconds, fetch_changes = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        
+        # fetch_changes(after_version) returns (version, earliest time changed since after_version or None),
+        # and is checked before each lookup, as changes may come from another process
+        self.fetch_changes = fetch_changes
+        self._version = None
+        
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        
+        self._num_hits = 0
+        self._num_partial_hits = 0
+        self._num_misses = 0
+        self._num_evicted = 0
+        self._num_invalidated = 0
+    
+    def invalidate(self, since = None):
+        # Buckets from the day of `since` on are queried again, as any granularity divides a day; None drops everything
+        with self._lock:
+            if since is None:
+                self._entries.clear()
+                
+            else:
+                since = floor_time(since, 'day')
+                
+                for key, (closed_until, buckets, expires_at) in list(self._entries.items()):
+                    if since < closed_until:
+                        self._entries[key] = (since, [bucket for bucket in buckets if bucket[0] < since], expires_at)
+            
+            self._num_invalidated += 1
+    
+    async def _apply_changes(self):
+        version, changed_since = await self.fetch_changes(self._version)
+        
+        if changed_since is not None:
+            self.invalidate(since = changed_since)
+        
+        self._version = version
+    
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            
+            if entry is None or entry[2] < time.monotonic():
+                self._entries.pop(key, None)
+                
+                return None
+            
+            self._entries.move_to_end(key)
+            
+            return entry
+    
+    def _put(self, key, closed_until, buckets):
+        with self._lock:
+            self._entries[key] = (closed_until, buckets, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+                self._num_evicted += 1
+    
+    async def get_series(self, key, granularity, now, time_max, fetch_series):
+        # fetch_series(time_from) returns the (bucket start, count, sum, max) rows from time_from on
+        closed_until = floor_time(now - timedelta(seconds = self.grace_seconds), granularity)
+        
+        if self.fetch_changes is not None:
+            await self._apply_changes()
+        
+        entry = self._get(key)
+        
+        if entry is None:
+            self._num_misses += 1
+            
+            buckets = await fetch_series(None)
+            
+        else:
+            cached_until, cached_buckets, _ = entry
+            
+            if time_max is not None and time_max < cached_until:
+                self._num_hits += 1
+                
+                return cached_buckets
+            
+            self._num_partial_hits += 1
+            
+            buckets = cached_buckets + await fetch_series(cached_until)
+        
+        self._put(
+            key, 
+            closed_until, 
+            [bucket for bucket in buckets if bucket[0] < closed_until]
+        )
+        
+        return buckets
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._num_hits,
+                'partial_hits': self._num_partial_hits,
+                'misses': self._num_misses,
+                'evicted': self._num_evicted,
+                'invalidated': self._num_invalidated
+            }
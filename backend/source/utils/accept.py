@@ -0,0 +1,51 @@
+def parse_accept(accept):
+    # (media range, q) for each entry of an Accept header; a malformed q counts as 0
+    media_ranges = []
+    
+    for entry in accept.split(','):
+        media_range, *params = [part.strip() for part in entry.split(';')]
+        
+        if '/' not in media_range:
+            continue
+        
+        quality = 1.0
+        
+        for param in params:
+            name, _, value = param.partition('=')
+            
+            if name.strip().lower() == 'q':
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                
+                except ValueError:
+                    quality = 0.0
+        
+        media_ranges.append((media_range.lower(), quality))
+    
+    return media_ranges
+
+def accept_quality(media_ranges, media_type, wildcards = True):
+    # q of the most specific range matching media_type, 0 if none does
+    main_type = media_type.split('/')[0]
+    
+    best_specificity = -1
+    best_quality = 0.0
+    
+    for media_range, quality in media_ranges:
+        if media_range == media_type:
+            specificity = 2
+        
+        elif wildcards and media_range == f'{main_type}/*':
+            specificity = 1
+        
+        elif wildcards and media_range == '*/*':
+            specificity = 0
+        
+        else:
+            continue
+        
+        if specificity > best_specificity:
+            best_specificity = specificity
+            best_quality = quality
+    
+    return best_quality
@@ -1,5 +1,8 @@
 import os
 import base64
+import hashlib
+
+import numpy as np
 
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
@@ -34,6 +37,42 @@ def save_b64image(b64image, save_file):
     
     pilimage.save(save_file, format = 'PNG')
 
+IMAGE_EXTENSIONS = {
+    'PNG': '.png',
+    'JPEG': '.jpg',
+    'WEBP': '.webp'
+}
+
+def encode_pilimage(pilimage, format = 'PNG', quality = 90, compress_level = 6):
+    image_buffer = BytesIO()
+    
+    if format == 'PNG':
+        pilimage.save(image_buffer, format = 'PNG', compress_level = compress_level)
+        
+    else:
+        if format == 'JPEG' and pilimage.mode not in ['RGB', 'L']:
+            pilimage = pilimage.convert('RGB')
+            
+        pilimage.save(image_buffer, format = format, quality = quality)
+    
+    return image_buffer.getvalue()
+
+def save_image_data(image_data, save_file):
+    save_folder = os.path.dirname(save_file)
+    
+    if not os.path.exists(save_folder):
+        os.makedirs(save_folder)
+        
+    with open(save_file, 'wb') as file:
+        file.write(image_data)
+
+def save_decoded_image(decoded_image, save_file):
+    # Stored in the format it is already encoded in, without re-encoding
+    save_image_data(
+        image_data = decoded_image.image_data,
+        save_file = save_file
+    )
+
 def strip_mime_prefix(b64image):
     if b64image.startswith('data:image/'):
         comma_index = b64image.find(',')
@@ -41,6 +80,127 @@ def strip_mime_prefix(b64image):
             return b64image[comma_index + 1:] 
     
     return b64image
+
+# Request-scoped image shared by validation, inference, drawing and storage.
+# Every representation is produced at most once, on first access.
+class DecodedImage():
+    def __init__(self, image_data = None, b64image = None, pilimage = None, format = None, **encode_params):
+        self._image_data = image_data
+        self._b64image = b64image
+        self._pilimage = pilimage
+        self._nparray = None
+        self._sha256 = None
+        
+        # Format and settings used to encode a PIL image created in memory
+        self._format = format
+        self._encode_params = encode_params
+        self._header = None
+        self._is_loaded = pilimage is not None
+    
+    def __getstate__(self):
+        # Only the encoded bytes cross process boundaries
+        return {
+            '_image_data': self.image_data,
+            '_format': self._format
+        }
+    
+    def __setstate__(self, state):
+        self.__init__(image_data = state['_image_data'])
+        
+        self._format = state['_format']
+    
+    @classmethod
+    def from_b64image(cls, b64image):
+        return cls(b64image = strip_mime_prefix(b64image))
+    
+    @classmethod
+    def from_image_data(cls, image_data):
+        return cls(image_data = image_data)
+    
+    @classmethod
+    def from_pilimage(cls, pilimage, format = 'PNG', **encode_params):
+        return cls(pilimage = pilimage, format = format, **encode_params)
+    
+    @property
+    def image_data(self):
+        if self._image_data is None:
+            if self._b64image is not None:
+                self._image_data = base64.b64decode(self._b64image)
+                
+            else:
+                self._image_data = encode_pilimage(
+                    self._pilimage, 
+                    format = self._format, 
+                    **self._encode_params
+                )
+                
+        return self._image_data
+    
+    @property
+    def b64image(self):
+        if self._b64image is None:
+            self._b64image = base64.b64encode(self.image_data).decode('utf-8')
+            
+        return self._b64image
+    
+    @property
+    def sha256(self):
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.image_data).hexdigest()
+            
+        return self._sha256
+    
+    @property
+    def header(self):
+        # Opening an image only parses its header; pixels are decoded by `load`
+        if self._header is None:
+            if self._pilimage is not None:
+                self._header = self._pilimage
+                
+            else:
+                self._header = Image.open(BytesIO(self.image_data))
+                
+        return self._header
+    
+    @property
+    def format(self):
+        if self._format is None:
+            self._format = self.header.format
+        
+        return self._format
+    
+    @property
+    def extension(self):
+        return IMAGE_EXTENSIONS.get(self.format, '.png')
+    
+    @property
+    def size(self):
+        return self.header.size
+    
+    def load(self):
+        if not self._is_loaded:
+            self.header.load()
+            self._pilimage = self.header
+            self._is_loaded = True
+            
+        return self._pilimage
+    
+    @property
+    def pilimage(self):
+        return self.load()
+    
+    @property
+    def nparray(self):
+        # BGR, HWC, uint8: the layout ultralytics and OpenCV expect
+        if self._nparray is None:
+            pilimage = self.pilimage
+            
+            if pilimage.mode != 'RGB':
+                pilimage = pilimage.convert('RGB')
+                
+            self._nparray = np.ascontiguousarray(np.asarray(pilimage)[:, :, ::-1])
+            
+        return self._nparray
     
 class BBoxDrawer():
     def __init__(self):
@@ -50,7 +210,22 @@ class BBoxDrawer():
         if len(xywhs) == 0:
             return b64image
         
-        pilimage = b64image_to_pilimage(b64image)
+        drawn_image = self.draw_bboxes_on_decoded_image(
+            decoded_image = DecodedImage.from_b64image(b64image),
+            xywhs = xywhs,
+            labels = labels,
+            colors = colors,
+            confidences = confidences,
+            line_width = line_width
+        )
+        
+        return drawn_image.b64image
+    
+    def draw_bboxes_on_decoded_image(self, decoded_image, xywhs, labels, colors, confidences, line_width = 2, **encode_params):
+        if len(xywhs) == 0:
+            return decoded_image
+        
+        pilimage = decoded_image.pilimage.copy()
         draw = ImageDraw.Draw(pilimage)
         font = ImageFont.load_default(size = 20)
     
@@ -89,6 +264,4 @@ class BBoxDrawer():
                 font = font
             )
                         
-        drawn_b64image = pilimage_to_b64image(pilimage)
-        
-        return drawn_b64image
+        return DecodedImage.from_pilimage(pilimage, **encode_params)
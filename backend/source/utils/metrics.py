@@ -0,0 +1,47 @@
+import threading
+
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+class Histogram():
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = sorted(buckets)
+        
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self._bucket_counts = [0 for _ in range(len(self.buckets) + 1)]
+            self._count = 0
+            self._sum = 0.0
+            self._max = 0.0
+        
+    def observe(self, value):
+        with self._lock:
+            index = len(self.buckets)
+            for bucket_index, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    index = bucket_index
+                    break
+            
+            self._bucket_counts[index] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+    
+    def snapshot(self):
+        with self._lock:
+            cumulative_count = 0
+            buckets = {}
+            
+            for bucket, bucket_count in zip(self.buckets + ['+Inf'], self._bucket_counts):
+                cumulative_count += bucket_count
+                buckets[str(bucket)] = cumulative_count
+            
+            return {
+                'count': self._count,
+                'sum': self._sum,
+                'mean': self._sum / self._count if self._count else 0.0,
+                'max': self._max,
+                'buckets': buckets
+            }
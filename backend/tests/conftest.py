@@ -0,0 +1,107 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from PIL import Image
+
+from source.core import HumanDetector, model_version_name
+from source.modules.database import HumanDetectorDatabase, Predictions
+from source.utils.image import DecodedImage
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'human_detection.db'}"
+
+@pytest.fixture
+def database(database_url):
+    database = HumanDetectorDatabase(database_url)
+    database.create_tables()
+    
+    yield database
+    
+    database.engine.dispose()
+
+def make_predictions(num_predictions, start_time = datetime(2024, 1, 1, 8, 0, 0), step = timedelta(minutes = 17)):
+    return [
+        Predictions(
+            time = start_time + step * index,
+            num_humans = index % 4,
+            image_width = 640,
+            image_height = 480,
+            model_version = 'test.pt',
+            inference_time = 5.0
+        )
+        for index in range(num_predictions)
+    ]
+
+class RectangleModel():
+    # Stands in for an ultralytics model: a rectangle painted with value k is a person of confidence confidences[k]
+    def __init__(self, confidences, gate = None):
+        self.confidences = confidences
+        self.gate = gate
+        self.calls = []
+    
+    def predict(self, source, imgsz, conf, verbose = True):
+        self.calls.append((len(source), imgsz, conf))
+        
+        if self.gate is not None:
+            self.gate.wait()
+        
+        return [self.predict_nparray(nparray, conf) for nparray in source]
+    
+    def predict_nparray(self, nparray, conf):
+        xyxys, confidences = [], []
+        
+        for value, confidence in self.confidences.items():
+            ys, xs = np.nonzero(nparray[:, :, 0] == value)
+            
+            if len(xs) and confidence >= conf:
+                xyxys.append([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1])
+                confidences.append(confidence)
+        
+        xyxys = np.array(xyxys, dtype = float).reshape(-1, 4)
+        
+        return SimpleNamespace(
+            boxes = SimpleNamespace(
+                xyxy = xyxys,
+                xywh = np.stack([
+                    (xyxys[:, 0] + xyxys[:, 2]) / 2, 
+                    (xyxys[:, 1] + xyxys[:, 3]) / 2, 
+                    xyxys[:, 2] - xyxys[:, 0], 
+                    xyxys[:, 3] - xyxys[:, 1]
+                ], axis = 1),
+                conf = np.array(confidences),
+                cls = np.zeros(len(confidences))
+            ),
+            speed = {'preprocess': 1.0, 'inference': 2.0, 'postprocess': 1.0},
+            orig_shape = nparray.shape[:2]
+        )
+
+def make_detector(model_file, model, image_size = 640, **detector_options):
+    # A detector serving `model` as if loaded from the .pt file `model_file`
+    detector = HumanDetector(**detector_options)
+    
+    detector._model = model
+    detector._model_file = str(model_file)
+    detector._model_version = model_version_name(str(model_file))
+    detector._image_size = image_size
+    
+    return detector
+
+def make_image(width, height, rectangles):
+    # Black RGB image with each (x1, y1, x2, y2) rectangle painted with its value
+    nparray = np.zeros((height, width, 3), dtype = np.uint8)
+    
+    for value, (x1, y1, x2, y2) in rectangles.items():
+        nparray[y1:y2, x1:x2] = value
+    
+    return DecodedImage.from_pilimage(Image.fromarray(nparray))
@@ -0,0 +1,26 @@
+from source.utils.accept import accept_quality, parse_accept
+
+BOXES_MEDIA_TYPE = 'application/vnd.human-detection.boxes+json'
+
+def test_parse_accept_reads_q_values():
+    assert parse_accept('image/png;q=0.5, application/json, */*; q=0.1, text/html;level=1;q=oops, ,bogus') == [
+        ('image/png', 0.5),
+        ('application/json', 1.0),
+        ('*/*', 0.1),
+        ('text/html', 0.0)
+    ]
+    
+    assert parse_accept('') == []
+
+def test_accept_quality_uses_the_most_specific_range():
+    media_ranges = parse_accept('application/*;q=0.2, application/json;q=0.7, */*;q=0.9')
+    
+    assert accept_quality(media_ranges, 'application/json') == 0.7
+    assert accept_quality(media_ranges, 'application/xml') == 0.2
+    assert accept_quality(media_ranges, 'image/png') == 0.9
+    
+    # Wildcards do not select vendor types
+    assert accept_quality(media_ranges, BOXES_MEDIA_TYPE, wildcards = False) == 0.0
+    
+    # An explicit q=0 excludes the type, even under a matching wildcard
+    assert accept_quality(parse_accept('*/*, application/json;q=0'), 'application/json') == 0.0
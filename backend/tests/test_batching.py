@@ -0,0 +1,100 @@
+import asyncio
+
+from source.modules.batching import ImageDecodeError, MicroBatcher
+from source.modules.executor import BoundedExecutor
+from source.modules.inference_cache import InferenceCache
+from source.utils.image import DecodedImage
+
+from conftest import RectangleModel, make_detector, make_image
+
+CONFIDENCES = {1: 0.3, 2: 0.6, 3: 0.9}
+RECTANGLES = {1: (10, 10, 30, 50), 2: (40, 10, 60, 50), 3: (70, 10, 90, 50)}
+
+def make_cache():
+    return InferenceCache(max_bytes = 1024 * 1024, ttl_seconds = 60, min_confidence_threshold = 0.25)
+
+def test_requests_are_batched_by_plan(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights')
+    
+    model = RectangleModel(CONFIDENCES)
+    executor = BoundedExecutor('thread', max_workers = 2, max_queue_size = 8)
+    batcher = MicroBatcher(make_detector(model_file, model), executor, max_batch_size = 8, max_wait_ms = 20)
+    
+    async def submit_all():
+        # Fast mode runs small images at a smaller resolution, so they get a batch of their own
+        return await asyncio.gather(*[
+            batcher.submit(make_image(100, 100, RECTANGLES), 0.5, mode = 'fast'),
+            batcher.submit(make_image(100, 100, {3: RECTANGLES[3]}), 0.5, mode = 'fast'),
+            batcher.submit(make_image(300, 300, RECTANGLES), 0.5, mode = 'fast'),
+            batcher.submit(make_image(100, 100, RECTANGLES), 0.5, mode = 'fast')
+        ])
+    
+    results = asyncio.run(submit_all())
+    executor.shutdown()
+    
+    assert sorted(model.calls) == [(1, 320, 0.5), (3, 160, 0.5)]
+    assert [len(detections) for detections in results] == [2, 1, 2, 2]
+    
+    stats = batcher.stats()
+    
+    assert stats['pending'] == 0
+    assert stats['batch_size']['count'] == 2
+
+def test_batch_runs_at_lowest_threshold_and_is_filtered_per_request(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights')
+    
+    model = RectangleModel(CONFIDENCES)
+    executor = BoundedExecutor('thread', max_workers = 2, max_queue_size = 8)
+    batcher = MicroBatcher(make_detector(model_file, model), executor, max_batch_size = 8, max_wait_ms = 20, cache = make_cache())
+    
+    image = make_image(100, 100, RECTANGLES)
+    
+    async def submit_all():
+        return await asyncio.gather(
+            batcher.submit(image, 0.8),
+            batcher.submit(make_image(100, 100, RECTANGLES), 0.5)
+        )
+    
+    high_detections, low_detections = asyncio.run(submit_all())
+    
+    # Down to the cache threshold, so that cached entries serve any request above it
+    assert model.calls == [(2, 640, 0.25)]
+    
+    assert high_detections.confidences == [0.9]
+    assert low_detections.confidences == [0.6, 0.9]
+    
+    # Served from the cache, filtered at its own threshold
+    cached_detections = asyncio.run(batcher.submit(image, 0.3))
+    executor.shutdown()
+    
+    assert len(model.calls) == 1
+    assert cached_detections.confidences == [0.3, 0.6, 0.9]
+    assert cached_detections.inference_time == 0.0
+
+def test_corrupt_image_fails_alone(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights')
+    
+    model = RectangleModel(CONFIDENCES)
+    executor = BoundedExecutor('thread', max_workers = 2, max_queue_size = 8)
+    batcher = MicroBatcher(make_detector(model_file, model), executor, max_batch_size = 8, max_wait_ms = 20)
+    
+    # Its header is intact, so it is only found out when the batch decodes the pixels
+    image_data = make_image(100, 100, RECTANGLES).image_data
+    corrupt_image = DecodedImage.from_image_data(image_data[:len(image_data) // 2])
+    
+    async def submit_all():
+        return await asyncio.gather(
+            batcher.submit(make_image(100, 100, RECTANGLES), 0.5),
+            batcher.submit(corrupt_image, 0.5),
+            return_exceptions = True
+        )
+    
+    detections, error = asyncio.run(submit_all())
+    executor.shutdown()
+    
+    assert model.calls == [(1, 640, 0.5)]
+    assert detections.confidences == [0.6, 0.9]
+    assert isinstance(error, ImageDecodeError)
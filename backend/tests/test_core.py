@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from source.core import exported_model_file, model_version_name
+
+def test_exported_model_file_follows_weights_and_image_size(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights v1')
+    
+    onnx_file = exported_model_file(str(model_file), 'onnx')
+    openvino_file = exported_model_file(str(model_file), 'openvino', image_size = 320)
+    int8_file = exported_model_file(str(model_file), 'openvino', int8 = True, image_size = 320)
+    
+    assert os.path.dirname(onnx_file) == str(tmp_path)
+    assert os.path.basename(onnx_file).startswith('best_') and onnx_file.endswith('.onnx')
+    assert openvino_file.endswith('_320_openvino_model')
+    assert int8_file.endswith('_320_int8_openvino_model')
+    
+    # Same weights, same export
+    assert exported_model_file(str(model_file), 'onnx') == onnx_file
+    
+    # Another size or retrained weights under the same name are exported again
+    assert exported_model_file(str(model_file), 'onnx', image_size = 640) != onnx_file
+    
+    model_file.write_bytes(b'weights v2')
+    
+    assert exported_model_file(str(model_file), 'onnx') != onnx_file
+    assert exported_model_file(str(model_file), 'openvino', image_size = 320) != openvino_file
+
+def test_exported_model_file_rejects_int8_outside_openvino(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights')
+    
+    with pytest.raises(ValueError):
+        exported_model_file(str(model_file), 'onnx', int8 = True)
+    
+    with pytest.raises(ValueError):
+        exported_model_file(str(model_file), 'tensorrt')
+
+def test_model_version_name_follows_pt_weights(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights v1')
+    
+    version = model_version_name(str(model_file))
+    
+    assert version.startswith('best_') and version.endswith('.pt')
+    assert model_version_name(str(model_file)) == version
+    
+    # Exports are versioned by their name, which already holds the hash
+    assert model_version_name(str(model_file), 'onnx') == os.path.basename(exported_model_file(str(model_file), 'onnx'))
+    
+    # Retrained weights under the same filename are reprocessed
+    model_file.write_bytes(b'weights v2')
+    
+    assert model_version_name(str(model_file)) != version
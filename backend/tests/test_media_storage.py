@@ -0,0 +1,93 @@
+import os
+
+from datetime import datetime
+
+from source.modules.media_storage import MediaStorage
+from source.modules.retention import RetentionWorker
+
+from conftest import make_predictions
+
+def store_predictions(database, media_storage, predictions, image_data):
+    # Every prediction of a request points to the stored upload
+    for prediction in predictions:
+        prediction.query_image_file, _ = media_storage.store('queries', image_data, '.png')
+    
+    database.add_records(predictions)
+    
+    return predictions[0].query_image_file
+
+class ReuploadingDatabase():
+    # Commits an identical upload right after the retention delete commits, before its files are removed
+    def __init__(self, database, media_storage, image_data):
+        self.database = database
+        self.media_storage = media_storage
+        self.image_data = image_data
+        self.created = None
+    
+    def delete_predictions_before(self, cutoff_time, batch_size):
+        num_rows, released_files = self.database.delete_predictions_before(cutoff_time, batch_size)
+        
+        reupload = make_predictions(1, start_time = datetime.now())[0]
+        reupload.query_image_file, self.created = self.media_storage.store('queries', self.image_data, '.png')
+        
+        self.database.add_records([reupload])
+        
+        return num_rows, released_files
+    
+    def referenced_media_files(self, files):
+        return self.database.referenced_media_files(files)
+
+def make_retention_worker(database, media_storage):
+    return RetentionWorker(database, media_storage, retention_days = 30, batch_size = 100, interval_seconds = 3600)
+
+def test_identical_uploads_share_one_referenced_file(database, tmp_path):
+    media_storage = MediaStorage(str(tmp_path / 'media'))
+    
+    first_file, created = media_storage.store('queries', b'image', '.png')
+    second_file, created_again = media_storage.store('queries', b'image', '.png')
+    other_file, _ = media_storage.store('queries', b'other image', '.png')
+    
+    assert created and not created_again
+    assert first_file == second_file != other_file
+    
+    predictions = make_predictions(3)
+    
+    for prediction, file in zip(predictions, [first_file, second_file, other_file]):
+        prediction.query_image_file = file
+    
+    database.add_records(predictions)
+    
+    assert database.referenced_media_files([first_file, other_file]) == {first_file, other_file}
+    
+    # The shared file is released with its last prediction only
+    assert database.delete_predictions([predictions[0].query_id]) == []
+    assert sorted(database.delete_predictions([predictions[1].query_id, predictions[2].query_id])) == sorted([first_file, other_file])
+    
+    assert database.referenced_media_files([first_file, other_file]) == set()
+
+def test_retention_removes_released_files(database, tmp_path):
+    media_storage = MediaStorage(str(tmp_path / 'media'))
+    
+    query_image_file = store_predictions(database, media_storage, make_predictions(3), b'image')
+    
+    retention_worker = make_retention_worker(database, media_storage)
+    
+    assert retention_worker.run_once() == 3
+    assert not os.path.exists(query_image_file)
+    assert retention_worker.stats()['deleted_files'] == 1
+
+def test_retention_keeps_files_uploaded_again(database, tmp_path):
+    media_storage = MediaStorage(str(tmp_path / 'media'))
+    
+    query_image_file = store_predictions(database, media_storage, make_predictions(3), b'image')
+    
+    reuploading_database = ReuploadingDatabase(database, media_storage, b'image')
+    retention_worker = make_retention_worker(reuploading_database, media_storage)
+    
+    assert retention_worker.run_once() == 3
+    
+    # The upload found the file still there, and its row now points to it
+    assert reuploading_database.created is False
+    assert os.path.exists(query_image_file)
+    assert database.referenced_media_files([query_image_file]) == {query_image_file}
+    assert retention_worker.stats()['deleted_files'] == 0
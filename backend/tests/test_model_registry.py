@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+from datetime import datetime
+
+from source.modules.batching import MicroBatcher
+from source.modules.executor import BoundedExecutor
+from source.modules.inference_cache import InferenceCache
+from source.modules.model_registry import LoadedModel, ModelRegistry
+
+from conftest import RectangleModel, make_detector, make_image
+
+CONFIDENCES = {1: 0.3, 2: 0.6, 3: 0.9}
+RECTANGLES = {1: (10, 10, 30, 50), 2: (40, 10, 60, 50), 3: (70, 10, 90, 50)}
+
+def make_cache():
+    return InferenceCache(max_bytes = 1024 * 1024, ttl_seconds = 60, min_confidence_threshold = 0.25)
+
+def make_loaded_model(detector, executor, cache):
+    return LoadedModel(
+        detector = detector,
+        batcher = MicroBatcher(detector, executor, max_batch_size = 8, max_wait_ms = 20, cache = cache),
+        model_file = detector._model_file,
+        runtime = 'pytorch',
+        loaded_at = datetime.now(),
+        load_time = 0.0,
+        warm_up_time = 0.0
+    )
+
+def test_retrained_weights_do_not_share_cache_entries(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights v1')
+    
+    # The old model is still detecting when retrained weights under the same name replace it
+    gate = threading.Event()
+    old_model = RectangleModel(CONFIDENCES, gate = gate)
+    old_detector = make_detector(model_file, old_model)
+    
+    model_file.write_bytes(b'weights v2')
+    
+    new_model = RectangleModel({1: 0.95, 2: 0.95, 3: 0.95})
+    new_detector = make_detector(model_file, new_model)
+    
+    assert new_detector.model_id != old_detector.model_id
+    
+    cache = make_cache()
+    executor = BoundedExecutor('thread', max_workers = 2, max_queue_size = 8)
+    registry = ModelRegistry(executor, max_batch_size = 8, max_wait_ms = 20, cache = cache)
+    
+    registry.add(make_loaded_model(old_detector, executor, cache))
+    
+    async def swap_while_detecting():
+        image = make_image(100, 100, RECTANGLES)
+        old_request = asyncio.ensure_future(registry.active.batcher.submit(image, 0.5))
+        
+        while not old_model.calls:
+            await asyncio.sleep(0.01)
+        
+        registry.add(make_loaded_model(new_detector, executor, cache), activate = True)
+        gate.set()
+        
+        old_detections = await old_request
+        new_detections = await registry.active.batcher.submit(make_image(100, 100, RECTANGLES), 0.5)
+        
+        return old_detections, new_detections
+    
+    old_detections, new_detections = asyncio.run(swap_while_detecting())
+    
+    # The old batch finished on the old weights, and its late cache entry is not served for the new ones
+    assert old_detections.confidences == [0.6, 0.9]
+    assert new_detections.confidences == [0.95, 0.95, 0.95]
+    assert len(new_model.calls) == 1
+    
+    assert registry.stats()['swaps'] == 1
+    assert cache.stats()['entries'] == 2
+    
+    # Unloading the old weights drops their entries only
+    registry.remove(old_detector.model_version)
+    executor.shutdown()
+    
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['invalidated'] == 1
+
+def test_reloading_the_same_weights_keeps_cache_entries(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights')
+    
+    cache = make_cache()
+    executor = BoundedExecutor('thread', max_workers = 2, max_queue_size = 8)
+    registry = ModelRegistry(executor, max_batch_size = 8, max_wait_ms = 20, cache = cache)
+    
+    first_model = RectangleModel(CONFIDENCES)
+    registry.add(make_loaded_model(make_detector(model_file, first_model), executor, cache))
+    
+    asyncio.run(registry.active.batcher.submit(make_image(100, 100, RECTANGLES), 0.5))
+    
+    second_model = RectangleModel(CONFIDENCES)
+    registry.add(make_loaded_model(make_detector(model_file, second_model), executor, cache), activate = True)
+    
+    detections = asyncio.run(registry.active.batcher.submit(make_image(100, 100, RECTANGLES), 0.5))
+    executor.shutdown()
+    
+    assert len(registry.models()) == 1
+    assert second_model.calls == []
+    assert detections.confidences == [0.6, 0.9]
@@ -0,0 +1,92 @@
+from source.modules.database import Predictions
+from source.modules.record_buffer import RecordBuffer
+
+from conftest import make_predictions
+
+class FlakyDatabase():
+    # Fails the first flushes, as a dropped connection would, then writes to the real database
+    def __init__(self, database, num_failures):
+        self.database = database
+        self.num_failures = num_failures
+        self.num_calls = 0
+    
+    def add_records(self, records):
+        self.num_calls += 1
+        
+        if self.num_calls <= self.num_failures:
+            raise ConnectionError("Connection lost")
+        
+        self.database.add_records(records)
+
+def count_predictions(database):
+    with database.Session() as session:
+        return session.query(Predictions).count()
+
+def add_requests(record_buffer, requests):
+    errors = {}
+    
+    for index, records in enumerate(requests):
+        record_buffer.add(records, callback = lambda error, index = index: errors.__setitem__(index, error))
+    
+    # Flushes everything pending as one batch
+    record_buffer.close()
+    
+    return errors
+
+def test_failed_flush_is_retried(database):
+    flaky_database = FlakyDatabase(database, num_failures = 2)
+    
+    record_buffer = RecordBuffer(
+        flaky_database,
+        max_records = 1000,
+        max_wait_ms = 60000,
+        max_retries = 3,
+        retry_backoff_ms = 1
+    )
+    
+    record_buffer.start()
+    
+    predictions = make_predictions(6)
+    errors = add_requests(record_buffer, [predictions[:2], predictions[2:5], predictions[5:]])
+    
+    assert errors == {0: None, 1: None, 2: None}
+    assert count_predictions(database) == 6
+    
+    assert flaky_database.num_calls == 3
+    assert record_buffer.stats()['retries'] == 2
+    assert record_buffer.stats()['flushed'] == 6
+
+def test_failing_request_does_not_drop_the_batch(database):
+    database.add_records(make_predictions(1))
+    
+    with database.Session() as session:
+        existing_query_id = session.query(Predictions.query_id).scalar()
+    
+    record_buffer = RecordBuffer(
+        database,
+        max_records = 1000,
+        max_wait_ms = 60000,
+        max_retries = 1,
+        retry_backoff_ms = 1
+    )
+    
+    record_buffer.start()
+    
+    predictions = make_predictions(5)
+    
+    # Its primary key is taken, so every flush of the whole batch fails
+    predictions[2].query_id = existing_query_id
+    
+    errors = add_requests(record_buffer, [predictions[:2], predictions[2:4], predictions[4:]])
+    
+    assert errors[0] is None and errors[2] is None
+    assert errors[1] is not None
+    
+    assert count_predictions(database) == 1 + 3
+    
+    stats = record_buffer.stats()
+    
+    assert stats['flushed'] == 3
+    assert stats['failed'] == 2
+    assert stats['retries'] == 1
+    assert stats['fallbacks'] == 1
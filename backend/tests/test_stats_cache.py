@@ -0,0 +1,112 @@
+import asyncio
+
+from datetime import datetime
+
+from source.modules.database import query_prediction_stats, query_replaced_results
+from source.modules.stats_cache import StatsCache
+
+from conftest import make_predictions
+
+NOW = datetime(2024, 1, 2, 12, 0, 0)
+
+class StatsSource():
+    # Sync database queries behind the async callables the cache takes, recording where each series starts
+    def __init__(self, database):
+        self.database = database
+        self.fetched_from = []
+    
+    async def fetch_series(self, time_from):
+        self.fetched_from.append(time_from)
+        
+        with self.database.Session() as session:
+            return query_prediction_stats(
+                session,
+                query_id = None,
+                time_min = None, time_max = None,
+                num_humans_min = None, num_humans_max = None,
+                granularity = 'hour',
+                time_from = time_from
+            )
+    
+    async def fetch_changes(self, after_result_id):
+        with self.database.Session() as session:
+            return query_replaced_results(session, after_result_id)
+
+def get_series(stats_cache, stats_source, time_max = None):
+    return asyncio.run(
+        stats_cache.get_series(
+            key = ('hour',),
+            granularity = 'hour',
+            now = NOW,
+            time_max = time_max,
+            fetch_series = stats_source.fetch_series
+        )
+    )
+
+def test_closed_buckets_are_served_from_memory(database):
+    database.add_records(make_predictions(20))
+    
+    stats_source = StatsSource(database)
+    stats_cache = StatsCache(max_entries = 16, ttl_seconds = 3600, grace_seconds = 60)
+    
+    series = get_series(stats_cache, stats_source)
+    
+    # Only the open tail is queried again, and nothing for a range that is closed
+    assert get_series(stats_cache, stats_source) == series
+    assert get_series(stats_cache, stats_source, time_max = datetime(2024, 1, 1, 12, 0, 0)) == series
+    
+    assert stats_source.fetched_from == [None, datetime(2024, 1, 2, 11, 0, 0)]
+    
+    stats = stats_cache.stats()
+    
+    assert (stats['misses'], stats['partial_hits'], stats['hits']) == (1, 1, 1)
+    
+    stats_cache.invalidate()
+    get_series(stats_cache, stats_source)
+    
+    assert stats_source.fetched_from[-1] is None
+
+def test_reprocessed_results_invalidate_their_buckets(database):
+    predictions = make_predictions(20)
+    database.add_records(predictions)
+    
+    stats_source = StatsSource(database)
+    stats_cache = StatsCache(
+        max_entries = 16, 
+        ttl_seconds = 3600, 
+        grace_seconds = 60, 
+        fetch_changes = stats_source.fetch_changes
+    )
+    
+    series = get_series(stats_cache, stats_source)
+    
+    # As scripts/reprocess_media.py would, from another process
+    reprocessed = predictions[5]
+    
+    database.update_prediction_results([
+        {
+            'query_id': reprocessed.query_id,
+            'num_humans': reprocessed.num_humans + 10,
+            'confidence_threshold': 0.5,
+            'inference_time': 1.0,
+            'model_version': 'retrained.pt',
+            'detections_min_confidence': 0.5,
+            'detections': []
+        }
+    ])
+    
+    reprocessed_series = get_series(stats_cache, stats_source)
+    
+    # From the start of the day of the reprocessed prediction
+    assert stats_source.fetched_from == [None, datetime(2024, 1, 1, 0, 0, 0)]
+    
+    assert sum(bucket[2] for bucket in reprocessed_series) == sum(bucket[2] for bucket in series) + 10
+    assert reprocessed_series == asyncio.run(stats_source.fetch_series(None))
+    
+    assert stats_cache.stats()['invalidated'] == 1
+    
+    # Nothing replaced since: the cache is trusted again
+    get_series(stats_cache, stats_source)
+    
+    assert stats_source.fetched_from[-1] == datetime(2024, 1, 2, 11, 0, 0)
+    assert stats_cache.stats()['invalidated'] == 1
@@ -0,0 +1,44 @@
+import numpy as np
+
+from source.core import nms, tile_starts
+
+from conftest import RectangleModel, make_detector, make_image
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    xyxys = np.array([
+        [0, 0, 100, 100],
+        [5, 5, 105, 105],
+        [200, 200, 300, 300],
+        [0, 0, 100, 40]
+    ], dtype = float)
+    
+    scores = np.array([0.6, 0.9, 0.5, 0.7])
+    
+    # The fourth box overlaps the first ones by less than the threshold
+    assert nms(xyxys, scores, iou_threshold = 0.5) == [1, 3, 2]
+    assert nms(np.zeros((0, 4)), np.zeros(0), iou_threshold = 0.5) == []
+
+def test_tiles_cover_the_image_with_the_same_shape():
+    assert tile_starts(500, 640, 512) == [0]
+    assert tile_starts(1400, 640, 512) == [0, 512, 760]
+
+def test_tiled_detections_are_merged_across_tiles(tmp_path):
+    model_file = tmp_path / 'best.pt'
+    model_file.write_bytes(b'weights')
+    
+    model = RectangleModel({1: 0.9, 2: 0.8})
+    detector = make_detector(model_file, model, tile_min_size = 1280)
+    
+    # One person across the edge of the first tile, whole in the second one, and one inside a single tile
+    image = make_image(1400, 700, {1: (600, 100, 700, 400), 2: (1000, 300, 1100, 600)})
+    
+    assert detector.inference_plan(1400, 700, mode = 'tiled') == ('tiled', 640)
+    
+    detections = detector.detect_batch([image], confidence_threshold = 0.5, mode = 'tiled')[0]
+    
+    # 3 x 2 tiles and the whole image, in one forward pass
+    assert model.calls == [(7, 640, 0.5)]
+    
+    assert sorted(detections.xyxys) == [[600, 100, 700, 400], [1000, 300, 1100, 600]]
+    assert sorted(detections.confidences) == [0.8, 0.9]
+    assert sorted(detections.xywhs) == [[650, 250, 100, 300], [1050, 450, 100, 300]]